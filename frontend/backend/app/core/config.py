@@ -26,6 +26,10 @@ class Settings(BaseSettings):
     POSTGRES_PORT: str
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
 
+    # 旅行プラン探索に使うワーカープロセス数（1 の場合はリクエストを処理するプロセス内で探索する）。
+    # 起動時にこの大きさのプールを作って全リクエストで共有し、1リクエストで使うワーカー数もこれを超えない
+    PLANNER_WORKERS: int = 1
+
     @field_validator("SQLALCHEMY_DATABASE_URI", mode="after")
     def assemble_db_connection(cls, v: Optional[str], values: ValidationInfo) -> Any:
         if isinstance(v, str):
@@ -1,8 +1,29 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from .routers import router
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.config import settings
+from optimization.city_store import CityDataUnavailable, load_city_store
+from optimization.parallel_search import shutdown_worker_pool, start_worker_pool
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 起動時に都市データを一度だけ読み込み、全リクエストで共有する
+    try:
+        load_city_store()
+    except CityDataUnavailable as e:
+        # 都市データがなくても他の API は使えるよう起動は続け、プランを作る API の呼び出し時に読み込み直す
+        logger.warning("%s（プランを作る API の呼び出し時に読み込み直します）", e)
+    if settings.PLANNER_WORKERS > 1:
+        start_worker_pool(settings.PLANNER_WORKERS)
+    yield
+    shutdown_worker_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # フロントエンドの両方の URL を許可する場合
 origins = ["http://localhost:5173", "http://127.0.0.1:5173", "http://localhost:8000/destinations/"]
@@ -1,15 +1,74 @@
 from fastapi import APIRouter, Depends, Request
 from sqlalchemy.orm import Session
 from app.dependencies import get_db
+from app.core.config import settings
 from datetime import datetime, timedelta
 from app.models import Destination
 from fastapi.responses import JSONResponse
+from optimization.city_store import CityDataUnavailable
+from optimization.plan_archive import DEFAULT_MIN_DISTANCE
+from optimization.plan_table import lookup_plan
+from optimization.replanning import replan_itenerary
+from optimization.search_control import DEFAULT_TIME_LIMIT
 from optimization.travel_planner_for_backend import plan_itenerary
 from fastapi.exceptions import HTTPException
+import math
 import requests
 
 router = APIRouter()
 
+
+def _numeric_option(request_data, key, default, cast):
+    """
+    リクエストの任意指定の数値オプションを cast（int / float）で取り出す。未指定（null を含む）なら default。
+    数値でない値（文字列・真偽値・NaN・無限大）や、整数のオプションに小数を渡した場合は 400 を返す。
+    """
+    value = request_data.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise HTTPException(status_code=400, detail=f"{key} には数値を指定してください。")
+    if cast is int and value != int(value):
+        raise HTTPException(status_code=400, detail=f"{key} には整数を指定してください。")
+    return cast(value)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _id_list_option(request_data, key):
+    """
+    リクエストの任意指定の整数のリスト（日の番号や目的地 ID）を取り出す。未指定（null を含む）なら空のリスト。
+    リストでない値や、0 以上の整数でない要素（文字列・真偽値・小数・負の数）を含む場合は 400 を返す。
+    """
+    values = request_data.get(key)
+    if values is None:
+        return []
+    if not isinstance(values, list) or not all(_is_int(value) and value >= 0 for value in values):
+        raise HTTPException(status_code=400, detail=f"{key} には 0 以上の整数のリストを指定してください。")
+    return values
+
+
+def _plan_route(request_data):
+    """
+    /api/replan に渡されたプラン（{"route": [...]}）の停留所のリストを取り出す。未指定（null を含む）なら空のリスト。
+    プランがオブジェクトでない場合や、停留所が整数の day と destination_id を持たない場合は 400 を返す。
+    """
+    plan = request_data.get("plan")
+    if plan is None:
+        return []
+    if not isinstance(plan, dict):
+        raise HTTPException(status_code=400, detail="plan には /api/optimize が返したプランを指定してください。")
+    route = plan.get("route")
+    if route is None:
+        return []
+    if not isinstance(route, list) or not all(
+            isinstance(stop, dict) and _is_int(stop.get("day")) and _is_int(stop.get("destination_id"))
+            for stop in route):
+        raise HTTPException(status_code=400, detail="plan の route の停留所には整数の day と destination_id が必要です。")
+    return route
+
 @router.get("/")
 def get_root():
     return {"message": "Hello World"}
@@ -26,6 +85,16 @@ async def optimize(request: Request):
     startDate = request_data.get("startDate")
     startTimes = request_data.get("startTimes")
     area = request_data.get("area")
+    # 探索時間（秒）は任意指定。未指定なら既定値、上限は MAX_TIME_LIMIT
+    timeLimit = _numeric_option(request_data, "timeLimit", DEFAULT_TIME_LIMIT, float)
+    # 乱数シードと反復数の上限も任意指定。両方そろえると同じプランが再現される
+    seed = _numeric_option(request_data, "seed", None, int)
+    maxIterations = _numeric_option(request_data, "maxIterations", None, int)
+    # 別案の数と、別案同士の違いの下限（訪問する観光地の Jaccard 距離、0〜1）も任意指定
+    alternatives = _numeric_option(request_data, "alternatives", 0, int)
+    minDistance = _numeric_option(request_data, "minDistance", DEFAULT_MIN_DISTANCE, float)
+    # 総費用・観光地数・移動時間の兼ね合いを選べるよう、パレート解を返す数も任意指定（0 で返さない）
+    pareto = _numeric_option(request_data, "pareto", 0, int)
     
     print(f"緯度：{latitude}")
     print(f"経度：{longitude}")
@@ -43,7 +112,53 @@ async def optimize(request: Request):
 
     startDate_iso_str = startDate_iso.isoformat()
 
-    result_json = plan_itenerary(area, budget, days, people, startDate_iso_str)
+    # 格子上の条件（よく使われる都市・日数・人数・予算帯・出発時刻）は事前計算したプランを返し、
+    # それ以外と、再現や別案を求めるオプションを指定したリクエストだけを探索する
+    result_json = None
+    try:
+        if seed is None and maxIterations is None and not alternatives and not pareto:
+            result_json = lookup_plan(area, budget, days, people, startDate_iso_str)
+        if result_json is None:
+            result_json = plan_itenerary(
+                area, budget, days, people, startDate_iso_str,
+                time_limit=timeLimit, workers=settings.PLANNER_WORKERS,
+                seed=seed, max_iterations=maxIterations,
+                alternatives=alternatives, min_distance=minDistance, pareto=pareto)
+    except CityDataUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return result_json
+
+
+@router.post("/api/replan")
+async def replan(request: Request):
+    request_data = await request.json()
+    people = request_data.get("people")
+    budget = request_data.get("budget")
+    days = request_data.get("days")
+    startDate = request_data.get("startDate")
+    startTimes = request_data.get("startTimes")
+    area = request_data.get("area")
+    # /api/optimize が返したプラン（{"route": [...]}）と、残す日（0 始まり）・残す目的地 ID
+    # （日数を超える日や見つからない目的地 ID は replan_itenerary の ValueError で 400 になる）
+    route = _plan_route(request_data)
+    lockedDays = _id_list_option(request_data, "lockedDays")
+    lockedStops = _id_list_option(request_data, "lockedStops")
+    timeLimit = _numeric_option(request_data, "timeLimit", DEFAULT_TIME_LIMIT, float)
+    seed = _numeric_option(request_data, "seed", None, int)
+
+    startDate_iso = datetime.strptime(startDate, "%Y-%m-%d")
+    startTimes_iso = datetime.strptime(startTimes, "%H:%M")
+    startDate_iso = startDate_iso.replace(hour=startTimes_iso.hour, minute=startTimes_iso.minute)
+
+    try:
+        result_json = replan_itenerary(
+            area, budget, days, people, startDate_iso.isoformat(), route,
+            locked_days=lockedDays, locked_stops=lockedStops, time_limit=timeLimit, seed=seed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CityDataUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
     return result_json
 
@@ -0,0 +1,282 @@
+import math
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from optimization.itinerary import NO_HOTEL, DayEvaluator, consecutive_stays, score_plan
+from optimization.plan_archive import PlanArchive
+from optimization.search_control import SearchController
+from optimization.travel_matrix import candidate_spots, node_mask
+
+MOVES = ("swap", "relocate", "insert", "remove", "change_hotel", "base_hotel")
+
+
+@dataclass(frozen=True)
+class AnnealingSchedule:
+    """
+    焼きなましの温度スケジュール。経過時間の割合 progress（0〜1）に応じて
+    initial_temperature から final_temperature まで指数的に下げる。
+    評価値は観光地1つで 10 変わるため、初期温度 10 は「1か所減る改悪」をそこそこの確率で受け入れる温度。
+    """
+    initial_temperature: float = 10.0
+    final_temperature: float = 0.1
+
+    def temperature(self, progress: float) -> float:
+        return self.initial_temperature * (self.final_temperature / self.initial_temperature) ** progress
+
+
+@dataclass
+class AnnealingResult:
+    routes: List[List[int]]
+    ends: List[int]
+    score: float
+    iterations: int
+    accepted: int
+
+
+class AnnealingState:
+    """
+    焼きなましの現在解。日ごとの評価値（停留所数, 総費用, 予算差引額）を保持し、
+    近傍は変更した日だけを DayEvaluator で再計算して差分評価する。
+
+    locked_days の日は変更せず、locked（ノードのビットマスク）に含まれる観光地・ホテルはプランから外さない。
+    近傍は固定されていない日（free_days）からだけ選ぶため、1回の近傍の手間は変更できる部分の大きさで決まる。
+    """
+
+    def __init__(
+        self,
+        evaluator: DayEvaluator,
+        routes: List[List[int]],
+        ends: List[int],
+        locked_days: Sequence[int] = (),
+        locked: int = 0,
+    ):
+        self.evaluator = evaluator
+        locked_days = set(locked_days)
+        self.free_days = [day for day in range(len(routes)) if day not in locked_days]
+        # ホテルを変えられるのは最終日以外
+        self.free_nights = [day for day in self.free_days if day < len(routes) - 1]
+        self.locked = locked
+        self.budget = evaluator.params.budget
+        self.routes = [list(route) for route in routes]
+        self.ends = list(ends)
+        self.day_values = [
+            evaluator.evaluate(route, end, day)
+            for day, (route, end) in enumerate(zip(self.routes, self.ends))
+        ]
+        # プランに入っている観光地のビットマスク
+        self.in_plan = node_mask(node for route in self.routes for node in route)
+        self.num_stops = sum(value[0] for value in self.day_values)
+        self.cost = sum(value[1] for value in self.day_values)
+        self.charge = sum(value[2] for value in self.day_values)
+        self.score = score_plan(self.num_stops, self.cost, self.budget)
+
+    def evaluate_changes(self, changes: Dict[int, Tuple[List[int], int]]):
+        """
+        変更後の日ごとの評価値と、変更後のプラン全体の (停留所数, 総費用, 予算差引額) を返す。
+        制約違反になる場合は None。
+        """
+        if self.locked:
+            before = node_mask(node for day in changes for node in self.routes[day])
+            after = node_mask(node for route, _ in changes.values() for node in route)
+            if before & ~after & self.locked:
+                return None
+        num_stops, cost, charge = self.num_stops, self.cost, self.charge
+        values = {}
+        for day, (route, end) in changes.items():
+            value = self.evaluator.evaluate(route, end, day)
+            if value is None:
+                return None
+            old = self.day_values[day]
+            num_stops += value[0] - old[0]
+            cost += value[1] - old[1]
+            charge += value[2] - old[2]
+            values[day] = value
+        # 初期解が予算超過の場合でも、超過を悪化させない近傍は許す
+        if charge > max(self.budget, self.charge):
+            return None
+        return values, num_stops, cost, charge
+
+    def apply(self, changes, values, num_stops, cost, charge) -> None:
+        for day, (route, end) in changes.items():
+            self.in_plan &= ~node_mask(self.routes[day])
+            self.routes[day] = route
+            self.ends[day] = end
+            self.day_values[day] = values[day]
+        for day in changes:
+            self.in_plan |= node_mask(self.routes[day])
+        self.num_stops, self.cost, self.charge = num_stops, cost, charge
+        self.score = score_plan(num_stops, cost, self.budget)
+
+
+def propose_move(state: AnnealingState, rng: random.Random) -> Optional[Dict[int, Tuple[List[int], int]]]:
+    """
+    ランダムな近傍（swap / relocate / insert / remove / change_hotel / base_hotel）を1つ作り、
+    変更する日ごとの (新しいルート, 新しい終点) を返す。作れない場合は None。
+    """
+    routes = state.routes
+    ends = state.ends
+    free_days = state.free_days
+    if not free_days:
+        return None
+    days = len(free_days)
+    move = MOVES[rng.randrange(len(MOVES))]
+
+    if move == "insert":
+        # 挿入位置の直前のノード（先頭なら大阪駅）の候補リストから観光地を選ぶ
+        day = free_days[rng.randrange(days)]
+        route = routes[day]
+        position = rng.randint(0, len(route))
+        candidates = candidate_spots(state.evaluator.matrices, route[position - 1] if position > 0 else 0)
+        if len(candidates) == 0:
+            return None
+        node = int(candidates[rng.randrange(len(candidates))])
+        if state.in_plan >> node & 1:
+            return None
+        return {day: (route[:position] + [node] + route[position:], ends[day])}
+
+    if move == "remove":
+        day = free_days[rng.randrange(days)]
+        route = routes[day]
+        if not route:
+            return None
+        position = rng.randrange(len(route))
+        return {day: (route[:position] + route[position + 1:], ends[day])}
+
+    if move == "swap":
+        day_a = free_days[rng.randrange(days)]
+        day_b = free_days[rng.randrange(days)]
+        if not routes[day_a] or not routes[day_b]:
+            return None
+        position_a = rng.randrange(len(routes[day_a]))
+        position_b = rng.randrange(len(routes[day_b]))
+        if day_a == day_b:
+            if position_a == position_b:
+                return None
+            route = list(routes[day_a])
+            route[position_a], route[position_b] = route[position_b], route[position_a]
+            return {day_a: (route, ends[day_a])}
+        route_a = list(routes[day_a])
+        route_b = list(routes[day_b])
+        route_a[position_a], route_b[position_b] = route_b[position_b], route_a[position_a]
+        return {day_a: (route_a, ends[day_a]), day_b: (route_b, ends[day_b])}
+
+    if move == "relocate":
+        day_a = free_days[rng.randrange(days)]
+        if not routes[day_a]:
+            return None
+        day_b = free_days[rng.randrange(days)]
+        position_a = rng.randrange(len(routes[day_a]))
+        route_a = list(routes[day_a])
+        node = route_a.pop(position_a)
+        if day_a == day_b:
+            position_b = rng.randint(0, len(route_a))
+            if position_b == position_a:
+                return None
+            route_a.insert(position_b, node)
+            return {day_a: (route_a, ends[day_a])}
+        route_b = list(routes[day_b])
+        route_b.insert(rng.randint(0, len(route_b)), node)
+        return {day_a: (route_a, ends[day_a]), day_b: (route_b, ends[day_b])}
+
+    free_nights = state.free_nights
+    if not free_nights:
+        return None
+    hotels = state.evaluator.matrices.hotel_indices
+    if len(hotels) == 0:
+        return None
+
+    if move == "base_hotel":
+        # 連続する数夜を、その全夜にチェックインできる1つのホテルでの連泊にまとめる
+        first = rng.randrange(len(free_nights))
+        last = rng.randrange(len(free_nights))
+        nights = free_nights[min(first, last):max(first, last) + 1]
+        if len(nights) < 2 or any(ends[day] != NO_HOTEL and state.locked >> ends[day] & 1 for day in nights):
+            return None
+        feasible = np.flatnonzero(np.logical_and.reduce(
+            [state.evaluator.feasible_hotels(routes[day], day) for day in nights]))
+        if len(feasible) == 0:
+            return None
+        hotel = int(hotels[feasible[rng.randrange(len(feasible))]])
+        new_ends = list(ends)
+        for day in nights:
+            new_ends[day] = hotel
+        if new_ends == ends or not consecutive_stays(new_ends):
+            return None
+        return {day: (routes[day], hotel) for day in nights}
+
+    # change_hotel: 最終日以外の1夜の宿泊先を変える（前後の夜と同じホテルなら連泊）
+    day = free_nights[rng.randrange(len(free_nights))]
+    hotel = int(hotels[rng.randrange(len(hotels))])
+    if hotel == ends[day]:
+        return None
+    if ends[day] != NO_HOTEL and state.locked >> ends[day] & 1:
+        return None
+    new_ends = list(ends)
+    new_ends[day] = hotel
+    if not consecutive_stays(new_ends):
+        return None
+    return {day: (routes[day], hotel)}
+
+
+def anneal(
+    evaluator: DayEvaluator,
+    routes: List[List[int]],
+    ends: List[int],
+    controller: SearchController,
+    schedule: AnnealingSchedule = AnnealingSchedule(),
+    rng: random.Random = random,
+    locked_days: Sequence[int] = (),
+    locked: int = 0,
+    archive: Optional[PlanArchive] = None,
+) -> AnnealingResult:
+    """
+    初期解（routes, ends）から焼きなましで評価値（score_plan）を最大化する。
+    locked_days / locked は AnnealingState と同じく、変更しない日とプランから外さないノード。
+    controller が打ち切りを指示するまで、近傍を作っては変更した日だけを再評価し、メトロポリス基準で受理する。
+    温度は呼び出し時点で残っていた予算（締め切りまでの時間、または反復数）の消化割合で下げる。
+    archive を渡すと、受理した解のうち予算内のものを archive に渡す（別案・パレート解の候補）。
+    """
+    state = AnnealingState(evaluator, routes, ends, locked_days, locked)
+    best_routes = [list(route) for route in state.routes]
+    best_ends = list(state.ends)
+    best_score = state.score
+    iterations = 0
+    accepted = 0
+    mark = controller.mark()
+    temperature = schedule.initial_temperature
+
+    while not controller.should_stop():
+        if iterations % 100 == 0:
+            temperature = schedule.temperature(controller.progress(mark))
+        iterations += 1
+
+        changes = propose_move(state, rng)
+        if changes is None:
+            continue
+        evaluated = state.evaluate_changes(changes)
+        if evaluated is None:
+            continue
+        values, num_stops, cost, charge = evaluated
+        delta = score_plan(num_stops, cost, state.budget) - state.score
+        if delta < 0 and rng.random() >= math.exp(delta / temperature):
+            continue
+        state.apply(changes, values, num_stops, cost, charge)
+        accepted += 1
+        if archive is not None and state.charge <= state.budget and archive.accepts(state.score):
+            archive.offer(evaluator, state.score, state.cost, state.routes, state.ends, state.in_plan)
+        if state.score > best_score and state.charge <= state.budget:
+            best_score = state.score
+            best_routes = [list(route) for route in state.routes]
+            best_ends = list(state.ends)
+            controller.record(best_score)
+
+    return AnnealingResult(
+        routes=best_routes,
+        ends=best_ends,
+        score=best_score,
+        iterations=iterations,
+        accepted=accepted,
+    )
@@ -0,0 +1,209 @@
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from optimization.itinerary import NO_HOTEL, DayEvaluator, FinishBounds, score_plan
+from optimization.plan_archive import PlanArchive
+from optimization.search_control import SearchController
+from optimization.travel_matrix import INF_TIME, candidate_spots, min_arrival
+
+DEFAULT_BEAM_WIDTH = 16
+# 1日を終えるときに枝分かれさせるホテルの数（運賃の安い順）
+HOTEL_BRANCHING = 3
+
+
+class _Step(NamedTuple):
+    """
+    部分プランの停留所を新しい順にたどる連結リスト。子の状態は親の _Step を共有するため、
+    状態を展開するたびにルートをコピーしなくてよい。node が end の場合はその日の終点（ホテル / 大阪駅 / NO_HOTEL）。
+    """
+    parent: Optional["_Step"]
+    day: int
+    node: int
+    end: bool
+
+
+class BeamState(NamedTuple):
+    day: int
+    current: int
+    current_time: int
+    # 訪問済みの観光地とチェックアウトしたホテルをノード index のビットで持つ
+    visited: int
+    # 前の夜のホテル（連泊できる）。泊まっていなければ NO_HOTEL
+    staying: int
+    num_stops: int
+    cost: int
+    charge: int
+    steps: Optional[_Step]
+    priority: float
+
+
+def _unwind(steps: Optional[_Step], days: int) -> Tuple[List[List[int]], List[int]]:
+    routes = [[] for _ in range(days)]
+    ends = [NO_HOTEL] * days
+    while steps is not None:
+        if steps.end:
+            ends[steps.day] = steps.node
+        else:
+            routes[steps.day].append(steps.node)
+        steps = steps.parent
+    for route in routes:
+        route.reverse()
+    return routes, ends
+
+
+class BeamConstructor:
+    """
+    部分プランを幅 width のビームで並行して伸ばす構築法。1ステップで各状態に停留所を1つ足し
+    （次の観光地、またはその日の終点）、優先度の高い width 個だけを残す。
+
+    優先度は「ここまでの評価値」に、残りの時間と予算で足せそうな観光地数 × 10 を加えたもの。
+    観光地1か所に要する時間と費用は、都市の観光地の平均滞在時間・最短の到着移動時間・観光費から見積もる。
+    """
+
+    def __init__(self, evaluator: DayEvaluator, width: int = DEFAULT_BEAM_WIDTH):
+        matrices = evaluator.matrices
+        self.evaluator = evaluator
+        self.matrices = matrices
+        self.params = evaluator.params
+        self.width = max(int(width), 1)
+        self.time = evaluator.time
+        self.fare = evaluator.fare
+        self.visit_fare = evaluator.visit_fare
+        self.staytime = evaluator.staytime
+        self.earliest = evaluator.earliest
+        self.latest = evaluator.latest
+        self.nearest_hotel_time = matrices.hotel_order_time[:, 0].tolist() if len(matrices.hotel_indices) else None
+        self.candidates = [candidate_spots(matrices, node).tolist() for node in range(matrices.size)]
+        self.hotels = matrices.hotel_indices.tolist()
+        self.bounds = FinishBounds(matrices, self.params)
+
+        spots = matrices.spot_indices
+        if len(spots):
+            min_time, min_fare = min_arrival(matrices)
+            self.step_time = max(float(matrices.staytime[spots].mean() + min_time[spots].mean()), 1.0)
+            self.step_charge = max(float((matrices.visit_fare[spots] + min_fare[spots]).mean()) * self.params.people, 1.0)
+        else:
+            self.step_time = self.step_charge = 1.0
+
+    def _priority(self, day: int, current_time: int, num_stops: int, cost: int, charge: int) -> float:
+        params = self.params
+        remaining_time = max(params.sightseeing_end_time - current_time, 0) + \
+            (params.days - 1 - day) * params.sightseeing_end_time
+        slots = min(remaining_time / self.step_time, max(params.budget - charge, 0) / self.step_charge)
+        return score_plan(num_stops, cost, params.budget) + slots * 10
+
+    def _state(self, state: BeamState, day: int, current: int, current_time: int, visited: int, staying: int,
+               stops: int, cost: int, charge: int, steps: _Step) -> BeamState:
+        num_stops = state.num_stops + stops
+        return BeamState(
+            day, current, current_time, visited, staying, num_stops, cost, charge, steps,
+            self._priority(day, current_time, num_stops, cost, charge))
+
+    def _expand(self, state: BeamState):
+        params = self.params
+        time, fare, visit_fare, staytime = self.time, self.fare, self.visit_fare, self.staytime
+        people = params.people
+        current, current_time = state.current, state.current_time
+        final_day = state.day == params.days - 1
+        bounds = self.bounds
+        with_hotel = bounds.with_hotel(state.day, current, params.budget - state.charge)
+        earliest = self.earliest[state.day]
+        latest = self.latest[state.day]
+
+        # 次の観光地（現在地の候補リストから）。旅程を終える額を残せない観光地は足さない
+        for node in self.candidates[current]:
+            if state.visited >> node & 1:
+                continue
+            arrival = current_time + time[current][node]
+            # 営業時間外に着く（か、閉店までに滞在を終えられない）観光地は足さない
+            if arrival >= params.sightseeing_end_time or arrival < earliest[node] or arrival > latest[node]:
+                continue
+            departure = arrival + staytime[node]
+            if final_day:
+                if time[node][0] >= INF_TIME:
+                    continue
+            elif self.nearest_hotel_time is not None and departure + self.nearest_hotel_time[node] > params.day_total_time:
+                continue
+            spot_cost = (fare[current][node] + visit_fare[node]) * people
+            charge = state.charge + spot_cost
+            if charge + bounds.reserve(state.day, node, with_hotel) > params.budget:
+                continue
+            yield self._state(
+                state, state.day, node, departure, state.visited | (1 << node), state.staying, 1,
+                state.cost + spot_cost, charge, _Step(state.steps, state.day, node, False))
+
+        # その日を終える
+        if final_day:
+            if time[current][0] < INF_TIME and state.charge + fare[current][0] <= params.budget:
+                yield self._state(
+                    state, params.days, 0, 0, state.visited, NO_HOTEL, 1,
+                    state.cost + fare[current][0], state.charge + fare[current][0],
+                    _Step(state.steps, state.day, 0, True))
+            return
+        # 泊まれるホテルの判定は現在地からの hotel_reach の行でまとめて行い、
+        # チェックアウト済み（連泊を除く）かどうかだけを条件を満たしたホテルについて見る
+        matrices = self.matrices
+        hotel_time, hotel_fare = matrices.hotel_reach(current)
+        arrival = current_time + hotel_time
+        charges = state.charge + hotel_fare * people
+        # 泊まった後も、残りの夜と最終日のための額を残せるホテルに限る
+        charges += bounds.after_tonight(state.day, False)
+        feasible = np.flatnonzero(
+            (arrival >= params.sightseeing_end_time) & (arrival <= params.day_total_time) & (charges <= params.budget))
+        staying = state.staying
+        checked_out = state.visited if staying == NO_HOTEL else state.visited | (1 << staying)
+        hotels = []
+        for k in feasible.tolist():
+            hotel = self.hotels[k]
+            if hotel != staying and state.visited >> hotel & 1:
+                continue
+            hotel_cost = fare[current][hotel] + visit_fare[hotel]
+            hotels.append((fare[current][hotel], hotel, hotel_cost))
+        hotels.sort()
+        for _, hotel, hotel_cost in hotels[:HOTEL_BRANCHING]:
+            yield self._state(
+                state, state.day + 1, 0, 0, state.visited if hotel == staying else checked_out, hotel, 1,
+                state.cost + hotel_cost, state.charge + hotel_cost * people,
+                _Step(state.steps, state.day, hotel, True))
+        if not hotels:
+            yield self._state(
+                state, state.day + 1, 0, 0, checked_out, NO_HOTEL, 0, state.cost, state.charge,
+                _Step(state.steps, state.day, NO_HOTEL, True))
+
+    def construct(
+        self, controller: SearchController, archive: Optional[PlanArchive] = None
+    ) -> Optional[Tuple[List[List[int]], List[int], int, int]]:
+        """
+        最も評価値の高い完成プランの (日ごとのルート, 各日の終点, 停留所数, 総費用) を返す。
+        最終日に大阪駅へ戻れるプランが1つもない場合は None。
+        archive を渡すと、途中で完成したプランも archive に渡す。
+        """
+        params = self.params
+        # 初日の出発（大阪駅）も停留所に数える
+        beam = [BeamState(0, 0, 0, 0, NO_HOTEL, 1, 0, 0, None, 0.0)]
+        best = None
+        while beam:
+            if controller.should_stop():
+                break
+            children = {}
+            for state in beam:
+                for child in self._expand(state):
+                    if child.day == params.days:
+                        score = score_plan(child.num_stops, child.cost, params.budget)
+                        if archive is not None and archive.accepts(score):
+                            archive.offer(self.evaluator, score, child.cost, *_unwind(child.steps, params.days))
+                        if best is None or score > best[0]:
+                            best = (score, child)
+                            controller.record(score)
+                        continue
+                    # 同じ日・同じ現在地・同じ訪問済み集合・同じ連泊できるホテルの状態は、優先度の高い方だけ残す
+                    key = (child.day, child.current, child.visited, child.staying)
+                    if key not in children or child.priority > children[key].priority:
+                        children[key] = child
+            beam = sorted(children.values(), key=lambda state: state.priority, reverse=True)[:self.width]
+        if best is None:
+            return None
+        state = best[1]
+        routes, ends = _unwind(state.steps, params.days)
+        return routes, ends, state.num_stops, state.cost
@@ -0,0 +1,338 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import fields
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from optimization import get_optimal_travel
+from optimization.city_store import DATA_DIRECTORY, CityGraph, build_city_graph, build_city_store, load_city_store, load_data
+from optimization.itinerary import PlanParams, Stop, build_plan_params, score_plan
+from optimization.search_control import DEFAULT_STAGNATION_TIME, DEFAULT_TIME_LIMIT, SearchLimits
+from optimization.travel_matrix import TravelMatrices
+from optimization.travel_planner_for_backend import (
+    OPTIMIZERS,
+    construct_itinerary,
+    plan_itenerary,
+    search_plan,
+)
+
+BENCHMARK_VERSION = 2
+
+# 合成都市のノード数（大阪駅を除く）。実データの都市は 100 ノード前後
+SYNTHETIC_SIZES = (100, 500, 2000, 5000)
+# 合成都市のホテルの割合
+SYNTHETIC_HOTEL_RATIO = 0.15
+# 合成都市の移動データは、各ノードから近い順にこの数のノードへの分だけ作る（全組を作ると 5000 ノードで 2500 万件になる）
+SYNTHETIC_NEIGHBORS = 100
+# 合成都市の広さ（km 四方）と、大阪駅から都市の中心までの距離（km）
+SYNTHETIC_AREA_KM = 30.0
+SYNTHETIC_OSAKA_KM = 50.0
+
+# 計測するリクエストの既定値
+BENCHMARK_BUDGET = 50000
+BENCHMARK_DAYS = 2
+BENCHMARK_PEOPLE = 2
+BENCHMARK_START = "2025-03-10T09:00:00"
+BENCHMARK_SEED = 1
+
+
+def _timed(function: Callable[[], Any], repeat: int) -> Tuple[Any, Dict[str, float]]:
+    """
+    function を repeat 回呼び出し、最後の戻り値と経過時間（秒）の最小値・中央値を返す。
+    """
+    seconds = []
+    result = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return result, {"min": round(min(seconds), 6), "median": round(statistics.median(seconds), 6)}
+
+
+def _megabytes(size: int) -> float:
+    return round(size / (1 << 20), 1)
+
+
+def _memory(build: Callable[[], CityGraph]) -> Dict[str, float]:
+    """
+    build を tracemalloc の下で1回呼び出し、作った TravelMatrices の配列の合計サイズと、構築中に確保したメモリの最大値（MB）を返す。
+    tracemalloc は numpy の配列の確保も数える。所要時間の計測とは別に呼び出す（計測中は遅くなるため）。
+    """
+    tracemalloc.start()
+    try:
+        graph = build()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    matrices = graph.matrices
+    size = sum(getattr(matrices, field.name).nbytes for field in fields(TravelMatrices) if field.name != "methods")
+    return {"matrices_mb": _megabytes(size), "build_peak_mb": _megabytes(peak)}
+
+
+def _quality(num_stops: int, spots: Optional[int], total_cost: int, budget: int, feasible: bool) -> Dict[str, Any]:
+    return {
+        "feasible": feasible,
+        "score": round(score_plan(num_stops, total_cost, budget), 3) if feasible else None,
+        "stops": num_stops,
+        "spots": spots,
+        "total_cost": total_cost,
+        "budget_use": round(total_cost / budget, 4),
+    }
+
+
+def stops_quality(graph: CityGraph, stops: Optional[List[List[Stop]]], params: PlanParams) -> Dict[str, Any]:
+    """
+    停留所リスト形式のプランの評価値・停留所数・観光地数・総費用・予算の消化率。
+    最終日に大阪駅へ戻っていないプランは feasible が False（評価値は None）。
+    """
+    stops = stops or []
+    flat = [stop for day_plan in stops for stop in day_plan]
+    is_spot = graph.matrices.is_spot
+    feasible = len(stops) == params.days and bool(flat) and flat[-1].destination_id == 0
+    return _quality(
+        len(flat), sum(1 for stop in flat if is_spot[stop.destination_id]),
+        sum(stop.total_cost for stop in flat), params.budget, feasible)
+
+
+def route_quality(graph: CityGraph, itinerary_json: str, budget: int) -> Dict[str, Any]:
+    """
+    plan_itenerary の出力（JSON 文字列）の route から stops_quality と同じ項目を求める。
+    目的地 ID のない出力（get_optimal_travel）では、観光地かどうかを名称で判定する。
+    """
+    route = (json.loads(itinerary_json) or {}).get("route", [])
+    hotel_names = {dest.get("japanese_name", dest.get("name")) for dest in graph.destinations if dest.get("ishotel")}
+    spots = 0
+    for stop in route:
+        if "destination_id" in stop:
+            dest = graph.destination(stop["destination_id"])
+            spots += stop["destination_id"] != 0 and not dest.get("ishotel")
+        else:
+            spots += stop["name"] not in hotel_names and stop["name"] != "大阪駅"
+    feasible = bool(route) and route[-1]["name"] == "大阪駅"
+    return _quality(len(route), spots, sum(stop.get("total_cost", 0) for stop in route), budget, feasible)
+
+
+def synthetic_city_data(
+    size: int, seed: int, neighbors: int = SYNTHETIC_NEIGHBORS, first_id: int = 1
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    size ノードの合成都市を、combined_with_info.json / transportation_costs.json / Osaka_to_all_spots.json と
+    同じ形式の (施設のリスト, 移動データ, 大阪駅からの移動データ) で作る。
+    ノードは SYNTHETIC_AREA_KM 四方に一様に置き、移動時間と運賃は距離にばらつきを掛けて決める。
+    移動データは各ノードから近い neighbors ノードへの分だけ作る（それ以外のノード間は移動できない）。
+    """
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0.0, SYNTHETIC_AREA_KM, size=(size, 2))
+    ishotel = rng.random(size) < SYNTHETIC_HOTEL_RATIO
+    ids = list(range(first_id, first_id + size))
+    destinations = []
+    for k, dest_id in enumerate(ids):
+        hotel = bool(ishotel[k])
+        destinations.append({
+            "name": f"synthetic-{dest_id}",
+            "location": {"lat": 34.0 + points[k, 0] / 111.0, "lng": 135.0 + points[k, 1] / 91.0},
+            "fare": int(rng.integers(6, 21)) * 1000 if hotel else int(rng.choice((0, 0, 300, 500, 1000, 2000))),
+            "staytime": 660 if hotel else int(rng.choice((30, 60, 90, 120))),
+            "id": dest_id,
+            "ishotel": hotel,
+        })
+
+    records = []
+    count = max(min(neighbors, size - 1), 1)
+    # 距離行列を一度に作ると 5000 ノードで 200MB になるため、行をまとめて処理する
+    for block in range(0, size, 512):
+        rows = points[block:block + 512]
+        distance = np.sqrt(((rows[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+        distance[np.arange(len(rows)), np.arange(block, block + len(rows))] = np.inf
+        nearest = np.argpartition(distance, count - 1, axis=1)[:, :count]
+        for offset, targets in enumerate(nearest):
+            km = distance[offset, targets] * rng.uniform(1.1, 1.6, size=count)
+            walk = km < 1.5
+            minutes = np.where(walk, km * 15, 10 + km * 3).astype(int) + 1
+            fares = np.where(walk, 0, 150 + km * 25).astype(int)
+            start_id = ids[block + offset]
+            for target, minute, fare, on_foot in zip(targets.tolist(), minutes.tolist(), fares.tolist(), walk.tolist()):
+                records.append({
+                    "start_destination_id": start_id,
+                    "end_destination_id": ids[target],
+                    "transportation_fare": fare,
+                    "transportation_method": "徒歩" if on_foot else "電車",
+                    "transportation_time": minute,
+                })
+
+    osaka_km = SYNTHETIC_OSAKA_KM + np.sqrt(((points - SYNTHETIC_AREA_KM / 2) ** 2).sum(axis=1))
+    osaka_records = [
+        {
+            "start_destination_id": 0,
+            "end_destination_id": dest_id,
+            "transportation_fare": int(500 + km * 30),
+            "transportation_method": "電車",
+            "transportation_time": int(20 + km * 1.2),
+        }
+        for dest_id, km in zip(ids, osaka_km.tolist())
+    ]
+    return destinations, records, osaka_records
+
+
+def benchmark_city(
+    suite: str,
+    graph: CityGraph,
+    params: PlanParams,
+    args: argparse.Namespace,
+    lookup_seconds: Dict[str, float],
+    memory: Dict[str, float],
+) -> List[Dict[str, Any]]:
+    """
+    1都市について、貪欲法による1回の構築と探索全体（search_plan）の所要時間とプランの質を計測する。
+    実データの都市（suite が "city"）は、リクエスト全体（plan_itenerary）と従来の get_optimal_travel も計測する。
+    memory は都市グラフの構築で計測したメモリ（_memory を参照）で、"lookup" の結果に入れる。
+    """
+    matrices = graph.matrices
+    entry = {"suite": suite, "city": graph.city, "nodes": matrices.size}
+    results = [dict(entry, stage="lookup", seconds=lookup_seconds, memory=memory)]
+
+    stops, seconds = _timed(
+        lambda: construct_itinerary(matrices, params, random.Random(args.seed))[0], args.repeat)
+    results.append(dict(entry, stage="greedy", seconds=seconds, quality=stops_quality(graph, stops, params)))
+
+    limits = SearchLimits(time_limit=args.time_limit, max_iterations=args.max_iterations,
+                          stagnation_time=None if args.max_iterations is not None else DEFAULT_STAGNATION_TIME)
+    (stops, _, report), seconds = _timed(
+        lambda: search_plan(matrices, params, args.optimizer, limits, random.Random(args.seed)), args.repeat)
+    results.append(dict(entry, stage="search", seconds=seconds, quality=stops_quality(graph, stops, params),
+                        search=report))
+    if suite != "city":
+        return results
+
+    request = (graph.city, params.budget, params.days, params.people, args.start)
+    output, seconds = _timed(
+        lambda: plan_itenerary(*request, optimizer=args.optimizer, time_limit=args.time_limit, seed=args.seed,
+                               max_iterations=args.max_iterations), args.repeat)
+    results.append(dict(entry, stage="request", seconds=seconds, quality=route_quality(graph, output, params.budget),
+                        search=json.loads(output).get("search") if output != "null" else None))
+    if args.legacy:
+        # get_optimal_travel は呼び出しのたびに JSON を読み込むため、この計測にはデータの読み込みも含まれる
+        output, seconds = _timed(lambda: get_optimal_travel.plan_itenerary(*request), args.repeat)
+        results.append(dict(entry, stage="legacy", seconds=seconds, quality=route_quality(graph, output, params.budget)))
+    return results
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    params = build_plan_params(args.budget, args.days, args.people, args.start)
+    results = []
+
+    if args.cities != []:
+        data, seconds = _timed(lambda: load_data(args.data), args.repeat)
+        results.append({"suite": "city", "city": None, "nodes": None, "stage": "load", "seconds": seconds})
+        tourist_data, transportation_data, osaka_transportation_data = data
+        # リクエスト全体（plan_itenerary）の計測は、プロセスで共有する CityStore を使う
+        store = load_city_store(args.data)
+        get_optimal_travel.DATA_DIRECTORY = args.data
+        _, seconds = _timed(lambda: build_city_store(*data), args.repeat)
+        results.append({"suite": "city", "city": None, "nodes": None, "stage": "lookup", "seconds": seconds})
+        for city in args.cities or store.cities:
+            city_ids = {dest["id"] for dest in tourist_data[city]}
+            records = [record for record in transportation_data if record.get("start_destination_id") in city_ids]
+            build = partial(build_city_graph, city, tourist_data[city], records, osaka_transportation_data)
+            _, seconds = _timed(build, args.repeat)
+            results.extend(benchmark_city("city", store.get(city), params, args, seconds, _memory(build)))
+            print(f"{city}: done", file=sys.stderr)
+
+    for size in args.synthetic:
+        destinations, records, osaka_records = synthetic_city_data(size, args.seed, args.neighbors)
+        build = partial(build_city_graph, f"synthetic-{size}", destinations, records, osaka_records)
+        graph, seconds = _timed(build, args.repeat)
+        results.extend(benchmark_city("synthetic", graph, params, args, seconds, _memory(build)))
+        print(f"synthetic-{size}: done", file=sys.stderr)
+
+    return {
+        "version": BENCHMARK_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        # プロセス全体の最大常駐メモリ（MB、Linux の ru_maxrss は KB 単位）。都市ごとには分けられないため、
+        # 1つの都市の値が欲しいときは --cities（値なし）--synthetic 5000 のようにその都市だけで実行する
+        "peak_rss_mb": _megabytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024),
+        "config": {
+            "budget": args.budget, "days": args.days, "people": args.people, "start": args.start,
+            "optimizer": args.optimizer, "time_limit": args.time_limit, "max_iterations": args.max_iterations,
+            "seed": args.seed, "repeat": args.repeat, "neighbors": args.neighbors,
+        },
+        "results": results,
+    }
+
+
+def _result_key(result: Dict[str, Any]) -> Tuple[Any, ...]:
+    return result["suite"], result["city"], result["stage"]
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    同じ (suite, city, stage) の計測どうしで、所要時間（中央値）の比と評価値の差を求める。
+    比が 1 より大きければ遅くなり、評価値の差が負なら悪くなっている。
+    """
+    before = {_result_key(result): result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = before.get(_result_key(result))
+        if old is None:
+            continue
+        row = {"suite": result["suite"], "city": result["city"], "stage": result["stage"],
+               "time_ratio": round(result["seconds"]["median"] / max(old["seconds"]["median"], 1e-9), 3)}
+        score, old_score = (result.get("quality") or {}).get("score"), (old.get("quality") or {}).get("score")
+        if score is not None and old_score is not None:
+            row["score_delta"] = round(score - old_score, 3)
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="旅行プラン作成の所要時間とプランの質を計測する")
+    parser.add_argument("--data", default=DATA_DIRECTORY)
+    parser.add_argument("--cities", nargs="*", default=None,
+                        help="計測する実データの都市（省略で全都市、値なしで実データを計測しない）")
+    parser.add_argument("--synthetic", nargs="*", type=int, default=list(SYNTHETIC_SIZES),
+                        help="合成都市のノード数（値なしで合成都市を計測しない）")
+    parser.add_argument("--neighbors", type=int, default=SYNTHETIC_NEIGHBORS)
+    parser.add_argument("--budget", type=int, default=BENCHMARK_BUDGET)
+    parser.add_argument("--days", type=int, default=BENCHMARK_DAYS)
+    parser.add_argument("--people", type=int, default=BENCHMARK_PEOPLE)
+    parser.add_argument("--start", default=BENCHMARK_START)
+    parser.add_argument("--optimizer", choices=OPTIMIZERS, default="annealing")
+    parser.add_argument("--time-limit", type=float, default=DEFAULT_TIME_LIMIT)
+    parser.add_argument("--max-iterations", type=int, default=None,
+                        help="指定すると反復数で打ち切り、同じシードから同じプランを作る（回帰比較向け）")
+    parser.add_argument("--seed", type=int, default=BENCHMARK_SEED)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-legacy", dest="legacy", action="store_false", help="get_optimal_travel を計測しない")
+    parser.add_argument("--output", default=None, help="結果の JSON の書き出し先（省略で標準出力）")
+    parser.add_argument("--baseline", default=None, help="比較する以前の結果の JSON")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            result["comparison"] = compare_results(json.load(f), result)
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
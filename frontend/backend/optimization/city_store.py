@@ -0,0 +1,230 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from optimization.travel_matrix import (
+    DENSE_MAX_NODES,
+    SPARSE_MAX_TRAVEL_TIME,
+    TravelMatrices,
+    build_sparse_travel_matrices,
+    build_travel_matrices,
+)
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# 大阪駅の情報（ID:0）。全都市で共通の出発・到着地点
+OSAKA_STATION_ID = 0
+OSAKA_STATION = MappingProxyType({
+    "id": OSAKA_STATION_ID,
+    "name": "大阪駅",
+    "location": MappingProxyType({"lat": 34.702485, "lng": 135.495951}),
+    "fare": 0,
+    "staytime": 0,
+    "ishotel": False,
+})
+
+
+def load_data(data_directory: str = DATA_DIRECTORY):
+    with open(f"{data_directory}/combined_with_info.json", "r", encoding="utf-8") as f:
+        tourist_data = json.load(f)
+    with open(f"{data_directory}/transportation_costs.json", "r", encoding="utf-8") as f:
+        transportation_data = json.load(f)
+    with open(f"{data_directory}/Osaka_to_all_spots.json", "r", encoding="utf-8") as f:
+        osaka_transportation_data = json.load(f)
+    return tourist_data, transportation_data, osaka_transportation_data
+
+
+def build_transportation_lookup(transportation_data, valid_ids):
+    trans_lookup = {}
+    for record in transportation_data:
+        start = record.get("start_destination_id")
+        end = record.get("end_destination_id")
+        if start in valid_ids and end in valid_ids:
+            trans_lookup[(start, end)] = record
+    return trans_lookup
+
+
+def extract_osaka_records(osaka_transportation_data):
+    """
+    Osaka_to_all_spots.json のデータ形式がリストの場合はそのまま、
+    辞書の場合は値（リスト）をすべて結合して返す。
+    """
+    if isinstance(osaka_transportation_data, dict):
+        records = []
+        for key, value in osaka_transportation_data.items():
+            if isinstance(value, list):
+                records.extend(value)
+            else:
+                records.append(value)
+        return records
+    return osaka_transportation_data
+
+
+def build_osaka_transportation_lookup(osaka_transportation_data, valid_ids):
+    osaka_lookup = {}
+    records = extract_osaka_records(osaka_transportation_data)
+    for record in records:
+        start = record.get("start_destination_id")
+        end = record.get("end_destination_id")
+        try:
+            start = int(start)
+            end = int(end)
+        except:
+            continue
+        if start == 0 and end in valid_ids:
+            osaka_lookup[(start, end)] = record
+    return osaka_lookup
+
+
+def build_osaka_return_lookup(osaka_transportation_data, valid_ids):
+    """
+    大阪への帰り用の移動情報を作成する。元データは大阪→観光地の情報なので、キーを反転して (観光地, 0) とする。
+    """
+    osaka_return = {}
+    # 簡易的な実装（データがリストの場合を想定）
+    records = extract_osaka_records(osaka_transportation_data)
+    for record in records:
+        start = record.get("start_destination_id")
+        end = record.get("end_destination_id")
+        try:
+            start = int(start)
+            end = int(end)
+        except:
+            continue
+        if start == 0 and end in valid_ids:
+            osaka_return[(end, 0)] = record
+    return osaka_return
+
+
+@dataclass(frozen=True)
+class CityGraph:
+    """
+    1都市分の観光地・ホテル・移動情報をまとめた読み取り専用のグラフ。
+    プロセス内の全リクエスト・全スレッドで共有されるため、生成後に変更してはならない。
+
+    ids[0] は常に大阪駅（ID:0）で、以降は combined_with_info.json の並び順。
+    ノード数が DENSE_MAX_NODES を超える都市は、移動データを辞書ルックアップにも密行列にもせず
+    CSR だけの TravelMatrices にする（build_sparse_travel_matrices）。その場合 trans_lookup などのルックアップは空。
+    """
+    city: str
+    destinations: Tuple[Mapping[str, Any], ...]
+    dest_by_id: Mapping[int, Mapping[str, Any]]
+    ids: Tuple[int, ...]
+    index_of: Mapping[int, int]
+    spot_ids: Tuple[int, ...]
+    hotel_ids: Tuple[int, ...]
+    trans_lookup: Mapping[Tuple[int, int], Mapping[str, Any]]
+    osaka_lookup: Mapping[Tuple[int, int], Mapping[str, Any]]
+    osaka_return_lookup: Mapping[Tuple[int, int], Mapping[str, Any]]
+    matrices: TravelMatrices
+
+    def destination(self, dest_id: int) -> Mapping[str, Any]:
+        """
+        ID から施設情報を返す（ID:0 は大阪駅）。
+        """
+        if dest_id == OSAKA_STATION_ID:
+            return OSAKA_STATION
+        return self.dest_by_id.get(dest_id, {})
+
+
+def build_city_graph(
+    city: str,
+    destinations: List[Dict[str, Any]],
+    transportation_records: List[Dict[str, Any]],
+    osaka_transportation_data,
+    max_travel_time: Optional[int] = SPARSE_MAX_TRAVEL_TIME,
+) -> CityGraph:
+    """
+    max_travel_time: CSR だけで持つ大きな都市で、ノード間の移動を持つ移動時間の上限（分、None で上限なし）
+    """
+    dest_by_id = {dest["id"]: dest for dest in destinations}
+    valid_ids = set(dest_by_id.keys())
+    ids = (OSAKA_STATION_ID,) + tuple(dest["id"] for dest in destinations)
+    if len(ids) > DENSE_MAX_NODES:
+        trans_lookup, osaka_lookup, osaka_return_lookup = {}, {}, {}
+        matrices = build_sparse_travel_matrices(
+            ids, dest_by_id, transportation_records, extract_osaka_records(osaka_transportation_data), max_travel_time)
+    else:
+        trans_lookup = build_transportation_lookup(transportation_records, valid_ids)
+        osaka_lookup = build_osaka_transportation_lookup(osaka_transportation_data, valid_ids)
+        osaka_return_lookup = build_osaka_return_lookup(osaka_transportation_data, valid_ids)
+        matrices = build_travel_matrices(ids, dest_by_id, trans_lookup, osaka_lookup, osaka_return_lookup)
+    return CityGraph(
+        city=city,
+        destinations=tuple(destinations),
+        dest_by_id=MappingProxyType(dest_by_id),
+        ids=ids,
+        index_of=MappingProxyType({dest_id: index for index, dest_id in enumerate(ids)}),
+        spot_ids=tuple(dest["id"] for dest in destinations if not dest.get("ishotel")),
+        hotel_ids=tuple(dest["id"] for dest in destinations if dest.get("ishotel")),
+        trans_lookup=MappingProxyType(trans_lookup),
+        osaka_lookup=MappingProxyType(osaka_lookup),
+        osaka_return_lookup=MappingProxyType(osaka_return_lookup),
+        matrices=matrices,
+    )
+
+
+class CityDataUnavailable(RuntimeError):
+    """
+    都市データ（data ディレクトリの JSON）がない・壊れているため、CityStore を作れない。
+    アプリはこれで起動を止めず、プランを作る API だけが 503 を返す（次の呼び出しで読み込み直す）。
+    """
+
+
+class CityStore:
+    """
+    全都市の CityGraph を保持するストア。load_city_store() で一度だけ生成される。
+    """
+
+    def __init__(self, graphs: Dict[str, CityGraph]):
+        self._graphs = MappingProxyType(dict(graphs))
+
+    @property
+    def cities(self) -> Tuple[str, ...]:
+        return tuple(self._graphs.keys())
+
+    def get(self, city: str) -> CityGraph:
+        if city not in self._graphs:
+            raise ValueError(f"{city} のデータが見つかりません。")
+        return self._graphs[city]
+
+
+def build_city_store(tourist_data, transportation_data, osaka_transportation_data) -> CityStore:
+    # 移動データは全都市分が1つのリストに入っているため、一度の走査で都市ごとに振り分ける
+    city_of = {dest["id"]: city for city, destinations in tourist_data.items() for dest in destinations}
+    records_by_city: Dict[str, List[Dict[str, Any]]] = {city: [] for city in tourist_data}
+    for record in transportation_data:
+        city = city_of.get(record.get("start_destination_id"))
+        if city is not None:
+            records_by_city[city].append(record)
+    return CityStore({
+        city: build_city_graph(city, destinations, records_by_city[city], osaka_transportation_data)
+        for city, destinations in tourist_data.items()
+    })
+
+
+_city_store: Optional[CityStore] = None
+_city_store_lock = threading.Lock()
+
+
+def load_city_store(data_directory: str = DATA_DIRECTORY) -> CityStore:
+    """
+    プロセス全体で共有する CityStore を返す。初回呼び出し時のみ JSON を読み込む。
+    読み込めなければ CityDataUnavailable を送出し、次の呼び出しで読み込み直す。
+    """
+    global _city_store
+    if _city_store is None:
+        with _city_store_lock:
+            if _city_store is None:
+                try:
+                    _city_store = build_city_store(*load_data(data_directory))
+                except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                    raise CityDataUnavailable(f"都市データを読み込めません: {e}") from e
+    return _city_store
+
+
+def get_city_graph(city: str) -> CityGraph:
+    return load_city_store().get(city)
@@ -0,0 +1,160 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from optimization.itinerary import DayEvaluator, score_plan
+from optimization.search_control import STOP_OPTIMAL, SearchController
+from optimization.travel_matrix import INF_CHARGE, INF_TIME, spot_path_costs
+
+# 候補の観光地がこの数以下なら厳密解を求める
+EXACT_MAX_CANDIDATES = 20
+# 厳密解の探索で展開するノード数の上限。超えたら最適性を示せないため、ヒューリスティックに任せる
+EXACT_NODE_LIMIT = 100000
+
+
+def day_trip_bounds(evaluator: DayEvaluator) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    日帰りプランの枝刈りに使う下界を全ノード分まとめて返す。
+    (大阪駅から観光地をたどって着く最早の到着時刻, そこまでの予算差引額の最小値, そこから観光地をたどって大阪駅に帰るまでの額の最小値)。
+    どれも時刻や営業時間を無視した緩和（spot_path_costs）なので、直接の移動より安い・速い回り道があっても候補を取りこぼさない。
+    """
+    matrices = evaluator.matrices
+    people = evaluator.params.people
+    staytime = matrices.staytime[matrices.edge_end]
+    step_charge = (matrices.edge_fare.astype(np.int64) + matrices.visit_fare[matrices.edge_end]) * people
+    # 時刻は観光地を出る時刻でたどる（着いた観光地の滞在時間を足す）
+    step_time = matrices.edge_time.astype(np.int64) + staytime
+    to_go = spot_path_costs(matrices, step_charge, matrices.return_fare, backward=True)
+    # 大阪駅から直接着く場合を初期値にする
+    first = slice(matrices.edge_start[0], matrices.edge_start[1])
+    direct = matrices.edge_time[first] < INF_TIME
+    ends = matrices.edge_end[first][direct]
+    departure = np.full(matrices.size, INF_CHARGE, dtype=np.int64)
+    charge = np.full(matrices.size, INF_CHARGE, dtype=np.int64)
+    departure[ends] = step_time[first][direct]
+    charge[ends] = step_charge[first][direct]
+    departure = spot_path_costs(matrices, step_time, departure, backward=False)
+    charge = spot_path_costs(matrices, step_charge, charge, backward=False)
+    return departure - matrices.staytime, charge, to_go
+
+
+def exact_candidates(evaluator: DayEvaluator) -> List[int]:
+    """
+    日帰りプランで訪問しうる観光地を返す。大阪駅から観光終了時刻までに着けて、
+    大阪駅からそこを通って大阪駅に戻る額の下界（day_trip_bounds）が予算内に収まるものに絞る。
+    """
+    params = evaluator.params
+    arrival, charge, to_go = day_trip_bounds(evaluator)
+    spots = evaluator.matrices.spot_indices
+    possible = (arrival[spots] < params.sightseeing_end_time) & (charge[spots] + to_go[spots] <= params.budget)
+    return spots[possible].tolist()
+
+
+class _DayTripSearch:
+    """
+    日帰りプランの分枝限定法。大阪駅から観光地を1つずつ足していく全順序を深さ優先でたどり、
+    「残り時間で足せる観光地数」と「予算の上限」から求めた評価値の上界が暫定解以下の枝を刈る。
+    """
+
+    def __init__(self, evaluator: DayEvaluator, candidates: List[int], controller: SearchController):
+        self.time = evaluator.time
+        self.fare = evaluator.fare
+        self.visit_fare = evaluator.visit_fare
+        self.staytime = evaluator.staytime
+        # 観光地をたどって大阪駅に帰るまでの額の下界
+        self.to_go = day_trip_bounds(evaluator)[2].tolist()
+        # 日帰りのみを解くため、営業時間は初日の範囲だけを見る
+        self.earliest = evaluator.earliest[0]
+        self.latest = evaluator.latest[0]
+        self.params = evaluator.params
+        self.candidates = candidates
+        self.controller = controller
+        self.path: List[int] = []
+        self.best_route: Optional[List[int]] = None
+        self.best_score = None
+        # 上界用: 候補ごとの「最短の到着移動時間」と滞在時間を昇順に並べたもの
+        sources = [0] + candidates
+        self.min_in_times = sorted(min(self.time[source][node] for source in sources if source != node) for node in candidates)
+        self.stays = sorted(self.staytime[node] for node in candidates)
+        self.aborted = False
+
+    def _max_additional(self, current_time: int) -> int:
+        """
+        出発時刻 current_time から観光終了時刻までに、あと何か所の観光地に着けるかの上限。
+        """
+        remaining = self.params.sightseeing_end_time - current_time
+        count = 0
+        needed = 0
+        for k, travel_time in enumerate(self.min_in_times):
+            needed += travel_time + (self.stays[k - 1] if k > 0 else 0)
+            if needed >= remaining:
+                break
+            count += 1
+        return count
+
+    def run(self) -> None:
+        self._visit(0, 0, 0, 0)
+
+    def _visit(self, current: int, current_time: int, charge: int, visited: int) -> None:
+        """
+        visited は訪問済み観光地のビットマスク。子へは新しい整数として渡すため、戻すときの後始末がいらない。
+        """
+        if self.controller.should_stop():
+            self.aborted = True
+            return
+        params = self.params
+        time, fare = self.time, self.fare
+
+        # ここで大阪駅に戻る場合
+        if time[current][0] < INF_TIME:
+            total = charge + fare[current][0]
+            if total <= params.budget:
+                score = score_plan(len(self.path) + 2, total, params.budget)
+                if self.best_score is None or score > self.best_score:
+                    self.best_score = score
+                    self.best_route = list(self.path)
+                    self.controller.record(score)
+
+        # 上界: 足せる観光地をすべて足し、予算を使い切った場合の評価値
+        bound = score_plan(len(self.path) + 2 + self._max_additional(current_time), params.budget, params.budget)
+        if self.best_score is not None and bound <= self.best_score:
+            return
+
+        children = []
+        for node in self.candidates:
+            if visited >> node & 1:
+                continue
+            arrival = current_time + time[current][node]
+            if arrival >= params.sightseeing_end_time or arrival < self.earliest[node] or arrival > self.latest[node]:
+                continue
+            next_charge = charge + (fare[current][node] + self.visit_fare[node]) * params.people
+            # どう回っても予算内で大阪駅に帰れなくなる枝は展開しない
+            if next_charge + self.to_go[node] > params.budget:
+                continue
+            children.append((arrival, node, next_charge))
+        # 近い観光地から試すと、停留所数の多い暫定解が早く見つかり枝刈りが効く
+        children.sort()
+        for arrival, node, next_charge in children:
+            self.path.append(node)
+            self._visit(node, arrival + self.staytime[node], next_charge, visited | 1 << node)
+            self.path.pop()
+            if self.aborted:
+                return
+
+
+def solve_day_trip(
+    evaluator: DayEvaluator,
+    candidates: List[int],
+    controller: SearchController,
+) -> Optional[Tuple[List[int], float]]:
+    """
+    日帰りプランの厳密解 (観光地のルート, 評価値) を返す。
+    controller の打ち切り条件（ノード数の上限など）に達して最適性を示せなかった場合や、
+    大阪駅に戻れるプランがない場合は None。
+    """
+    search = _DayTripSearch(evaluator, candidates, controller)
+    search.run()
+    if search.aborted or search.best_route is None:
+        return None
+    controller.stop(STOP_OPTIMAL)
+    return search.best_route, search.best_score
@@ -5,6 +5,8 @@ import time
 import math
 from dotenv import load_dotenv
 
+from opening_hours import compact_opening_hours
+
 # .env.local から API キーを読み込む
 load_dotenv(".env.local")
 API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
@@ -100,6 +102,8 @@ def get_hotels_for_city(city, center):
                                 "lat": place.get("location", {}).get("latitude", None),
                                 "lng": place.get("location", {}).get("longitude", None),
                             },
+                            # 週の分で表した営業時間の区間（情報がなければ None）
+                            "opening_hours": compact_opening_hours(place.get("regularOpeningHours")),
                             "ishotel": True,
                             "price": place.get("priceLevel", "不明"),
                         }
@@ -5,6 +5,8 @@ import time
 import math
 from dotenv import load_dotenv
 
+from opening_hours import compact_opening_hours
+
 # 環境変数から API キーを読み込む（.env.local に GOOGLE_MAPS_API_KEY を定義してください）
 load_dotenv(".env.local")
 API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
@@ -89,6 +91,8 @@ def get_tourist_spots_for_city(city, center):
                                 "lat": place.get("location", {}).get("latitude", None),
                                 "lng": place.get("location", {}).get("longitude", None),
                             },
+                            # 週の分で表した営業時間の区間（情報がなければ None）
+                            "opening_hours": compact_opening_hours(place.get("regularOpeningHours")),
                         }
                         unique_places[pid] = facility
             time.sleep(1)
@@ -0,0 +1,393 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from optimization.opening_hours import MINUTES_PER_DAY, opening_windows
+from optimization.travel_matrix import INF_CHARGE, INF_TIME, TravelMatrices, spot_path_costs
+
+# ホテルに泊まらない夜を表す値
+NO_HOTEL = -1
+
+
+@dataclass(frozen=True)
+class PlanParams:
+    """
+    1リクエスト分の探索条件。時刻はすべてその日の出発からの相対時間（分）。
+    start_minute は初日の出発の週の分（日曜 0:00 から）で、観光地の営業時間と照らし合わせるのに使う。
+    """
+    budget: int
+    days: int
+    people: int
+    day_total_time: int
+    sightseeing_end_time: int
+    start_minute: int
+
+
+def build_plan_params(budget: int, days: int, people: int, start_datetime_str: str) -> PlanParams:
+    """
+    departure_time: チェックアウト時刻（分換算、例:10:00→600）
+    ホテルのチェックインは18:00～20:00（1080～1200分）に合わせるため、相対時間として利用可能時間は:
+      day_total_time = 1400 - departure_time  （例: departure_time=600 → 800分）
+      sightseeing_end_time = 1080 - departure_time  （例: departure_time=600 → 480分）
+    """
+    start_datetime = datetime.fromisoformat(start_datetime_str)
+    departure_time = start_datetime.hour * 60 + start_datetime.minute
+    # datetime.weekday() は月曜 0、営業時間の週の分は日曜 0 から数える
+    weekday = (start_datetime.weekday() + 1) % 7
+    return PlanParams(
+        budget=budget,
+        days=days,
+        people=people,
+        day_total_time=1400 - departure_time,
+        sightseeing_end_time=1080 - departure_time,
+        start_minute=weekday * MINUTES_PER_DAY + departure_time,
+    )
+
+
+def score_plan(num_stops: int, total_cost: int, budget: int) -> float:
+    """
+    evaluate_plan と同じ評価値を、JSON を介さずに停留所数と総費用から求める。
+    """
+    return num_stops * 10 + (total_cost / budget) * 100
+
+
+def consecutive_stays(ends: Sequence[int]) -> bool:
+    """
+    各日の終点の並びで、同じホテルに泊まる夜が連続しているか。
+    続けて同じホテルに泊まる（連泊）のはよいが、一度チェックアウトしたホテルには戻らない。
+    """
+    left = set()
+    previous = NO_HOTEL
+    for end in ends:
+        if end == previous:
+            continue
+        if end in left:
+            return False
+        if previous != NO_HOTEL:
+            left.add(previous)
+        previous = end
+    return True
+
+
+class FinishBounds:
+    """
+    観光地を訪れた後、旅程を最後まで終えるために残しておくべき予算差引額の下界。
+    最終日はそのノードから（他の観光地を回ってもよく）大阪駅へ帰る額の最小値。それ以外の日は、最終日に観光地を1か所以上回って
+    帰る額の最小値に加え、ホテルに泊まる場合は今夜（そのノードから観光地を回ってホテルに着く額）と残りの夜（大阪駅を出てホテルに
+    着く額）の最小値。どれも spot_path_costs の緩和（時刻と訪問済みを無視）で求めるため、直接向かうより安い回り道があっても
+    実際の額を超えない。ホテルに泊まらない夜（NO_HOTEL）も許されるため、宿泊分は呼び出し側が with_hotel で見込むかどうかを決める。
+    全ノード分をまとめて求めるため、探索ごとに1回だけ作って使い回す。
+    """
+
+    def __init__(self, matrices: TravelMatrices, params: PlanParams):
+        self.params = params
+        people = params.people
+        step = (matrices.edge_fare.astype(np.int64) + matrices.visit_fare[matrices.edge_end]) * people
+        self.return_fare = spot_path_costs(matrices, step, matrices.return_fare, backward=True)
+        self.hotel_charge = spot_path_costs(matrices, step, matrices.hotel_charge * people, backward=True)
+        # 探索中のスカラー参照用
+        self.return_fare_list = self.return_fare.tolist()
+        self.hotel_charge_list = self.hotel_charge.tolist()
+        # 各日は大阪駅から出発するため、最終日は少なくとも1か所の観光地を回って帰る
+        ends, first_time, first_fare = matrices.neighbors(0)
+        first = matrices.is_spot[ends] & (first_time < INF_TIME)
+        ends = ends[first]
+        final_day = (first_fare[first].astype(np.int64) + matrices.visit_fare[ends]) * people + self.return_fare[ends]
+        self.min_return = int(final_day.min()) if len(final_day) else INF_CHARGE
+        self.min_night = int(self.hotel_charge[0])
+
+    def after_tonight(self, day: int, with_hotel: bool) -> int:
+        """
+        day 日目の夜より後（残りの夜と最終日）に残しておく額の下界。with_hotel なら残りの夜もホテルに泊まる分を見込む。
+        """
+        nights_after = self.params.days - 2 - day
+        return self.min_return + (nights_after * self.min_night if with_hotel else 0)
+
+    def with_hotel(self, day: int, current: int, remaining_budget: int) -> bool:
+        """
+        現在地 current から、残りの予算でまだ今夜と残りの夜にホテルへ泊まれるか。
+        """
+        return remaining_budget >= self.hotel_charge_list[current] + self.after_tonight(day, True)
+
+    def reserve(self, day: int, node: int, with_hotel: bool) -> int:
+        if day == self.params.days - 1:
+            return self.return_fare_list[node]
+        if with_hotel:
+            return self.hotel_charge_list[node] + self.after_tonight(day, True)
+        return self.after_tonight(day, False)
+
+    def reserves(self, day: int, with_hotel: bool) -> np.ndarray:
+        """
+        全ノードについての reserve をまとめて返す。
+        """
+        if day == self.params.days - 1:
+            return self.return_fare
+        if with_hotel:
+            return self.hotel_charge + self.after_tonight(day, True)
+        return np.full(len(self.return_fare), self.after_tonight(day, False), dtype=np.int64)
+
+
+class Stop:
+    """
+    プラン中の1つの停留所。探索中は大量に作られるため、辞書ではなく __slots__ のクラスにしている。
+    destination_id はノード index で、出力時に format_itinerary で ID に戻す。
+    時刻（departure_offset / arrival_offset）はその日の出発からの相対時間（分）。
+    """
+    __slots__ = (
+        "destination_id", "departure_offset", "travel_cost", "visit_cost", "travel_time",
+        "visit_time", "arrival_offset", "total_cost", "transportation_method",
+    )
+
+    def __init__(
+        self,
+        destination_id: int,
+        departure_offset: int,
+        travel_cost: int,
+        visit_cost: int,
+        travel_time: int,
+        visit_time: int,
+        arrival_offset: int,
+        total_cost: int,
+        transportation_method: Any,
+    ):
+        self.destination_id = destination_id
+        self.departure_offset = departure_offset
+        self.travel_cost = travel_cost
+        self.visit_cost = visit_cost
+        self.travel_time = travel_time
+        self.visit_time = visit_time
+        self.arrival_offset = arrival_offset
+        self.total_cost = total_cost
+        self.transportation_method = transportation_method
+
+
+def departure_stop() -> Stop:
+    """
+    初日の先頭に置く大阪駅出発の停留所。
+    """
+    return Stop(
+        destination_id=0,
+        departure_offset=0,
+        travel_cost=0,
+        visit_cost=0,
+        travel_time=0,
+        visit_time=0,
+        arrival_offset=0,
+        total_cost=0,
+        transportation_method="出発",
+    )
+
+
+class DayEvaluator:
+    """
+    1日分のルート（観光地のノード index 列）と、その日の終点（ホテル / 大阪駅 / NO_HOTEL）から
+    その日の時刻・費用を計算する。日ごとに独立して計算できるため、局所探索では変更した日だけを再計算すればよい。
+
+    制約は貪欲法と同じく、観光地への到着は sightseeing_end_time より前で、営業時間内に滞在を終えられる時刻
+    （windows、opening_hours.opening_windows を参照）、ホテルへの到着は [sightseeing_end_time, day_total_time] の範囲内とする。
+    営業時間は曜日で変わるため、各メソッドには何日目か（day、0 始まり）を渡す。
+    """
+
+    def __init__(self, matrices: TravelMatrices, params: PlanParams):
+        self.matrices = matrices
+        self.params = params
+        self.windows = opening_windows(
+            matrices.opening, matrices.staytime, matrices.is_spot, params.start_minute, params.days)
+        # 探索中はスカラー参照が大半のため、NumPy 配列ではなく Python のリスト（疎行列の都市では辞書）の行で引く。
+        # 行は都市ごとに TravelMatrices が一度だけ作ったものを共有する
+        self.time = matrices.time_rows
+        self.fare = matrices.fare_rows
+        self.visit_fare = matrices.visit_fare_list
+        self.staytime = matrices.staytime_list
+        self.earliest = self.windows.earliest.tolist()
+        self.latest = self.windows.latest.tolist()
+
+    def evaluate(self, route: Sequence[int], end: int, day: int) -> Optional[Tuple[int, int, int]]:
+        """
+        (停留所数, 表示上の総費用, 予算から差し引く額) を返す。制約を満たさない場合は None。
+        end は最終日なら 0（大阪駅）、それ以外はホテルのノード index か NO_HOTEL。
+        """
+        time = self.time
+        fare = self.fare
+        earliest = self.earliest[day]
+        latest = self.latest[day]
+        people = self.params.people
+        sightseeing_end_time = self.params.sightseeing_end_time
+        current = 0
+        current_time = 0
+        cost = 0
+        for node in route:
+            travel_time = time[current][node]
+            if travel_time >= INF_TIME:
+                return None
+            arrival = current_time + travel_time
+            if arrival >= sightseeing_end_time or arrival < earliest[node] or arrival > latest[node]:
+                return None
+            current_time = arrival + self.staytime[node]
+            cost += (fare[current][node] + self.visit_fare[node]) * people
+            current = node
+        num_stops = len(route) + (1 if day == 0 else 0)
+        charge = cost
+        if end == 0:
+            if time[current][0] >= INF_TIME:
+                return None
+            cost += fare[current][0]
+            charge += fare[current][0]
+            num_stops += 1
+        elif end != NO_HOTEL:
+            arrival = current_time + time[current][end]
+            if arrival < sightseeing_end_time or arrival > self.params.day_total_time:
+                return None
+            hotel_cost = fare[current][end] + self.visit_fare[end]
+            cost += hotel_cost
+            charge += hotel_cost * people
+            num_stops += 1
+        return num_stops, cost, charge
+
+    def finish(self, route: Sequence[int], day: int) -> Optional[Tuple[int, int]]:
+        """
+        その日の最後の観光地（観光地がなければ大阪駅）と、そこを出る時刻。観光地の時刻の制約を満たさない場合は None。
+        """
+        time = self.time
+        earliest = self.earliest[day]
+        latest = self.latest[day]
+        current = 0
+        current_time = 0
+        for node in route:
+            travel_time = time[current][node]
+            if travel_time >= INF_TIME:
+                return None
+            arrival = current_time + travel_time
+            if arrival >= self.params.sightseeing_end_time or arrival < earliest[node] or arrival > latest[node]:
+                return None
+            current_time = arrival + self.staytime[node]
+            current = node
+        return current, current_time
+
+    def feasible_hotels(self, route: Sequence[int], day: int) -> np.ndarray:
+        """
+        ルートの後に到着時刻の範囲内でチェックインできるホテルのマスク（matrices.hotel_indices の列ごと）。
+        """
+        finish = self.finish(route, day)
+        if finish is None:
+            return np.zeros(len(self.matrices.hotel_indices), dtype=bool)
+        last, current_time = finish
+        arrival = current_time + self.matrices.hotel_reach(last)[0]
+        return (arrival >= self.params.sightseeing_end_time) & (arrival <= self.params.day_total_time)
+
+    def travel_time(self, route: Sequence[int], end: int) -> int:
+        """
+        その日の移動時間（分）の合計。終点への移動も含み、制約は確かめない（evaluate を通ったルートに使う）。
+        """
+        time = self.time
+        total = 0
+        current = 0
+        for node in route:
+            total += time[current][node]
+            current = node
+        if end != NO_HOTEL:
+            total += time[current][end]
+        return total
+
+    def stops(self, route: Sequence[int], end: int, day: int) -> List[Stop]:
+        """
+        evaluate と同じ計算で、貪欲法と同じ形式の停留所（Stop）のリストを作る。
+        """
+        matrices = self.matrices
+        people = self.params.people
+        day_plan = [departure_stop()] if day == 0 else []
+        current = 0
+        current_time = 0
+        for node in route:
+            travel_time = self.time[current][node]
+            travel_cost = self.fare[current][node]
+            visit_cost = self.visit_fare[node]
+            day_plan.append(Stop(
+                destination_id=node,
+                departure_offset=current_time,
+                travel_cost=travel_cost,
+                visit_cost=visit_cost,
+                travel_time=travel_time,
+                visit_time=self.staytime[node],
+                arrival_offset=current_time + travel_time,
+                total_cost=(travel_cost + visit_cost) * people,
+                transportation_method=matrices.method(current, node),
+            ))
+            current_time += travel_time + self.staytime[node]
+            current = node
+        if end != NO_HOTEL:
+            travel_time = self.time[current][end]
+            travel_cost = self.fare[current][end]
+            visit_cost = self.visit_fare[end]
+            day_plan.append(Stop(
+                destination_id=end,
+                departure_offset=current_time,
+                travel_cost=travel_cost,
+                visit_cost=visit_cost,
+                travel_time=travel_time,
+                visit_time=0,
+                arrival_offset=current_time + travel_time,
+                total_cost=travel_cost + visit_cost,
+                transportation_method=matrices.method(current, end),
+            ))
+        return day_plan
+
+
+def split_itinerary(matrices: TravelMatrices, itinerary: List[List[Stop]]) -> Tuple[List[List[int]], List[int]]:
+    """
+    停留所リスト形式のプランを、日ごとの観光地ルートと各日の終点（ホテル / 大阪駅 / NO_HOTEL）に分解する。
+    """
+    routes = []
+    ends = []
+    for day_plan in itinerary:
+        route, end = split_day([stop.destination_id for stop in day_plan], matrices)
+        routes.append(route)
+        ends.append(end)
+    return routes, ends
+
+
+def split_day(nodes: Sequence[int], matrices: TravelMatrices) -> Tuple[List[int], int]:
+    """
+    1日分の停留所のノード index 列を、観光地ルートとその日の終点（ホテル / 大阪駅 / NO_HOTEL）に分ける。
+    """
+    route = [node for node in nodes if matrices.is_spot[node]]
+    last = nodes[-1] if len(nodes) else NO_HOTEL
+    return route, last if last == 0 or (last != NO_HOTEL and matrices.is_hotel[last]) else NO_HOTEL
+
+
+def format_itinerary(graph, itinerary: List[List[Stop]], start_datetime_str: str) -> Dict[str, Any]:
+    """
+    停留所リスト（destination_id はノード index）を API の出力形式 {"route": [...]} に変換する。
+    再計画（replanning）でプランを受け取り直せるよう、各停留所には目的地 ID と何日目か（0 始まり）も入れる。
+    transportation_estimated は、その停留所への移動が移動データではなく距離からの見積もり（TravelMatrices.is_estimated）かどうか。
+    """
+    # 各日のプランを平坦化し、各日ごとのオフセット（1440分＝1日）を加算
+    # ベースの開始日時（ISO形式）から各停留所の出発・到着時刻を算出
+    base_dt = datetime.fromisoformat(start_datetime_str)
+    route_output = []
+    for day_index, day_plan in enumerate(itinerary):
+        day_offset = day_index * 1440
+        # 各日は大阪駅から出発する（初日の先頭は出発の停留所そのもの）
+        previous = None if day_index == 0 else 0
+        for stop in day_plan:
+            # 各停留所の出力形式に変換（lat, lng, name, total_cost, transportation_method, departure_time, arrival_time, stay_duration_minutes）
+            dest_info = graph.destination(graph.ids[stop.destination_id])
+            output_stop = {
+                "destination_id": graph.ids[stop.destination_id],
+                "day": day_index,
+                "lat": dest_info.get("location", {}).get("lat", 0),
+                "lng": dest_info.get("location", {}).get("lng", 0),
+                "name": dest_info.get("japanese_name", dest_info.get("name", "不明")),
+                "total_cost": stop.total_cost,
+                "transportation_method": stop.transportation_method,
+                "departure_time": (base_dt + timedelta(minutes=stop.departure_offset + day_offset)).isoformat(),
+                "arrival_time": (base_dt + timedelta(minutes=stop.arrival_offset + day_offset)).isoformat(),
+                "stay_duration_minutes": stop.visit_time,
+                "transportation_estimated": previous is not None and graph.matrices.is_estimated(
+                    previous, stop.destination_id),
+            }
+            route_output.append(output_stop)
+            previous = stop.destination_id
+    return {"route": route_output}
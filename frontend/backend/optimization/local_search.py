@@ -0,0 +1,291 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from optimization.itinerary import NO_HOTEL, DayEvaluator, score_plan
+from optimization.travel_matrix import INF_TIME, TravelMatrices, candidate_spots, node_mask
+
+# Or-opt で動かす区間の最大長
+OR_OPT_MAX_SEGMENT = 3
+
+
+class DayRoute:
+    """
+    1日分のルートの移動時間を、近傍の判定が O(1) でできる形で持つ。
+
+    path = [0（大阪駅）] + route で、forward[k] は path[0] → path[k] の移動時間の合計、
+    backward[k] は path[k] → path[0] と逆向きにたどった移動時間の合計（行列が非対称なため別に持つ）。
+    観光地の滞在時間の合計は並べ替えで変わらないため、最後の観光地への到着時刻は
+    「最後の観光地までの移動時間 + その観光地以外の滞在時間」で求まる。
+    """
+
+    def __init__(self, evaluator: DayEvaluator, route: Sequence[int], end: int):
+        time = evaluator.time
+        self.time = time
+        self.staytime = evaluator.staytime
+        self.params = evaluator.params
+        self.route = list(route)
+        self.end = end
+        self.path = [0] + self.route
+        self.forward = [0] * len(self.path)
+        self.backward = [0] * len(self.path)
+        for k in range(1, len(self.path)):
+            self.forward[k] = self.forward[k - 1] + time[self.path[k - 1]][self.path[k]]
+            self.backward[k] = self.backward[k - 1] + time[self.path[k]][self.path[k - 1]]
+        self.total_stay = sum(self.staytime[node] for node in self.route)
+
+    def duration(self, travel_to_last: int, last: int, total_stay: int) -> Optional[int]:
+        """
+        最後の観光地 last までの移動時間が travel_to_last のルートについて、その日の移動時間の合計
+        （終点までの移動を含む）を返す。時刻の制約を満たさない場合は None。
+        """
+        time = self.time
+        end = self.end
+        if last != 0 and travel_to_last + total_stay - self.staytime[last] >= self.params.sightseeing_end_time:
+            return None
+        if end == NO_HOTEL:
+            return travel_to_last
+        leg = time[last][end]
+        if leg >= INF_TIME:
+            return None
+        if end != 0:
+            arrival = travel_to_last + total_stay + leg
+            if arrival < self.params.sightseeing_end_time or arrival > self.params.day_total_time:
+                return None
+        return travel_to_last + leg
+
+    def current_duration(self) -> Optional[int]:
+        return self.duration(self.forward[-1], self.path[-1], self.total_stay)
+
+    def two_opt(self, i: int, j: int) -> Tuple[int, int]:
+        """
+        path[i..j]（1 <= i < j）を逆順にしたときの (最後の観光地までの移動時間, 最後の観光地)。
+        """
+        time, path, forward, backward = self.time, self.path, self.forward, self.backward
+        n = len(path) - 1
+        travel = forward[i - 1] + time[path[i - 1]][path[j]] + backward[j] - backward[i]
+        if j == n:
+            return travel, path[i]
+        travel += time[path[i]][path[j + 1]] + forward[n] - forward[j + 1]
+        return travel, path[n]
+
+    def or_opt(self, a: int, b: int, k: int) -> Tuple[int, int]:
+        """
+        区間 path[a..b] を path[k] の直後へ移したときの (最後の観光地までの移動時間, 最後の観光地)。
+        k は a - 1 より前か、b 以降であること。
+        """
+        time, path, forward = self.time, self.path, self.forward
+        n = len(path) - 1
+        segment = forward[b] - forward[a]
+        if k < a - 1:
+            travel = forward[k] + time[path[k]][path[a]] + segment + time[path[b]][path[k + 1]] + forward[a - 1] - forward[k + 1]
+            if b == n:
+                return travel, path[a - 1]
+            return travel + time[path[a - 1]][path[b + 1]] + forward[n] - forward[b + 1], path[n]
+        travel = forward[a - 1] + time[path[a - 1]][path[b + 1]] + forward[k] - forward[b + 1] + time[path[k]][path[a]] + segment
+        if k == n:
+            return travel, path[b]
+        return travel + time[path[b]][path[k + 1]] + forward[n] - forward[k + 1], path[n]
+
+    def insertion(self, node: int, k: int) -> Tuple[int, int]:
+        """
+        観光地 node を path[k] の直後に挿入したときの (最後の観光地までの移動時間, 最後の観光地)。
+        """
+        time, path, forward = self.time, self.path, self.forward
+        n = len(path) - 1
+        if k == n:
+            return forward[n] + time[path[n]][node], node
+        return forward[n] + time[path[k]][node] + time[node][path[k + 1]] - time[path[k]][path[k + 1]], path[n]
+
+
+def _two_opt_route(route: List[int], i: int, j: int) -> List[int]:
+    # path の位置 i..j は route の位置 i-1..j-1
+    return route[:i - 1] + route[i - 1:j][::-1] + route[j:]
+
+
+def _or_opt_route(route: List[int], a: int, b: int, k: int) -> List[int]:
+    segment = route[a - 1:b]
+    rest = route[:a - 1] + route[b:]
+    position = k if k < a - 1 else k - (b - a + 1)
+    return rest[:position] + segment + rest[position:]
+
+
+def _improving_moves(day: DayRoute, current: int):
+    """
+    2-opt と Or-opt の近傍のうち、時刻の制約を満たしてその日の移動時間が current より短くなるものを
+    (新しいルート) として順に返す。判定はすべて O(1)。
+    """
+    n = len(day.path) - 1
+    total_stay = day.total_stay
+    for i in range(1, n):
+        for j in range(i + 1, n + 1):
+            travel, last = day.two_opt(i, j)
+            duration = day.duration(travel, last, total_stay)
+            if duration is not None and duration < current:
+                yield _two_opt_route(day.route, i, j)
+    for length in range(1, min(OR_OPT_MAX_SEGMENT, n - 1) + 1):
+        for a in range(1, n - length + 2):
+            b = a + length - 1
+            for k in range(0, n + 1):
+                if a - 1 <= k <= b:
+                    continue
+                travel, last = day.or_opt(a, b, k)
+                duration = day.duration(travel, last, total_stay)
+                if duration is not None and duration < current:
+                    yield _or_opt_route(day.route, a, b, k)
+
+
+def improve_day_order(
+    evaluator: DayEvaluator,
+    route: Sequence[int],
+    end: int,
+    day: int,
+    max_charge: int,
+) -> Tuple[List[int], Tuple[int, int, int]]:
+    """
+    1日分の訪問順を 2-opt / Or-opt で並べ替え、その日の移動時間を短くする（訪問する観光地は変えない）。
+    改善する近傍が見つかるたびに DayEvaluator で費用を確かめ、その日の予算差引額が max_charge 以下なら採用する。
+    (新しいルート, その日の評価値) を返す。
+    """
+    route = list(route)
+    value = evaluator.evaluate(route, end, day)
+    improved = True
+    while improved:
+        improved = False
+        day_route = DayRoute(evaluator, route, end)
+        current = day_route.current_duration()
+        if current is None:
+            break
+        for candidate in _improving_moves(day_route, current):
+            candidate_value = evaluator.evaluate(candidate, end, day)
+            if candidate_value is not None and candidate_value[2] <= max_charge:
+                route, value = candidate, candidate_value
+                improved = True
+                break
+    return route, value
+
+
+def _nearby_spots(matrices: TravelMatrices, path: Sequence[int]) -> List[int]:
+    nearby = set()
+    for node in path:
+        nearby.update(candidate_spots(matrices, node).tolist())
+    return sorted(nearby)
+
+
+def insert_spots(
+    evaluator: DayEvaluator,
+    route: Sequence[int],
+    end: int,
+    day: int,
+    max_charge: int,
+    in_plan: int,
+) -> Tuple[List[int], Tuple[int, int, int], int]:
+    """
+    並べ替えで空いた時間に、プランにまだない観光地を移動時間の増加が小さい位置から挿入していく。
+    挿入する観光地は、その日に通るノードの候補リストに載っているものに限る。
+    in_plan はプランに入っている観光地のビットマスクで、(新しいルート, その日の評価値, 挿入後の in_plan) を返す。
+    """
+    route = list(route)
+    value = evaluator.evaluate(route, end, day)
+    staytime = evaluator.staytime
+    while True:
+        day_route = DayRoute(evaluator, route, end)
+        n = len(day_route.path) - 1
+        candidates = []
+        for node in _nearby_spots(evaluator.matrices, day_route.path):
+            if in_plan >> node & 1:
+                continue
+            total_stay = day_route.total_stay + staytime[node]
+            for k in range(n + 1):
+                travel, last = day_route.insertion(node, k)
+                duration = day_route.duration(travel, last, total_stay)
+                if duration is not None:
+                    candidates.append((duration, node, k))
+        candidates.sort()
+        for _, node, k in candidates:
+            candidate = route[:k] + [node] + route[k:]
+            candidate_value = evaluator.evaluate(candidate, end, day)
+            if candidate_value is not None and candidate_value[2] <= max_charge:
+                route, value = candidate, candidate_value
+                in_plan |= 1 << node
+                break
+        else:
+            return route, value, in_plan
+
+
+def improve_plan(
+    evaluator: DayEvaluator,
+    routes: Sequence[Sequence[int]],
+    ends: Sequence[int],
+    days: Optional[Sequence[int]] = None,
+) -> Tuple[List[List[int]], int, int]:
+    """
+    各日の訪問順を 2-opt / Or-opt で改善し、空いた時間に観光地を挿入する。
+    予算はプラン全体で共有するため、日ごとに「他の日の予算差引額を除いた残り」を上限にする。
+    days を指定した場合はその日だけを改善する（観光地を外すことはないため、残したい観光地はそのまま残る）。
+    評価値（score_plan）は日ごとの和なので、その日の評価値が下がる変更は採用せず、プラン全体の評価値も下がらない。
+    (新しいルート, 停留所数, 総費用) を返す。ends（各日の終点）は変えない。
+    """
+    budget = evaluator.params.budget
+    routes = [list(route) for route in routes]
+    values = [evaluator.evaluate(route, end, day) for day, (route, end) in enumerate(zip(routes, ends))]
+    in_plan = node_mask(node for route in routes for node in route)
+    charge = sum(value[2] for value in values)
+    # 初期解が予算超過の場合は、超過を悪化させない範囲で改善する
+    limit = max(budget, charge)
+
+    for day in range(len(ends)) if days is None else days:
+        end = ends[day]
+        others = charge - values[day][2]
+        route, value = improve_day_order(evaluator, routes[day], end, day, limit - others)
+        route, value, improved_in_plan = insert_spots(evaluator, route, end, day, limit - others, in_plan)
+        # 並べ替えで運賃の安い経路になると評価値が下がることがあるため、その日の評価値が下がる場合は元のルートを残す
+        if score_plan(value[0], value[1], budget) >= score_plan(values[day][0], values[day][1], budget):
+            routes[day], values[day], in_plan = route, value, improved_in_plan
+        charge = others + values[day][2]
+
+    num_stops = sum(value[0] for value in values)
+    cost = sum(value[1] for value in values)
+    return routes, num_stops, cost
+
+
+def choose_base_hotel(
+    evaluator: DayEvaluator,
+    routes: Sequence[Sequence[int]],
+    ends: Sequence[int],
+) -> Optional[Tuple[List[int], int, int]]:
+    """
+    最終日以外のすべての夜を1つのホテルで連泊する案を、全ホテルについて hotel_reach の行の演算でまとめて評価する。
+    予算内で、現在の ends より評価値が高い案があれば、そのうち最もよいものの (各日の終点, 停留所数, 総費用) を返す。なければ None。
+    """
+    matrices = evaluator.matrices
+    params = evaluator.params
+    nights = len(ends) - 1
+    if nights < 2 or len(matrices.hotel_indices) == 0:
+        return None
+    values = [evaluator.evaluate(route, end, day) for day, (route, end) in enumerate(zip(routes, ends))]
+    finishes = [evaluator.finish(routes[day], day) for day in range(nights)]
+    if any(value is None for value in values) or any(finish is None for finish in finishes):
+        return None
+    # ホテルなしで数えた最終日以外の日と、最終日の評価値
+    bare = [evaluator.evaluate(routes[day], NO_HOTEL, day) for day in range(nights)] + [values[-1]]
+    num_stops = sum(value[0] for value in bare) + nights
+    cost = sum(value[1] for value in bare)
+    charge = sum(value[2] for value in bare)
+
+    hotel_time, hotel_fare = matrices.hotel_reach(np.array([finish[0] for finish in finishes]))
+    arrival = np.array([finish[1] for finish in finishes])[:, None] + hotel_time
+    hotel_cost = hotel_fare.sum(axis=0)
+    feasible = np.flatnonzero(
+        ((arrival >= params.sightseeing_end_time) & (arrival <= params.day_total_time)).all(axis=0)
+        & (charge + hotel_cost * params.people <= params.budget))
+    if len(feasible) == 0:
+        return None
+    # 停留所数は全ホテルで同じため、総費用の最も大きいホテルが評価値も最も高い
+    best = int(feasible[np.argmax(hotel_cost[feasible])])
+    best_cost = cost + int(hotel_cost[best])
+    current = score_plan(sum(value[0] for value in values), sum(value[1] for value in values), params.budget)
+    if score_plan(num_stops, best_cost, params.budget) <= current:
+        return None
+    hotel = int(matrices.hotel_indices[best])
+    return [hotel] * nights + [ends[-1]], num_stops, best_cost
@@ -0,0 +1,110 @@
+from typing import Any, List, Mapping, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+# 営業時間の区間表の空き要素
+NO_INTERVAL = -1
+# 営業時間の制約がない観光地の到着時刻の上限（どの相対時刻よりも大きい値）
+ALWAYS_OPEN = 1 << 30
+
+
+def _minute_of_week(point: Mapping[str, Any]) -> int:
+    # Places API の day は 0 = 日曜
+    return point.get("day", 0) * MINUTES_PER_DAY + point.get("hour", 0) * 60 + point.get("minute", 0)
+
+
+def compact_opening_hours(regular_opening_hours: Optional[Mapping[str, Any]]) -> Optional[List[List[int]]]:
+    """
+    Places API の regularOpeningHours を、週の分（日曜 0:00 からの分）で表した [開店, 閉店) の区間のリストにする。
+    区間は開店の昇順に並べて重なりをまとめ、週をまたぐ区間は週末と週初めの2つに分ける。
+    24時間営業（close のない期間）は [[0, MINUTES_PER_WEEK]]。情報がない場合は None（常に営業として扱う）。
+    """
+    if not regular_opening_hours:
+        return None
+    intervals = []
+    for period in regular_opening_hours.get("periods") or []:
+        if "open" not in period:
+            continue
+        start = _minute_of_week(period["open"])
+        if "close" not in period:
+            return [[0, MINUTES_PER_WEEK]]
+        end = _minute_of_week(period["close"])
+        if end <= start:
+            end += MINUTES_PER_WEEK
+        if end > MINUTES_PER_WEEK:
+            intervals.append([start, MINUTES_PER_WEEK])
+            intervals.append([0, end - MINUTES_PER_WEEK])
+        else:
+            intervals.append([start, end])
+    if not intervals:
+        return None
+    intervals.sort()
+    merged = [intervals[0]]
+    for start, end in intervals[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def build_opening_table(hours: Sequence[Optional[Sequence[Sequence[int]]]]) -> np.ndarray:
+    """
+    ノードごとの営業時間の区間（compact_opening_hours の形式）を、(ノード数, 区間数の最大値, 2) の配列にする。
+    区間の少ないノードの残りと、営業時間の情報がないノードの行は NO_INTERVAL で埋める。
+    """
+    width = max([len(intervals) for intervals in hours if intervals] + [1])
+    table = np.full((len(hours), width, 2), NO_INTERVAL, dtype=np.int32)
+    for index, intervals in enumerate(hours):
+        if intervals:
+            table[index, :len(intervals)] = intervals
+    return table
+
+
+class OpeningWindows(NamedTuple):
+    """
+    リクエストの日ごと・ノードごとの、観光地に着いてよい時刻の範囲（その日の出発からの相対時間、分）。
+    earliest[day][node] <= 到着時刻 <= latest[day][node] なら、開店後に着いて閉店までに滞在を終えられる。
+    """
+    earliest: np.ndarray
+    latest: np.ndarray
+
+
+def opening_windows(opening: np.ndarray, staytime: np.ndarray, is_spot: np.ndarray,
+                    start_minute: int, days: int) -> OpeningWindows:
+    """
+    週の分で表した営業時間の区間表 opening から、start_minute（初日の出発の週の分）に出発する旅程の各日について
+    到着時刻の範囲を作る。その日に複数の区間がある場合は、着いてよい時間の最も長い区間だけを使う
+    （短い区間に着くプランは作らないが、閉まっている観光地を予定に入れることはない）。
+    営業時間の情報がない観光地とホテルは常に着いてよく、その日に滞在を終えられる区間がない観光地にはいつも着けない。
+    開店前に着いて待つことはしない。
+    """
+    n = len(staytime)
+    earliest = np.zeros((days, n), dtype=np.int32)
+    latest = np.full((days, n), ALWAYS_OPEN, dtype=np.int32)
+    known = (opening[:, 0, 0] != NO_INTERVAL) & is_spot
+    if not known.any():
+        return OpeningWindows(earliest, latest)
+    valid = opening[known, :, 0] != NO_INTERVAL
+    stay = staytime[known, None]
+    rows = np.arange(int(known.sum()))
+    for day in range(days):
+        day_start = (start_minute + day * MINUTES_PER_DAY) % MINUTES_PER_WEEK
+        best_span = np.full(len(rows), -1)
+        best_from = np.full(len(rows), ALWAYS_OPEN)
+        best_until = np.full(len(rows), -1)
+        # 週の初めの区間は、週の終わりに近い日から見ると1週間後になる
+        for shift in (0, MINUTES_PER_WEEK):
+            start = np.maximum(opening[known, :, 0] - day_start + shift, 0)
+            until = np.minimum(opening[known, :, 1] - day_start + shift, MINUTES_PER_DAY) - stay
+            span = np.where(valid & (until >= start), until - start, -1)
+            k = span.argmax(axis=1)
+            better = span[rows, k] > best_span
+            best_span = np.where(better, span[rows, k], best_span)
+            best_from = np.where(better, start[rows, k], best_from)
+            best_until = np.where(better, until[rows, k], best_until)
+        earliest[day, known] = best_from
+        latest[day, known] = best_until
+    return OpeningWindows(earliest, latest)
@@ -0,0 +1,200 @@
+import atexit
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from dataclasses import dataclass, fields, replace
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from optimization.itinerary import PlanParams
+from optimization.plan_archive import PlanArchive
+from optimization.search_control import SearchLimits
+from optimization.travel_matrix import TravelMatrices
+
+# 共有メモリ上で各配列の先頭をそろえる境界（バイト）
+_ALIGNMENT = 8
+# 締め切りの後、ワーカーが探索を打ち切ってプランを返すまで待つ時間（秒）。これを過ぎた結果は使わない
+RESULT_GRACE_TIME = 0.5
+
+
+@dataclass(frozen=True)
+class SharedMatricesHandle:
+    """
+    共有メモリに置いた TravelMatrices の位置情報。配列本体を含まないため、ワーカーへ渡しても数百バイトで済む。
+    layout は (フィールド名, dtype, shape, 先頭からのオフセット) の組。
+    """
+    name: str
+    layout: Tuple[Tuple[str, str, Tuple[int, ...], int], ...]
+    methods: Tuple[str, ...]
+
+
+def _array_field_names() -> List[str]:
+    return [field.name for field in fields(TravelMatrices) if field.name != "methods"]
+
+
+def share_matrices(matrices: TravelMatrices) -> Tuple[shared_memory.SharedMemory, SharedMatricesHandle]:
+    """
+    TravelMatrices の全配列を1つの共有メモリブロックにコピーし、ワーカーに渡すハンドルを作る。
+    """
+    layout = []
+    offset = 0
+    for name in _array_field_names():
+        array = getattr(matrices, name)
+        offset = (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += array.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, dtype, shape, array_offset in layout:
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=array_offset)[...] = getattr(matrices, name)
+    return shm, SharedMatricesHandle(name=shm.name, layout=tuple(layout), methods=matrices.methods)
+
+
+def _open_shared_memory(name: str) -> shared_memory.SharedMemory:
+    try:
+        # 共有メモリの後始末は作成した親プロセスが行うため、ワーカー側では追跡しない
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python 3.12 以前には track 引数がない
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach_matrices(handle: SharedMatricesHandle) -> Tuple[shared_memory.SharedMemory, TravelMatrices]:
+    """
+    共有メモリ上の配列をコピーせずに参照する TravelMatrices を作る。
+    """
+    shm = _open_shared_memory(handle.name)
+    arrays = {}
+    for name, dtype, shape, offset in handle.layout:
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        array.flags.writeable = False
+        arrays[name] = array
+    return shm, TravelMatrices(methods=handle.methods, **arrays)
+
+
+# 親プロセス側: 都市ごとに一度だけ共有メモリへ書き出す
+_shared: Dict[str, Tuple[shared_memory.SharedMemory, SharedMatricesHandle]] = {}
+_shared_lock = threading.Lock()
+
+# ワーカープロセス側: 共有メモリへの接続を使い回す
+_attached: Dict[str, Tuple[shared_memory.SharedMemory, TravelMatrices]] = {}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def shared_matrices_handle(graph) -> SharedMatricesHandle:
+    with _shared_lock:
+        if graph.city not in _shared:
+            _shared[graph.city] = share_matrices(graph.matrices)
+        return _shared[graph.city][1]
+
+
+def _attached_matrices(handle: SharedMatricesHandle) -> TravelMatrices:
+    if handle.name not in _attached:
+        _attached[handle.name] = attach_matrices(handle)
+    return _attached[handle.name][1]
+
+
+def _noop() -> None:
+    return None
+
+
+def start_worker_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    ワーカープロセスのプールを返す（なければ workers の大きさで作る。アプリでは起動時に PLANNER_WORKERS で作る）。
+    実行中のリクエストが使っているプールを閉じると投入済みでないタスクが失敗するため、一度作ったプールは
+    より多い workers で呼ばれても作り直さない（1リクエストで使うワーカー数は pool_workers で抑える）。
+    spawn で起動するため、ワーカーは都市データを読み込まず共有メモリから行列を参照する。
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+            # 最初のリクエストでプロセス起動を待たないよう、ここで全ワーカーを立ち上げておく
+            for future in [_pool.submit(_noop) for _ in range(workers)]:
+                future.result()
+        return _pool
+
+
+def pool_workers(requested: int) -> int:
+    """
+    1リクエストで使うワーカー数。requested とプールの大きさの小さい方（プールがなければ requested の大きさで作る）。
+    """
+    start_worker_pool(requested)
+    return min(requested, _pool_workers)
+
+
+def shutdown_worker_pool() -> None:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+            _pool_workers = 0
+    with _shared_lock:
+        for shm, _ in _shared.values():
+            shm.close()
+            shm.unlink()
+        _shared.clear()
+
+
+atexit.register(shutdown_worker_pool)
+
+
+def _search_worker(
+    search_fn: Callable,
+    handle: SharedMatricesHandle,
+    params: PlanParams,
+    optimizer: str,
+    limits: SearchLimits,
+    deadline: float,
+    seed: int,
+    archive: Optional[PlanArchive],
+) -> Tuple[Any, Optional[PlanArchive]]:
+    # プールが埋まっていて待たされた時間も締め切りに数えるよう、持ち時間は実際に始めた時刻から締め切り（time.time()）までとする
+    limits = replace(limits, time_limit=max(deadline - time.time(), 0.0))
+    matrices = _attached_matrices(handle)
+    result = search_fn(matrices, params, optimizer, limits, random.Random(seed), archive=archive)
+    return result, archive
+
+
+def run_parallel_search(
+    graph,
+    search_fn: Callable,
+    workers: int,
+    params: PlanParams,
+    optimizer: str,
+    limits: SearchLimits,
+    seeds: Sequence[int],
+    archive: Optional[PlanArchive] = None,
+) -> List[Tuple[Any, Optional[PlanArchive]]]:
+    """
+    search_fn(matrices, params, optimizer, limits, rng, archive=archive) を seeds の数だけワーカーで独立に実行し、
+    締め切りまでに返ってきたワーカーの (結果, archive) を seeds の順に返す（最良の選び方は呼び出し側が決める）。
+    締め切りは呼び出した時刻から limits.time_limit 後で、ワーカー起動や共有メモリの準備、プールの空き待ちの時間も含む。
+    締め切りから RESULT_GRACE_TIME を過ぎても返らないワーカーの結果は待たずに捨てる（1つも返らなければ空のリスト）。
+    seeds の数は pool_workers で抑えておくこと（プールより多いと、あふれた探索は前の探索が終わるまで始まらない）。
+    archive は各ワーカーへ複製して渡し、ワーカーごとにプランを集めたものが返る（None なら集めない）。
+    search_fn はワーカーから import できるモジュールレベルの関数（か、その functools.partial）であること。
+    """
+    # ワーカーとは別のプロセスでも同じ時刻を指すよう、締め切りは time.time() で表す
+    deadline = time.time() + limits.time_limit
+    handle = shared_matrices_handle(graph)
+    executor = start_worker_pool(workers)
+    futures = [
+        executor.submit(_search_worker, search_fn, handle, params, optimizer, limits, deadline, seed, archive)
+        for seed in seeds
+    ]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result(timeout=max(deadline + RESULT_GRACE_TIME - time.time(), 0.0)))
+        except TimeoutError:
+            # まだ始まっていなければ取り消す（始まっていれば締め切りで自分から止まる）
+            future.cancel()
+    return results
@@ -0,0 +1,259 @@
+import bisect
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from optimization.itinerary import DayEvaluator
+from optimization.travel_matrix import node_mask
+
+# 候補として保持するプランの数（返す案の数に対して）
+ELITE_POOL_FACTOR = 4
+MIN_ELITE_POOL_SIZE = 16
+# 別案として返すプラン同士の、訪問する観光地の Jaccard 距離の下限
+DEFAULT_MIN_DISTANCE = 0.3
+# 別案として返すプランの数の上限（候補の保持数もこれに比例する）
+MAX_ALTERNATIVES = 10
+# パレート解として返すプランの数の上限
+MAX_PARETO_PLANS = 50
+
+
+class ElitePlan(NamedTuple):
+    score: float
+    routes: Tuple[Tuple[int, ...], ...]
+    ends: Tuple[int, ...]
+    # 訪問する観光地のビットマスク
+    spots: int
+
+
+def jaccard_distance(a: int, b: int) -> float:
+    """
+    ビットマスクで表した2つの集合の Jaccard 距離。
+    """
+    union = (a | b).bit_count()
+    if union == 0:
+        return 0.0
+    return 1.0 - (a & b).bit_count() / union
+
+
+class ElitePool:
+    """
+    探索中に見つかったプランのうち、評価値の高いものを capacity 件まで保持する。
+
+    訪問する観光地の Jaccard 距離が min_distance 未満のプラン（とルートが同じプラン）は互いに「似たプラン」として扱い、
+    似たプランの中で評価値の最も高いものだけを残す。焼きなましのように同じ観光地の並べ替えを大量に見つける探索でも、
+    pool が1つのプランの変種で埋まらず、保持したプランがそのまま互いに異なる別案になる。
+    プランを渡す前に accepts(score) で入る見込みがあるかを確かめれば、落ちるプランの変換を省ける。
+    """
+
+    def __init__(self, capacity: int, min_distance: float = DEFAULT_MIN_DISTANCE):
+        self.capacity = capacity
+        self.min_distance = min_distance
+        # 評価値の高い順
+        self.plans: List[ElitePlan] = []
+
+    def __len__(self) -> int:
+        return len(self.plans)
+
+    def accepts(self, score: float) -> bool:
+        return len(self.plans) < self.capacity or score > self.plans[-1].score
+
+    def similar(self, plan: ElitePlan, other: ElitePlan) -> bool:
+        return jaccard_distance(plan.spots, other.spots) < self.min_distance or \
+            (plan.routes == other.routes and plan.ends == other.ends)
+
+    def offer(
+        self, score: float, routes: Sequence[Sequence[int]], ends: Sequence[int], spots: Optional[int] = None
+    ) -> bool:
+        """
+        プランを pool に加える。spots（訪問する観光地のビットマスク）を渡さない場合は routes から求める。
+        似たプランに評価値が同じか高いものがあれば加えずに False を返し、加えた場合は似たプランを取り除く。
+        """
+        if not self.accepts(score):
+            return False
+        if spots is None:
+            spots = node_mask(node for route in routes for node in route)
+        plan = ElitePlan(score, tuple(tuple(route) for route in routes), tuple(ends), spots)
+        kept = []
+        for other in self.plans:
+            if self.similar(plan, other):
+                if other.score >= score:
+                    return False
+            else:
+                kept.append(other)
+        position = next((k for k, other in enumerate(kept) if other.score < score), len(kept))
+        kept.insert(position, plan)
+        self.plans = kept[:self.capacity]
+        return True
+
+    def merge(self, other: "ElitePool") -> None:
+        for plan in other.plans:
+            self.offer(plan.score, plan.routes, plan.ends, plan.spots)
+
+    def diverse(self, count: int, reference: Optional[ElitePlan] = None) -> List[ElitePlan]:
+        """
+        評価値の高い順に count 件までプランを返す。reference を渡すと、それと似たプランを除く
+        （reference は別に返す最良プランで、似たプランはその変種にすぎないため）。
+        """
+        chosen = []
+        for plan in self.plans:
+            if len(chosen) >= count:
+                break
+            if reference is not None and self.similar(plan, reference):
+                continue
+            chosen.append(plan)
+        return chosen
+
+
+def elite_pool_size(alternatives: int) -> int:
+    return max(alternatives * ELITE_POOL_FACTOR, MIN_ELITE_POOL_SIZE)
+
+
+class ParetoPlan(NamedTuple):
+    cost: int
+    spots: int
+    travel_time: int
+    score: float
+    routes: Tuple[Tuple[int, ...], ...]
+    ends: Tuple[int, ...]
+
+
+class _Staircase:
+    """
+    観光地数が同じプランの (総費用, 移動時間) の非劣解。総費用の昇順に並べると移動時間は狭義に減少するため、
+    支配の判定も、支配されたプランの削除も bisect で位置を求めて連続区間を見るだけで済む。
+    """
+
+    def __init__(self):
+        self.costs: List[int] = []
+        self.travel_times: List[int] = []
+        self.plans: List[ParetoPlan] = []
+
+    def dominates(self, cost: int, travel_time: int) -> bool:
+        # 総費用が cost 以下のプランのうち、移動時間が最も短いのは最後のもの
+        k = bisect.bisect_right(self.costs, cost) - 1
+        return k >= 0 and self.travel_times[k] <= travel_time
+
+    def remove_dominated(self, cost: int, travel_time: int) -> int:
+        """
+        総費用が cost 以上かつ移動時間が travel_time 以上のプランを取り除き、その位置を返す。
+        """
+        start = bisect.bisect_left(self.costs, cost)
+        stop = start
+        while stop < len(self.costs) and self.travel_times[stop] >= travel_time:
+            stop += 1
+        del self.costs[start:stop], self.travel_times[start:stop], self.plans[start:stop]
+        return start
+
+    def insert(self, position: int, plan: ParetoPlan) -> None:
+        self.costs.insert(position, plan.cost)
+        self.travel_times.insert(position, plan.travel_time)
+        self.plans.insert(position, plan)
+
+
+class ParetoFront:
+    """
+    総費用（小さいほどよい）・訪問する観光地数（多いほどよい）・移動時間の合計（短いほどよい）の3つについて、
+    どのプランにも支配されないプランを保持する。3つとも同じプランは1件として扱う。
+    観光地数ごとに _Staircase を持ち、支配の判定は観光地数が同じか多い階段、削除は同じか少ない階段だけを見る。
+    """
+
+    def __init__(self):
+        self._stairs: Dict[int, _Staircase] = {}
+
+    def __len__(self) -> int:
+        return sum(len(stair.plans) for stair in self._stairs.values())
+
+    def dominated(self, cost: int, spots: int, travel_time: int) -> bool:
+        return any(
+            stair.dominates(cost, travel_time) for count, stair in self._stairs.items() if count >= spots)
+
+    def offer(
+        self, cost: int, spots: int, travel_time: int, score: float,
+        routes: Sequence[Sequence[int]], ends: Sequence[int],
+    ) -> bool:
+        if self.dominated(cost, spots, travel_time):
+            return False
+        plan = ParetoPlan(
+            cost, spots, travel_time, score, tuple(tuple(route) for route in routes), tuple(ends))
+        position = 0
+        for count, stair in list(self._stairs.items()):
+            if count <= spots:
+                removed_at = stair.remove_dominated(cost, travel_time)
+                if count == spots:
+                    position = removed_at
+                elif not stair.plans:
+                    del self._stairs[count]
+        self._stairs.setdefault(spots, _Staircase()).insert(position, plan)
+        return True
+
+    def merge(self, other: "ParetoFront") -> None:
+        for plan in other.plans():
+            self.offer(plan.cost, plan.spots, plan.travel_time, plan.score, plan.routes, plan.ends)
+
+    def plans(self) -> List[ParetoPlan]:
+        """
+        観光地数の多い順、同じなら総費用の安い順に返す。
+        """
+        return [plan for count in sorted(self._stairs, reverse=True) for plan in self._stairs[count].plans]
+
+    def spread(self, count: int) -> List[ParetoPlan]:
+        """
+        count 件までのプランを総費用の安い順に返す。まず観光地数ごとに最も安いプランのうち、観光地数を増やすと
+        総費用も増えるもの（費用と観光地数の兼ね合いの曲線）を選び、多すぎれば両端を含めて等間隔に間引く。
+        足りない分は残りのプランから総費用について等間隔に補う。
+        """
+        curve = []
+        for spots in sorted(self._stairs, reverse=True):
+            cheapest = self._stairs[spots].plans[0]
+            if not curve or cheapest.cost < curve[-1].cost:
+                curve.append(cheapest)
+        chosen = _evenly(curve[::-1], count)
+        rest = [plan for plan in sorted(self.plans(), key=lambda plan: plan.cost) if plan not in chosen]
+        chosen += _evenly(rest, count - len(chosen))
+        return sorted(chosen, key=lambda plan: (plan.cost, -plan.spots, plan.travel_time))
+
+
+def _evenly(plans: List[ParetoPlan], count: int) -> List[ParetoPlan]:
+    if len(plans) <= count:
+        return list(plans)
+    if count <= 1:
+        return plans[-count:] if count > 0 else []
+    return [plans[round(k * (len(plans) - 1) / (count - 1))] for k in range(count)]
+
+
+class PlanArchive:
+    """
+    探索中に見つかったプランを集める先。elites（別案）と front（パレート解）の使う方だけを持つ。
+    探索側は accepts(score) が True のときだけ offer を呼ぶ。
+    """
+
+    def __init__(self, elites: Optional[ElitePool] = None, front: Optional[ParetoFront] = None):
+        self.elites = elites
+        self.front = front
+
+    def accepts(self, score: float) -> bool:
+        return self.front is not None or (self.elites is not None and self.elites.accepts(score))
+
+    def offer(
+        self,
+        evaluator: DayEvaluator,
+        score: float,
+        cost: int,
+        routes: Sequence[Sequence[int]],
+        ends: Sequence[int],
+        spots: Optional[int] = None,
+    ) -> None:
+        """
+        予算内のプランを渡す。spots（訪問する観光地のビットマスク）を渡さない場合は routes から求める。
+        """
+        if spots is None:
+            spots = node_mask(node for route in routes for node in route)
+        if self.elites is not None and self.elites.accepts(score):
+            self.elites.offer(score, routes, ends, spots)
+        if self.front is not None:
+            travel_time = sum(evaluator.travel_time(route, end) for route, end in zip(routes, ends))
+            self.front.offer(cost, spots.bit_count(), travel_time, score, routes, ends)
+
+    def merge(self, other: "PlanArchive") -> None:
+        if self.elites is not None and other.elites is not None:
+            self.elites.merge(other.elites)
+        if self.front is not None and other.front is not None:
+            self.front.merge(other.front)
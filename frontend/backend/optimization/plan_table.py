@@ -0,0 +1,349 @@
+import argparse
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from optimization.beam_search import DEFAULT_BEAM_WIDTH
+from optimization.city_store import DATA_DIRECTORY, get_city_graph, load_city_store
+from optimization.itinerary import (
+    DayEvaluator, Stop, build_plan_params, format_itinerary, score_plan, split_itinerary,
+)
+from optimization.opening_hours import MINUTES_PER_DAY, opening_windows
+from optimization.search_control import STOP_PRECOMPUTED, SearchLimits
+from optimization.travel_matrix import TravelMatrices
+from optimization.travel_planner_for_backend import request_seed, search_plan, solve_exact
+
+PLAN_TABLE_PATH = os.path.join(DATA_DIRECTORY, "plan_table.json.gz")
+PLAN_TABLE_VERSION = 2
+
+# 事前計算する条件の格子。都市は CityStore の全都市
+TABLE_DAYS = (1, 2, 3)
+TABLE_PEOPLE = (1, 2, 3, 4)
+# 予算の区切り（円）。20000 円から TABLE_BUDGET_RATIO 倍ずつ、1000 円単位に丸めたもの。
+# 予算が区切りの TABLE_BUDGET_RATIO 倍以上なら、表のプランでは予算を使い残しすぎるため探索する
+TABLE_BUDGET_RATIO = 1.1
+TABLE_BUDGETS = tuple(int(round(20000 * TABLE_BUDGET_RATIO ** k, -3)) for k in range(34))
+# 出発時刻（時、分は 0 のみ）
+TABLE_START_HOURS = (8, 9, 10, 11, 12, 13)
+# 出発の曜日（日曜 0）は、営業時間の条件が同じになる曜日をまとめ、まとまりごとに1つのプランを求める（weekday_patterns）
+
+# 事前計算1件あたりの探索時間（秒）とビーム幅。リクエスト時の探索よりも長く、広く探す。
+# 焼きなましとビームサーチをそれぞれ time_limit まで回すため、1件の計算量は最大 2 × time_limit CPU 秒。
+# 最良解が PRECOMPUTE_STAGNATION_TIME 秒更新されなければ打ち切るため、多くの条件はそれより早く終わる
+PRECOMPUTE_TIME_LIMIT = 5.0
+PRECOMPUTE_STAGNATION_TIME = 1.0
+PRECOMPUTE_BEAM_WIDTH = DEFAULT_BEAM_WIDTH * 4
+
+
+def city_fingerprint(ids: Tuple[int, ...], matrices: TravelMatrices) -> str:
+    """
+    都市データ（ノードの並び・移動時間・運賃・交通手段・観光費・滞在時間・営業時間）のハッシュ。
+    データを更新した都市の表のプランは、読み込み時にこれが一致しなくなるため使われない。
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(ids), list(matrices.methods)]).encode("utf-8"))
+    for array in (matrices.edge_start, matrices.edge_end, matrices.edge_time, matrices.edge_fare, matrices.edge_mode,
+                  matrices.edge_estimated, matrices.visit_fare, matrices.staytime, matrices.is_hotel, matrices.opening):
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def table_key(city: str, weekday: int, days: int, people: int, budget: int, start_hour: int) -> str:
+    return f"{city}/{weekday}/{days}/{people}/{budget}/{start_hour}"
+
+
+def pattern_key(city: str, days: int, start_hour: int) -> str:
+    return f"{city}/{days}/{start_hour}"
+
+
+def weekday_datetime(weekday: int, start_hour: int) -> datetime:
+    """
+    曜日 weekday（日曜 0）の start_hour 時に出発する日時。2000-01-02 は日曜。
+    """
+    return datetime(2000, 1, 2 + weekday, start_hour)
+
+
+def weekday_patterns(matrices: TravelMatrices, days: int, start_hour: int) -> List[int]:
+    """
+    曜日（日曜 0）ごとに、その曜日に出発する旅程の営業時間の条件（opening_windows）と同じ条件になる最初の曜日を返す。
+    表のプランは代表の曜日についてだけ求め、同じ条件の曜日はそれを使う。営業時間の情報がない都市では全曜日が日曜にまとまる。
+    """
+    representatives = []
+    patterns = []
+    for weekday in range(7):
+        windows = opening_windows(matrices.opening, matrices.staytime, matrices.is_spot,
+                                  weekday * MINUTES_PER_DAY + start_hour * 60, days)
+        for representative, other in patterns:
+            if np.array_equal(windows.earliest, other.earliest) and np.array_equal(windows.latest, other.latest):
+                representatives.append(representative)
+                break
+        else:
+            patterns.append((weekday, windows))
+            representatives.append(weekday)
+    return representatives
+
+
+def budget_bucket(budget: int) -> Optional[int]:
+    """
+    予算 budget のリクエストに使う表の予算の区切り（budget 以下で最大のもの）。
+    表のプランは区切りの予算内に収まるため、budget でもそのまま予算内になる。
+    """
+    k = bisect.bisect_right(TABLE_BUDGETS, budget) - 1
+    if k < 0 or budget >= TABLE_BUDGETS[k] * TABLE_BUDGET_RATIO:
+        return None
+    return TABLE_BUDGETS[k]
+
+
+def _encode_plan(graph, stops: List[List[Stop]], score: float) -> Dict[str, Any]:
+    """
+    停留所リストを、ノード index の代わりに目的地 ID を入れた整数の列（Stop.__slots__ の順）にする。
+    """
+    return {
+        "score": score,
+        "days": [
+            [[graph.ids[stop.destination_id] if name == "destination_id" else getattr(stop, name)
+              for name in Stop.__slots__] for stop in day_plan]
+            for day_plan in stops
+        ],
+    }
+
+
+def _decode_plan(graph, plan: Dict[str, Any]) -> List[List[Stop]]:
+    index_of = graph.index_of
+    stops = []
+    for day_plan in plan["days"]:
+        day_stops = []
+        for fields in day_plan:
+            stop = Stop(*fields)
+            stop.destination_id = index_of[stop.destination_id]
+            day_stops.append(stop)
+        stops.append(day_stops)
+    return stops
+
+
+def precompute_plan(
+    city: str, weekday: int, budget: int, days: int, people: int, start_hour: int,
+    time_limit: float = PRECOMPUTE_TIME_LIMIT,
+) -> Optional[Tuple[List[List[Stop]], float]]:
+    """
+    格子の1条件（曜日 weekday に出発）について、厳密解（日帰りで候補が少ない場合）か、焼きなましと幅の広いビームサーチのうち
+    評価値の高い方のプランを求める。大阪駅に戻れるプランがなければ None。
+    """
+    start_datetime_str = weekday_datetime(weekday, start_hour).isoformat()
+    graph = get_city_graph(city)
+    params = build_plan_params(budget, days, people, start_datetime_str)
+    limits = SearchLimits(time_limit=time_limit, stagnation_time=PRECOMPUTE_STAGNATION_TIME)
+    exact = solve_exact(graph.matrices, params, limits)
+    if exact is not None:
+        return exact[0], exact[1]
+    rng = random.Random(request_seed(city, budget, days, people, start_datetime_str))
+    best = None
+    for optimizer in ("annealing", "beam"):
+        stops, score, _ = search_plan(graph.matrices, params, optimizer, limits, rng, PRECOMPUTE_BEAM_WIDTH)
+        if stops and (best is None or score > best[1]):
+            best = (stops, score)
+    return best
+
+
+def _precompute_cell(city: str, weekday: int, days: int, people: int, budget: int, start_hour: int, time_limit: float):
+    result = precompute_plan(city, weekday, budget, days, people, start_hour, time_limit)
+    if result is None:
+        return None
+    stops, score = result
+    return _encode_plan(get_city_graph(city), stops, score)
+
+
+def build_plan_table(
+    path: str = PLAN_TABLE_PATH,
+    data_directory: str = DATA_DIRECTORY,
+    cities: Optional[List[str]] = None,
+    time_limit: float = PRECOMPUTE_TIME_LIMIT,
+    workers: int = os.cpu_count() or 1,
+) -> int:
+    """
+    格子の全条件のプランをワーカープロセスで並列に求め、gzip 圧縮した JSON として path に書き出す。
+    曜日は営業時間の条件が同じになるまとまり（weekday_patterns）ごとに1回だけ求め、曜日から代表の曜日への対応も表に入れる。
+    書き出したプランの数を返す。
+    """
+    store = load_city_store(data_directory)
+    cities = list(cities or store.cities)
+    fingerprints = {city: city_fingerprint(store.get(city).ids, store.get(city).matrices) for city in cities}
+    weekdays = {
+        pattern_key(city, days, start_hour): weekday_patterns(store.get(city).matrices, days, start_hour)
+        for city in cities for days in TABLE_DAYS for start_hour in TABLE_START_HOURS
+    }
+    cells = [
+        (city, weekday, days, people, budget, start_hour)
+        for city in cities for days in TABLE_DAYS for start_hour in TABLE_START_HOURS
+        for weekday in sorted(set(weekdays[pattern_key(city, days, start_hour)]))
+        for people in TABLE_PEOPLE for budget in TABLE_BUDGETS
+    ]
+    # 1件あたり最大 2 × time_limit 秒（焼きなましとビームサーチ）。停滞で打ち切られるため、実際はこれより短い
+    cpu_hours = len(cells) * 2 * time_limit / 3600
+    print(f"{len(cells)} 件を事前計算します（最大 {cpu_hours:.1f} CPU 時間、{workers} ワーカーで最大 {cpu_hours / workers:.1f} 時間）")
+    plans = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_city_store, initargs=(data_directory,)) as pool:
+        futures = {pool.submit(_precompute_cell, *cell, time_limit): cell for cell in cells}
+        for done, future in enumerate(as_completed(futures), 1):
+            plan = future.result()
+            if plan is not None:
+                plans[table_key(*futures[future])] = plan
+            if done % 100 == 0 or done == len(cells):
+                print(f"{done}/{len(cells)} 件（{time.perf_counter() - start:.0f} 秒）")
+
+    table = {
+        "version": PLAN_TABLE_VERSION, "cities": fingerprints, "weekdays": weekdays, "plans": dict(sorted(plans.items())),
+    }
+    temporary = f"{path}.tmp"
+    with gzip.open(temporary, "wt", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporary, path)
+    return len(plans)
+
+
+class PlanTable:
+    """
+    事前計算したプランの表。都市データのハッシュが表の作成時と一致する都市のプランだけを持つ。
+    weekdays は pattern_key ごとの、曜日（日曜 0）から表のプランを求めた代表の曜日への対応（weekday_patterns）。
+    """
+
+    def __init__(self, plans: Dict[str, Dict[str, Any]], weekdays: Optional[Dict[str, List[int]]] = None):
+        self._plans = plans
+        self._weekdays = weekdays or {}
+        # (表のキー, 出発の曜日) ごとの、確かめ直した停留所リスト（条件を満たさなければ None）
+        self._checked: Dict[Tuple[str, int], Optional[List[List[Stop]]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._plans.get(key)
+
+    def representative(self, city: str, days: int, start_hour: int, weekday: int) -> Optional[int]:
+        weekdays = self._weekdays.get(pattern_key(city, days, start_hour))
+        return None if weekdays is None else weekdays[weekday]
+
+    def checked_stops(
+        self, key: str, weekday: int, check: Callable[[], Optional[List[List[Stop]]]],
+    ) -> Optional[List[List[Stop]]]:
+        """
+        表のプラン key を曜日 weekday の出発で確かめ直した停留所リスト（条件を満たさなければ None）。
+        check を呼んで確かめるのは (key, weekday) ごとに最初の1回だけで、以降は覚えておいた結果を返す。
+        """
+        checked_key = (key, weekday)
+        if checked_key not in self._checked:
+            self._checked[checked_key] = check()
+        return self._checked[checked_key]
+
+
+def read_plan_table(path: str = PLAN_TABLE_PATH) -> PlanTable:
+    """
+    表を読み込む。ファイルがない、版が違う場合は空の表を返す（すべてのリクエストを探索で処理する）。
+    """
+    if not os.path.exists(path):
+        return PlanTable({})
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        table = json.load(f)
+    if table.get("version") != PLAN_TABLE_VERSION:
+        return PlanTable({})
+    store = load_city_store()
+    valid = {
+        city for city, fingerprint in table["cities"].items()
+        if city in store.cities and city_fingerprint(store.get(city).ids, store.get(city).matrices) == fingerprint
+    }
+    return PlanTable(
+        {key: plan for key, plan in table["plans"].items() if key.split("/", 1)[0] in valid},
+        {key: weekdays for key, weekdays in table["weekdays"].items() if key.split("/", 1)[0] in valid},
+    )
+
+
+_plan_table: Optional[PlanTable] = None
+_plan_table_lock = threading.Lock()
+
+
+def load_plan_table(path: str = PLAN_TABLE_PATH) -> PlanTable:
+    """
+    プロセス全体で共有する PlanTable を返す。初回呼び出し時のみファイルを読み込む。
+    """
+    global _plan_table
+    if _plan_table is None:
+        with _plan_table_lock:
+            if _plan_table is None:
+                _plan_table = read_plan_table(path)
+    return _plan_table
+
+
+def lookup_plan(city: str, budget: int, days: int, people: int, start_datetime_str: str) -> Optional[json]:
+    """
+    リクエストが格子上（出発が TABLE_START_HOURS の正時、予算が区切りの TABLE_BUDGET_RATIO 倍未満）なら、
+    事前計算したプランを開始日時に合わせて plan_itenerary と同じ形式で返す。格子外や表にない場合は None。
+    表のプランは開始日の曜日と営業時間の条件が同じ曜日で求めたものを使う。念のため日ごとに条件を確かめ直し、
+    営業時間外に着く観光地がある場合も None（探索で処理する）。確かめ直した結果は表のプランと曜日ごとに覚えておくため、
+    同じ条件の2回目以降のリクエストでは DayEvaluator を作らず、出力の形に直すだけで返す。
+    """
+    start_datetime = datetime.fromisoformat(start_datetime_str)
+    if start_datetime.minute != 0 or start_datetime.second != 0:
+        return None
+    bucket = budget_bucket(budget)
+    if bucket is None:
+        return None
+    table = load_plan_table()
+    # datetime.weekday() は月曜 0、表の曜日は日曜 0 から数える
+    weekday = table.representative(city, days, start_datetime.hour, (start_datetime.weekday() + 1) % 7)
+    if weekday is None:
+        return None
+    key = table_key(city, weekday, days, people, bucket, start_datetime.hour)
+    plan = table.get(key)
+    if plan is None:
+        return None
+    graph = get_city_graph(city)
+
+    def check() -> Optional[List[List[Stop]]]:
+        # 日ごとの条件は出発の曜日と時刻・日数・人数で決まり、予算には依らない（表のプランは区切りの予算内）
+        stops = _decode_plan(graph, plan)
+        evaluator = DayEvaluator(graph.matrices, build_plan_params(budget, days, people, start_datetime_str))
+        routes, ends = split_itinerary(graph.matrices, stops)
+        for day, (route, end) in enumerate(zip(routes, ends)):
+            if evaluator.evaluate(route, end, day) is None:
+                return None
+        return stops
+
+    stops = table.checked_stops(key, start_datetime.weekday(), check)
+    if stops is None:
+        return None
+    itinerary = format_itinerary(graph, stops, start_datetime_str)
+    total_cost = sum(stop.total_cost for day_plan in stops for stop in day_plan)
+    itinerary["search"] = {
+        "stop_reason": STOP_PRECOMPUTED,
+        "score": score_plan(sum(len(day_plan) for day_plan in stops), total_cost, budget),
+        "budget_bucket": bucket,
+    }
+    return json.dumps(itinerary, indent=2, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="よく使われる条件の旅行プランを事前計算して表にする")
+    parser.add_argument("--output", default=PLAN_TABLE_PATH)
+    parser.add_argument("--data", default=DATA_DIRECTORY)
+    parser.add_argument("--cities", nargs="*", default=None)
+    parser.add_argument("--time-limit", type=float, default=PRECOMPUTE_TIME_LIMIT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    count = build_plan_table(args.output, args.data, args.cities, args.time_limit, args.workers)
+    print(f"{count} 件のプランを {args.output} に書き出しました。")
+
+
+if __name__ == "__main__":
+    # 例: python -m optimization.plan_table --time-limit 5 --workers 8
+    main()
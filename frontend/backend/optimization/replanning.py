@@ -0,0 +1,140 @@
+import json
+import random
+from typing import Any, Dict, List, Optional, Sequence
+
+from optimization.annealing import anneal
+from optimization.city_store import get_city_graph
+from optimization.itinerary import NO_HOTEL, DayEvaluator, build_plan_params, format_itinerary, score_plan, split_day
+from optimization.local_search import improve_plan
+from optimization.search_control import (
+    DEFAULT_STAGNATION_TIME,
+    DEFAULT_TIME_LIMIT,
+    MAX_ITERATIONS,
+    MAX_TIME_LIMIT,
+    SearchController,
+    SearchLimits,
+)
+from optimization.travel_matrix import node_mask
+from optimization.travel_planner_for_backend import request_seed
+
+
+def _day_nodes(graph, route: Sequence[Dict[str, Any]], days: int) -> List[List[int]]:
+    """
+    plan_itenerary の出力の "route"（停留所に destination_id と day を含む）を、日ごとのノード index 列に戻す。
+    """
+    day_nodes = [[] for _ in range(days)]
+    for stop in route:
+        day = stop.get("day")
+        if day is None or not 0 <= day < days:
+            raise ValueError(f"停留所の日付 {day} が旅行日数の範囲外です。")
+        dest_id = stop.get("destination_id")
+        if dest_id not in graph.index_of:
+            raise ValueError(f"目的地 ID {dest_id} が見つかりません。")
+        day_nodes[day].append(graph.index_of[dest_id])
+    return day_nodes
+
+
+def _initial_day(evaluator: DayEvaluator, day: int, route: List[int], end: int, locked: int):
+    """
+    作り直す日の初期解。固定した観光地だけを残したルートから始め、終点は元のホテル（固定されていなければ
+    泊まらない場合も試す）。どれも条件を満たさない場合は元のルートをそのまま使う。
+    """
+    days = evaluator.params.days
+    kept = [node for node in route if locked >> node & 1]
+    if day == days - 1:
+        options = [(kept, 0), (route, 0)]
+    elif end != NO_HOTEL and locked >> end & 1:
+        options = [(kept, end), (route, end)]
+    else:
+        options = [(kept, end), (kept, NO_HOTEL), (route, end)]
+    for option_route, option_end in options:
+        if evaluator.evaluate(option_route, option_end, day) is not None:
+            return option_route, option_end
+    raise ValueError(f"{day + 1} 日目の固定した停留所を時間内に回れません。")
+
+
+def replan_itenerary(
+    city: str,
+    budget: int,
+    days: int,
+    people: int,
+    start_datetime_str: str,
+    route: Sequence[Dict[str, Any]],
+    locked_days: Sequence[int] = (),
+    locked_stops: Sequence[int] = (),
+    time_limit: float = DEFAULT_TIME_LIMIT,
+    seed: Optional[int] = None,
+    max_iterations: Optional[int] = None,
+) -> json:
+    """
+    既存のプランのうち固定した部分を残し、残りだけを作り直す。
+
+    route: plan_itenerary の出力の "route"
+    locked_days: そのまま残す日（0 始まり）
+    locked_stops: 作り直す日でもプランから外さない観光地・ホテルの目的地 ID
+
+    作り直す日は固定した観光地だけから始め、挿入と焼きなましで埋める。予算と訪問済みの観光地は固定した部分の分を
+    差し引いた状態から探索し、探索時間も time_limit を作り直す日の割合で縮める。
+    固定した日だけで予算を超える場合や、固定した停留所を残すと予算内に収まらない場合は ValueError。
+    出力の形式は plan_itenerary と同じ。
+    """
+    params = build_plan_params(budget, days, people, start_datetime_str)
+    graph = get_city_graph(city)
+    matrices = graph.matrices
+    evaluator = DayEvaluator(matrices, params)
+
+    locked_days = sorted(set(locked_days))
+    if any(not 0 <= day < days for day in locked_days):
+        raise ValueError("固定する日が旅行日数の範囲外です。")
+    unknown = [dest_id for dest_id in locked_stops if dest_id not in graph.index_of]
+    if unknown:
+        raise ValueError(f"目的地 ID {unknown} が見つかりません。")
+    locked = node_mask(graph.index_of[dest_id] for dest_id in locked_stops)
+
+    routes = []
+    ends = []
+    for day, nodes in enumerate(_day_nodes(graph, route, days)):
+        day_route, end = split_day(nodes, matrices)
+        if day in locked_days:
+            if evaluator.evaluate(day_route, end, day) is None:
+                raise ValueError(f"固定した {day + 1} 日目のプランが時間の条件を満たしません。")
+        else:
+            day_route, end = _initial_day(evaluator, day, day_route, end, locked)
+        routes.append(day_route)
+        ends.append(end)
+    # 固定した日はそのまま返すため、それだけで予算を超える場合は作り直せない
+    locked_charge = sum(evaluator.evaluate(routes[day], ends[day], day)[2] for day in locked_days)
+    if locked_charge > budget:
+        raise ValueError(f"固定した日の費用 {locked_charge} 円が予算 {budget} 円を超えています。")
+
+    free_days = [day for day in range(days) if day not in locked_days]
+    if max_iterations is not None:
+        max_iterations = min(max(int(max_iterations), 0), MAX_ITERATIONS)
+    limits = SearchLimits(
+        time_limit=min(max(float(time_limit), 0.0), MAX_TIME_LIMIT) * len(free_days) / days,
+        max_iterations=max_iterations,
+        stagnation_time=None if max_iterations is not None else DEFAULT_STAGNATION_TIME,
+    )
+    controller = SearchController(limits)
+    if seed is None:
+        seed = request_seed(city, budget, days, people, start_datetime_str)
+    rng = random.Random(seed)
+
+    if free_days:
+        routes, num_stops, total_cost = improve_plan(evaluator, routes, ends, free_days)
+        controller.record(score_plan(num_stops, total_cost, budget))
+        # 焼きなましは初期解を最良解として始めるため、結果が初期解より悪くなることはない
+        result = anneal(evaluator, routes, ends, controller, rng=rng, locked_days=locked_days, locked=locked)
+        routes, ends = result.routes, result.ends
+    # 固定した停留所の分だけで予算を超えると、焼きなましは予算内のプランを見つけられず初期解を返す
+    charge = sum(evaluator.evaluate(day_route, end, day)[2] for day, (day_route, end) in enumerate(zip(routes, ends)))
+    if charge > budget:
+        raise ValueError(f"固定した停留所を残したまま予算 {budget} 円に収まるプランが見つかりません（{charge} 円）。")
+
+    stops = [evaluator.stops(day_route, end, day) for day, (day_route, end) in enumerate(zip(routes, ends))]
+    report = controller.report()
+    report["seed"] = seed
+    report["locked_days"] = locked_days
+    itinerary = format_itinerary(graph, stops, start_datetime_str)
+    itinerary["search"] = report
+    return json.dumps(itinerary, indent=2, ensure_ascii=False)
@@ -0,0 +1,144 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+# 探索を打ち切った理由
+STOP_DEADLINE = "deadline"
+STOP_STAGNATION_ITERATIONS = "stagnation_iterations"
+STOP_STAGNATION_TIME = "stagnation_time"
+STOP_ITERATION_LIMIT = "iteration_limit"
+STOP_INFEASIBLE = "infeasible"
+STOP_OPTIMAL = "optimal"
+STOP_COMPLETED = "completed"
+# 探索せず、事前計算したプラン表（plan_table）から返した
+STOP_PRECOMPUTED = "precomputed"
+
+DEFAULT_TIME_LIMIT = 1.5
+# リクエストごとに指定できる探索時間の上限（秒）
+MAX_TIME_LIMIT = 5.0
+DEFAULT_STAGNATION_TIME = 0.3
+# リクエストごとに指定できる反復数の上限
+MAX_ITERATIONS = 2000000
+
+
+@dataclass(frozen=True)
+class SearchLimits:
+    """
+    探索の打ち切り条件。ワーカープロセスにもそのまま渡せるよう値だけを持つ。
+    反復数は焼きなましの近傍評価1回を 1 とした作業量で数える（貪欲法の1プラン構築は should_stop の weight 分）。
+
+    time_limit: 探索全体の締め切り（秒）
+    max_iterations: 反復数の上限（None で無効）。指定した場合、探索の進み具合（温度や段階の切り替え）を
+        経過時間ではなく反復数で測るため、同じ乱数シードからは同じプランが得られる。
+        time_limit は暴走を防ぐ安全弁として残り、それが先に効いた場合は stop_reason が "deadline" になる。
+    stagnation_iterations: 最良解が更新されないまま、この反復数が経過したら打ち切る（None で無効）
+    stagnation_time: 最良解が更新されないまま、この秒数が経過したら打ち切る（None で無効）。
+        ただし「最良解を見つけるまでにかかった時間」の方が長ければ、そちらだけ待つ。
+        焼きなましのように後半で解が伸びる探索を、高温のうちに打ち切らないため。
+    """
+    time_limit: float = DEFAULT_TIME_LIMIT
+    max_iterations: Optional[int] = None
+    stagnation_iterations: Optional[int] = None
+    stagnation_time: Optional[float] = DEFAULT_STAGNATION_TIME
+
+
+class SearchController:
+    """
+    いつ止めても最良解を返せる（anytime）探索のための打ち切り判定。
+    探索側は反復ごとに should_stop() を呼び、最良解を更新したら record() で知らせる。
+    停滞による打ち切りは、最初の解が見つかってから数え始める。
+    """
+
+    def __init__(self, limits: SearchLimits):
+        self.limits = limits
+        self.start = time.perf_counter()
+        self.iterations = 0
+        self.best_score = None
+        self.best_iteration = 0
+        self.best_time = self.start
+        self.stop_reason = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def record(self, score: float) -> bool:
+        """
+        評価値 score の解を見つけたことを記録し、最良解を更新したかどうかを返す。
+        """
+        if self.best_score is not None and score <= self.best_score:
+            return False
+        self.best_score = score
+        self.best_iteration = self.iterations
+        self.best_time = time.perf_counter()
+        return True
+
+    def stop(self, reason: str) -> None:
+        if self.stop_reason is None:
+            self.stop_reason = reason
+
+    def stop_infeasible(self) -> None:
+        """
+        実行可能な解が1つもないまま探索を終えたことを記録する。締め切りなどで先に止まっていても、
+        解がないことを打ち切り理由にする（解が1つでもあれば、その時点の最良解を返すため呼ばない）。
+        """
+        self.stop_reason = STOP_INFEASIBLE
+
+    def mark(self) -> Tuple[float, int]:
+        """
+        探索の段階の開始点を返す。progress() に渡すと、その時点から残っていた予算の消化割合がわかる。
+        """
+        return self.elapsed(), self.iterations
+
+    def progress(self, mark: Tuple[float, int] = (0.0, 0)) -> float:
+        """
+        mark 以降に残りの予算（max_iterations があれば反復数、なければ締め切りまでの時間）を
+        どれだけ使ったかを 0〜1 で返す。
+        """
+        limits = self.limits
+        if limits.max_iterations is not None:
+            used, total = self.iterations - mark[1], limits.max_iterations - mark[1]
+        else:
+            used, total = self.elapsed() - mark[0], limits.time_limit - mark[0]
+        if total <= 0:
+            return 1.0
+        return min(used / total, 1.0)
+
+    def should_stop(self, weight: int = 1) -> bool:
+        """
+        weight 反復ぶん数えて、打ち切り条件のどれかを満たしたら True を返す（理由は stop_reason に残る）。
+        """
+        if self.stop_reason is not None:
+            return True
+        self.iterations += weight
+        now = time.perf_counter()
+        limits = self.limits
+        if limits.max_iterations is not None and self.iterations > limits.max_iterations:
+            self.stop_reason = STOP_ITERATION_LIMIT
+        elif now - self.start >= limits.time_limit:
+            self.stop_reason = STOP_DEADLINE
+        elif self.best_score is not None:
+            if limits.stagnation_iterations is not None and self.iterations - self.best_iteration >= limits.stagnation_iterations:
+                self.stop_reason = STOP_STAGNATION_ITERATIONS
+            elif limits.stagnation_time is not None and now - self.best_time >= max(
+                    limits.stagnation_time, self.best_time - self.start):
+                self.stop_reason = STOP_STAGNATION_TIME
+        return self.stop_reason is not None
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "stop_reason": self.stop_reason or STOP_COMPLETED,
+            "iterations": self.iterations,
+            "elapsed_ms": round(self.elapsed() * 1000, 1),
+            "best_found_ms": round((self.best_time - self.start) * 1000, 1),
+        }
+
+
+def merge_reports(reports, best_index: int) -> Dict[str, Any]:
+    """
+    並列に走らせた探索のレポートをまとめる。打ち切り理由は採用したプランを出した探索のもの。
+    """
+    merged = dict(reports[best_index])
+    merged["iterations"] = sum(report["iterations"] for report in reports)
+    merged["elapsed_ms"] = max(report["elapsed_ms"] for report in reports)
+    merged["workers"] = len(reports)
+    return merged
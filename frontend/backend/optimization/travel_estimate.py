@@ -0,0 +1,94 @@
+from typing import Any, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+# 交通手段を決める距離の区間の数（実データの距離の分位点で区切る）
+ESTIMATE_DISTANCE_BINS = 8
+# 交通手段ごとに直線を当てはめるのに必要なレコード数。足りない手段は全レコードで当てはめた直線を使う
+ESTIMATE_MIN_RECORDS = 5
+
+
+def node_locations(ids: Sequence[int], dest_by_id: Mapping[int, Mapping[str, Any]]) -> np.ndarray:
+    """
+    ノードごとの (緯度, 経度)（度）の (ノード数, 2) 配列。位置がわからないノードと大阪駅（index 0）は NaN。
+    """
+    locations = np.full((len(ids), 2), np.nan)
+    for index, dest_id in enumerate(ids[1:], start=1):
+        location = dest_by_id[dest_id].get("location") or {}
+        if location.get("lat") is not None and location.get("lng") is not None:
+            locations[index] = location["lat"], location["lng"]
+    return locations
+
+
+def great_circle_km(origin: np.ndarray, destination: np.ndarray) -> np.ndarray:
+    """
+    (緯度, 経度) の配列どうしの大円距離（km、haversine）。どちらかが NaN なら NaN。
+    """
+    lat1, lng1 = np.radians(origin[..., 0]), np.radians(origin[..., 1])
+    lat2, lng2 = np.radians(destination[..., 0]), np.radians(destination[..., 1])
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+class TravelEstimator:
+    """
+    都市内の移動データから当てはめた、距離による移動時間・運賃の見積もり。
+    交通手段は距離の区間ごとに実データで最も多い手段とし、移動時間と運賃はその手段の「切片 + 傾き × 距離」で求める。
+    """
+
+    def __init__(self, bin_edges: np.ndarray, bin_modes: np.ndarray, time_lines: np.ndarray, fare_lines: np.ndarray):
+        self.bin_edges = bin_edges
+        self.bin_modes = bin_modes
+        self.time_lines = time_lines
+        self.fare_lines = fare_lines
+
+    def estimate(self, distance: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        距離（km）ごとの (移動時間（分、1 以上）, 運賃（円）, 交通手段のコード)。
+        """
+        modes = self.bin_modes[np.searchsorted(self.bin_edges, distance, side="right")]
+        time = self.time_lines[modes, 0] + self.time_lines[modes, 1] * distance
+        fare = self.fare_lines[modes, 0] + self.fare_lines[modes, 1] * distance
+        return np.maximum(np.rint(time), 1).astype(np.int32), np.rint(fare).astype(np.int32), modes.astype(np.int16)
+
+
+def _fit_line(distance: np.ndarray, values: np.ndarray) -> Tuple[float, float]:
+    """
+    values ≒ 切片 + 傾き × distance を最小二乗で当てはめる。切片と傾きは負にしない。
+    """
+    if len(distance) < 2 or np.ptp(distance) == 0:
+        return float(values.mean()) if len(values) else 0.0, 0.0
+    slope, intercept = np.polyfit(distance, values, 1)
+    if slope < 0:
+        return float(values.mean()), 0.0
+    return max(float(intercept), 0.0), float(slope)
+
+
+def fit_travel_estimator(
+    distance: np.ndarray, time: np.ndarray, fare: np.ndarray, mode: np.ndarray, method_count: int
+) -> Optional[TravelEstimator]:
+    """
+    実データの移動（距離 km・移動時間・運賃・交通手段のコード）から TravelEstimator を作る。
+    当てはめに使える移動がなければ None（見積もらない）。
+    """
+    if len(distance) == 0:
+        return None
+    bins = min(ESTIMATE_DISTANCE_BINS, len(distance))
+    bin_edges = np.unique(np.quantile(distance, np.linspace(0, 1, bins + 1))[1:-1])
+    bin_of = np.searchsorted(bin_edges, distance, side="right")
+    bin_modes = np.array([
+        np.bincount(mode[bin_of == k], minlength=method_count).argmax() if np.any(bin_of == k) else 0
+        for k in range(len(bin_edges) + 1)
+    ])
+    pooled = (_fit_line(distance, time), _fit_line(distance, fare))
+    time_lines = np.empty((method_count, 2))
+    fare_lines = np.empty((method_count, 2))
+    for code in range(method_count):
+        used = mode == code
+        if used.sum() >= ESTIMATE_MIN_RECORDS:
+            time_lines[code] = _fit_line(distance[used], time[used])
+            fare_lines[code] = _fit_line(distance[used], fare[used])
+        else:
+            time_lines[code], fare_lines[code] = pooled
+    return TravelEstimator(bin_edges, bin_modes, time_lines, fare_lines)
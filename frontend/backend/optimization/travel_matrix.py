@@ -0,0 +1,728 @@
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from optimization.opening_hours import build_opening_table
+from optimization.travel_estimate import TravelEstimator, fit_travel_estimator, great_circle_km, node_locations
+
+# 移動情報が存在しないペアの番兵値（従来の .get(..., 1000000) と同じ値）
+INF_TIME = 1000000
+INF_FARE = 1000000
+NO_MODE = -1
+# 旅程を終えられない場合の予算差引額の下界（どの予算よりも大きい値）
+INF_CHARGE = 1 << 40
+# 候補リストの空き要素
+NO_CANDIDATE = -1
+
+# 各ノードの次の観光地候補: 移動時間が短い順、運賃が安い順にそれぞれこの数と、多様性のためのランダムな数
+CANDIDATE_NEAREST = 10
+CANDIDATE_CHEAPEST = 10
+CANDIDATE_RANDOM = 4
+
+# ノード数がこれを超える都市は、移動情報を密行列に展開せず CSR（疎行列）だけで持つ
+DENSE_MAX_NODES = 1000
+# CSR だけで持つ都市のノード間の移動時間の上限（分）。これより長い移動は持たない（大阪駅との移動は常に持つ）
+SPARSE_MAX_TRAVEL_TIME = 180
+# CSR だけで持つ都市で、移動データのないペアを距離から見積もって足すのは、各ノードから近いこの数のノードと、
+# 1日の終わりに泊まれるよう近いこの数のホテルまで
+ESTIMATE_SPARSE_NEIGHBORS = 30
+ESTIMATE_SPARSE_HOTELS = 5
+# CSR だけで持つ都市の hotel_order に載せる、各ノードから近いホテルの数。
+# 最も近い未訪問ホテルを探すのに使い、チェックアウト済みのホテル（高々宿泊数）を除いても残るだけあればよい
+SPARSE_HOTEL_ORDER = 16
+
+
+@dataclass(frozen=True)
+class TravelMatrices:
+    """
+    都市内の全ノード（index 0 = 大阪駅）間の移動時間・運賃・交通手段を保持する。
+
+    移動情報は CSR 形式（疎行列）で持つ。ノード i から移動情報のあるノードは edge_end[edge_start[i]:edge_start[i + 1]]
+    （index の昇順）で、その移動時間（分）・運賃（円）・交通手段（methods のインデックス）が edge_time / edge_fare / edge_mode。
+    ノード数が DENSE_MAX_NODES 以下の都市は、同じ内容の密行列も time[i, j] / fare[i, j] / mode[i, j] に持ち
+    （移動情報がないペアは INF_TIME / INF_FARE / NO_MODE）、それより大きい都市では (0, 0) の空配列にする（dense を参照）。
+    ペアの移動情報は密行列の有無によらず travel / has_edge / method で引き、行全体は neighbors でたどる。
+    edge_estimated は、移動データがなく大円距離から見積もった移動（estimate_missing_pairs を参照）かどうか。
+    visit_fare / staytime / is_hotel / is_spot はノードごとの属性。
+    hotel_column[i] はホテル i の hotel_indices での位置（ホテル以外は -1）。
+    hotel_order[i] はノード i から行けるホテル（ノード index）を移動時間の短い順に並べたもので、
+    hotel_order_time[i] はその移動時間（空きは大阪駅の index 0 と INF_TIME）。密行列を持たない都市では近い SPARSE_HOTEL_ORDER 件まで。
+    hotel_time[i, h] / hotel_fare[i, h] はノード i からホテル hotel_indices[h] への移動時間と、運賃 + 宿泊費（1人分、
+    行けない場合は INF_CHARGE）。宿泊先の選択を、ホテルごとのループではなく行のまとめた演算で判定するために使う。
+    ノード数 × ホテル数になるため密行列を持つ都市だけが持ち、それより大きい都市では (0, ホテル数) の空配列にする。
+    どちらの都市でも行は hotel_reach で引く。
+    candidates[i] はノード i から次に訪れる観光地の候補リスト（build_candidate_lists を参照）。
+    return_fare[i] / hotel_charge[i] はノード i から旅程を終えるのにかかる額の下界で、大阪駅へ帰る運賃と、
+    いずれかのホテルへの運賃 + 宿泊費の最小値（1人分）。行けない場合は INF_CHARGE。
+    opening[i] は観光地 i の営業時間を週の分（日曜 0:00 から）の [開店, 閉店) の区間で並べたもの
+    （build_opening_table を参照。リクエストの日時に合わせた到着時刻の範囲は opening_hours.opening_windows で作る）。
+    すべての配列は書き込み不可にしてあり、スレッド間で共有できる。
+    探索中のスカラー参照用の行（time_rows など）は都市ごとに最初に使ったときに一度だけ作り、全リクエストで共有する。
+    """
+    time: np.ndarray
+    fare: np.ndarray
+    mode: np.ndarray
+    methods: Tuple[str, ...]
+    edge_start: np.ndarray
+    edge_end: np.ndarray
+    edge_time: np.ndarray
+    edge_fare: np.ndarray
+    edge_mode: np.ndarray
+    edge_estimated: np.ndarray
+    visit_fare: np.ndarray
+    staytime: np.ndarray
+    is_hotel: np.ndarray
+    is_spot: np.ndarray
+    spot_indices: np.ndarray
+    hotel_indices: np.ndarray
+    hotel_column: np.ndarray
+    hotel_order: np.ndarray
+    hotel_order_time: np.ndarray
+    hotel_time: np.ndarray
+    hotel_fare: np.ndarray
+    candidates: np.ndarray
+    return_fare: np.ndarray
+    hotel_charge: np.ndarray
+    opening: np.ndarray
+
+    @property
+    def size(self) -> int:
+        return len(self.visit_fare)
+
+    @property
+    def dense(self) -> bool:
+        return len(self.time) == self.size
+
+    def neighbors(self, i: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        ノード i から移動情報のあるノード（index の昇順）と、その移動時間・運賃。
+        """
+        start, stop = self.edge_start[i], self.edge_start[i + 1]
+        return self.edge_end[start:stop], self.edge_time[start:stop], self.edge_fare[start:stop]
+
+    def _edge(self, i: int, j: int) -> int:
+        ends = self.neighbors(i)[0]
+        k = int(np.searchsorted(ends, j))
+        return int(self.edge_start[i]) + k if k < len(ends) and ends[k] == j else -1
+
+    def travel(self, i: int, nodes):
+        """
+        ノード i から nodes（ノード index か、その配列）への (移動時間, 運賃)。移動情報がなければ INF_TIME / INF_FARE。
+        """
+        if self.dense:
+            return self.time[i, nodes], self.fare[i, nodes]
+        ends, times, fares = self.neighbors(i)
+        if len(ends) == 0:
+            return np.full(np.shape(nodes), INF_TIME, dtype=np.int32), np.full(np.shape(nodes), INF_FARE, dtype=np.int32)
+        k = np.minimum(np.searchsorted(ends, nodes), len(ends) - 1)
+        found = ends[k] == nodes
+        return np.where(found, times[k], INF_TIME), np.where(found, fares[k], INF_FARE)
+
+    def has_edge(self, i: int, j: int) -> bool:
+        if self.dense:
+            return self.mode[i, j] != NO_MODE
+        return self._edge(i, j) >= 0
+
+    def method(self, i: int, j: int) -> Any:
+        if self.dense:
+            code = self.mode[i, j]
+        else:
+            k = self._edge(i, j)
+            code = NO_MODE if k < 0 else self.edge_mode[k]
+        return None if code == NO_MODE else self.methods[code]
+
+    def is_estimated(self, i: int, j: int) -> bool:
+        """
+        ノード i → j の移動が、移動データではなく距離からの見積もりかどうか。
+        """
+        k = self._edge(i, j)
+        return k >= 0 and bool(self.edge_estimated[k])
+
+    def hotel_reach(self, nodes):
+        """
+        nodes（ノード index か、その配列）から各ホテルへの (移動時間, 運賃 + 宿泊費（1人分）) の行。
+        hotel_time[nodes] / hotel_fare[nodes] と同じ形で、密行列を持たない都市では CSR の行から作る。
+        """
+        if self.dense:
+            return self.hotel_time[nodes], self.hotel_fare[nodes]
+        edges = (self.edge_start, self.edge_end, self.edge_time, self.edge_fare)
+        hotel_time, hotel_fare = build_hotel_reach(
+            edges, self.visit_fare, self.hotel_column, len(self.hotel_indices), np.atleast_1d(nodes))
+        if np.ndim(nodes) == 0:
+            return hotel_time[0], hotel_fare[0]
+        return hotel_time, hotel_fare
+
+    @cached_property
+    def time_rows(self) -> List[Any]:
+        """
+        探索中のスカラー参照用に、行 i の row[j] で移動時間を引ける行のリスト（DayEvaluator を参照）。
+        密行列の都市では Python のリスト、疎行列の都市では移動情報のないノードに INF_TIME を返す辞書。
+        作るのにノード数の2乗（疎行列では辺の数）の手間がかかるため、一度だけ作って共有する。呼び出し側は書き換えないこと。
+        """
+        return self._rows(self.time, self.edge_time, INF_TIME)
+
+    @cached_property
+    def fare_rows(self) -> List[Any]:
+        return self._rows(self.fare, self.edge_fare, INF_FARE)
+
+    @cached_property
+    def visit_fare_list(self) -> List[int]:
+        return self.visit_fare.tolist()
+
+    @cached_property
+    def staytime_list(self) -> List[int]:
+        return self.staytime.tolist()
+
+    def _rows(self, matrix: np.ndarray, values: np.ndarray, missing: int) -> List[Any]:
+        if self.dense:
+            return matrix.tolist()
+        ends = self.edge_end.tolist()
+        values = values.tolist()
+        bounds = self.edge_start.tolist()
+        return [_SparseRow(zip(ends[start:stop], values[start:stop]), missing)
+                for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+class _SparseRow(dict):
+    """
+    疎行列の1行。密行列の行と同じく row[j] で引け、移動情報のないノードには missing を返す。
+    """
+    __slots__ = ("missing",)
+
+    def __init__(self, items, missing: int):
+        super().__init__(items)
+        self.missing = missing
+
+    def __missing__(self, key: int) -> int:
+        return self.missing
+
+
+def _freeze(*arrays: np.ndarray) -> None:
+    for array in arrays:
+        array.flags.writeable = False
+
+
+def _node_attributes(ids: Sequence[int], dest_by_id: Mapping[int, Mapping[str, Any]]):
+    n = len(ids)
+    visit_fare = np.zeros(n, dtype=np.int32)
+    staytime = np.zeros(n, dtype=np.int32)
+    is_hotel = np.zeros(n, dtype=bool)
+    hours = [None] * n
+    for index, dest_id in enumerate(ids[1:], start=1):
+        dest = dest_by_id[dest_id]
+        visit_fare[index] = dest.get("fare") or 0
+        staytime[index] = dest.get("staytime") or 0
+        is_hotel[index] = bool(dest.get("ishotel"))
+        hours[index] = dest.get("opening_hours")
+    return visit_fare, staytime, is_hotel, hours
+
+
+def build_travel_matrices(
+    ids: Sequence[int],
+    dest_by_id: Mapping[int, Mapping[str, Any]],
+    trans_lookup: Mapping[Tuple[int, int], Mapping[str, Any]],
+    osaka_lookup: Mapping[Tuple[int, int], Mapping[str, Any]],
+    osaka_return_lookup: Mapping[Tuple[int, int], Mapping[str, Any]],
+) -> TravelMatrices:
+    """
+    ID キーの辞書ルックアップを index アドレスの密行列（と同じ内容の CSR）に変換する。
+    行 0 は大阪駅からの移動（osaka_lookup）、列 0 は大阪駅への帰り（osaka_return_lookup）。
+    """
+    n = len(ids)
+    index_of = {dest_id: index for index, dest_id in enumerate(ids)}
+    time = np.full((n, n), INF_TIME, dtype=np.int32)
+    fare = np.full((n, n), INF_FARE, dtype=np.int32)
+    mode = np.full((n, n), NO_MODE, dtype=np.int16)
+    method_codes: Dict[Any, int] = {}
+
+    for lookup in (trans_lookup, osaka_lookup, osaka_return_lookup):
+        for (start, end), record in lookup.items():
+            i = index_of.get(start)
+            j = index_of.get(end)
+            if i is None or j is None:
+                continue
+            time[i, j] = record.get("transportation_time", INF_TIME)
+            fare[i, j] = record.get("transportation_fare", INF_FARE)
+            method = record.get("transportation_method")
+            mode[i, j] = method_codes.setdefault(method, len(method_codes))
+
+    # 移動データのないノード間（ホテル同士など）は、距離から見積もった移動で埋める
+    locations = node_locations(ids, dest_by_id)
+    rows, ends = np.nonzero(mode != NO_MODE)
+    estimator = fit_city_estimator(
+        locations, rows, ends, time[rows, ends], fare[rows, ends], mode[rows, ends], len(method_codes))
+    estimated = np.zeros((n, n), dtype=bool)
+    if estimator is not None:
+        located = np.isfinite(locations[:, 0])
+        estimated = (mode == NO_MODE) & located[:, None] & located[None, :]
+        np.fill_diagonal(estimated, False)
+        rows, ends = np.nonzero(estimated)
+        time[rows, ends], fare[rows, ends], mode[rows, ends] = estimator.estimate(
+            great_circle_km(locations[rows], locations[ends]))
+
+    rows, ends = np.nonzero(mode != NO_MODE)
+    edge_start = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=edge_start[1:])
+    return _assemble(
+        ids, dest_by_id, time, fare, mode, tuple(method_codes),
+        edge_start, ends.astype(np.int32), time[rows, ends], fare[rows, ends], mode[rows, ends], estimated[rows, ends])
+
+
+def build_sparse_travel_matrices(
+    ids: Sequence[int],
+    dest_by_id: Mapping[int, Mapping[str, Any]],
+    transportation_records: Iterable[Mapping[str, Any]],
+    osaka_records: Iterable[Mapping[str, Any]],
+    max_travel_time: Optional[int] = SPARSE_MAX_TRAVEL_TIME,
+) -> TravelMatrices:
+    """
+    移動データのレコードから、密行列を作らずに CSR だけの TravelMatrices を作る（大きな都市用）。
+    ノード間の移動は移動時間が max_travel_time 以下のものだけを持ち（None で上限なし）、
+    大阪駅との移動（osaka_records の行きと、それを反転した帰り）は時間によらず持つ。
+    同じペアのレコードが複数ある場合は、辞書ルックアップと同じく後のもの（帰りは大阪駅からのレコード）を使う。
+    移動データのないペアは、各ノードから近い ESTIMATE_SPARSE_NEIGHBORS ノードと ESTIMATE_SPARSE_HOTELS ホテルまでを
+    距離から見積もって足す（全ペアを埋めると密行列と同じ大きさになるため）。
+    """
+    n = len(ids)
+    index_of = {dest_id: index for index, dest_id in enumerate(ids)}
+    method_codes: Dict[Any, int] = {}
+    starts, ends, times, fares, modes = [], [], [], [], []
+
+    def add(i: int, j: int, record: Mapping[str, Any]) -> None:
+        starts.append(i)
+        ends.append(j)
+        times.append(record.get("transportation_time", INF_TIME))
+        fares.append(record.get("transportation_fare", INF_FARE))
+        modes.append(method_codes.setdefault(record.get("transportation_method"), len(method_codes)))
+
+    for record in transportation_records:
+        i = index_of.get(record.get("start_destination_id"))
+        j = index_of.get(record.get("end_destination_id"))
+        if i is None or j is None or i == 0 or j == 0:
+            continue
+        add(i, j, record)
+    internal = len(starts)
+    osaka_records = list(osaka_records)
+    for reverse in (False, True):
+        for record in osaka_records:
+            try:
+                start = int(record.get("start_destination_id"))
+                end = int(record.get("end_destination_id"))
+            except (TypeError, ValueError):
+                continue
+            j = index_of.get(end)
+            if start != 0 or j is None or j == 0:
+                continue
+            if reverse:
+                add(j, 0, record)
+            else:
+                add(0, j, record)
+
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    times = np.asarray(times, dtype=np.int32)
+    fares = np.asarray(fares, dtype=np.int32)
+    modes = np.asarray(modes, dtype=np.int16)
+    # 見積もりの当てはめには、上限で落とす前のノード間の移動をすべて使う
+    locations = node_locations(ids, dest_by_id)
+    estimator = fit_city_estimator(
+        locations, starts[:internal], ends[:internal], times[:internal], fares[:internal], modes[:internal],
+        len(method_codes))
+    key = starts * n + ends
+    keep = np.ones(len(key), dtype=bool)
+    if max_travel_time is not None:
+        keep[:internal] = times[:internal] <= max_travel_time
+    estimated = np.zeros(len(key), dtype=bool)
+    if estimator is not None:
+        located = np.flatnonzero(np.isfinite(locations[:, 0]))
+        hotels = np.array([index for index in located.tolist() if dest_by_id[ids[index]].get("ishotel")], dtype=np.int64)
+        known = np.unique(key)
+        extra = [
+            _estimate_nearest(estimator, locations, located, targets, count, known, max_travel_time)
+            for targets, count in ((located, ESTIMATE_SPARSE_NEIGHBORS), (hotels, ESTIMATE_SPARSE_HOTELS))
+        ]
+        # 近いノードとしても近いホテルとしても選ばれたペアは、後の並べ替えで1つにまとまる
+        extra = [np.concatenate(arrays) for arrays in zip(*extra)]
+        starts, ends, times, fares, modes = (
+            np.concatenate([array[keep], added]) for array, added in zip((starts, ends, times, fares, modes), extra))
+        estimated = np.concatenate([estimated[keep], np.ones(len(extra[0]), dtype=bool)])
+    else:
+        starts, ends, times, fares, modes, estimated = (
+            array[keep] for array in (starts, ends, times, fares, modes, estimated))
+
+    key = starts * n + ends
+    order = np.argsort(key, kind="stable")
+    # 同じペアは並べ替えた後の最後のレコードだけを残す
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = key[order][1:] != key[order][:-1]
+    order = order[last]
+    edge_start = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(starts[order], minlength=n), out=edge_start[1:])
+    empty = np.zeros((0, 0), dtype=np.int32)
+    return _assemble(
+        ids, dest_by_id, empty, empty.copy(), np.zeros((0, 0), dtype=np.int16), tuple(method_codes),
+        edge_start, ends[order].astype(np.int32), times[order], fares[order], modes[order], estimated[order],
+    )
+
+
+def fit_city_estimator(
+    locations: np.ndarray,
+    rows: np.ndarray,
+    ends: np.ndarray,
+    time: np.ndarray,
+    fare: np.ndarray,
+    mode: np.ndarray,
+    method_count: int,
+) -> Optional[TravelEstimator]:
+    """
+    都市内のノード間（大阪駅との移動と、移動時間・運賃のないレコードを除く）の移動から TravelEstimator を当てはめる。
+    """
+    used = (rows > 0) & (ends > 0) & (rows != ends) & (time < INF_TIME) & (fare < INF_FARE)
+    distance = great_circle_km(locations[rows[used]], locations[ends[used]])
+    located = np.isfinite(distance)
+    return fit_travel_estimator(
+        distance[located], time[used][located], fare[used][located], mode[used][located], method_count)
+
+
+def _estimate_nearest(
+    estimator: TravelEstimator,
+    locations: np.ndarray,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    count: int,
+    known: np.ndarray,
+    max_travel_time: Optional[int],
+) -> Tuple[np.ndarray, ...]:
+    """
+    sources の各ノードから targets のうち近い count ノード（自分自身を除く）について、移動データのない
+    （known にキーがない）ペアの見積もった (出発, 到着, 移動時間, 運賃, 交通手段)。移動時間が max_travel_time を超えるものは足さない。
+    """
+    n = len(locations)
+    count = min(count, len(targets) - 1)
+    parts = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32),
+              np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int16))]
+    if count <= 0:
+        return parts[0]
+    # 距離は行をまとめて計算する（全ペアを一度に持つと大きな都市で数百 MB になる）
+    for block in range(0, len(sources), 256):
+        rows = sources[block:block + 256]
+        distance = great_circle_km(locations[rows][:, None, :], locations[targets][None, :, :])
+        distance[rows[:, None] == targets[None, :]] = np.inf
+        nearest = np.argpartition(distance, count - 1, axis=1)[:, :count]
+        starts = np.repeat(rows, count)
+        ends = targets[nearest.ravel()]
+        time, fare, mode = estimator.estimate(np.take_along_axis(distance, nearest, axis=1).ravel())
+        key = starts * n + ends
+        position = np.minimum(np.searchsorted(known, key), len(known) - 1)
+        missing = known[position] != key if len(known) else np.ones(len(key), dtype=bool)
+        if max_travel_time is not None:
+            missing &= time <= max_travel_time
+        parts.append((starts[missing], ends[missing], time[missing], fare[missing], mode[missing]))
+    return tuple(np.concatenate([part[k] for part in parts]) for k in range(5))
+
+
+def _assemble(
+    ids: Sequence[int],
+    dest_by_id: Mapping[int, Mapping[str, Any]],
+    time: np.ndarray,
+    fare: np.ndarray,
+    mode: np.ndarray,
+    methods: Tuple[str, ...],
+    edge_start: np.ndarray,
+    edge_end: np.ndarray,
+    edge_time: np.ndarray,
+    edge_fare: np.ndarray,
+    edge_mode: np.ndarray,
+    edge_estimated: np.ndarray,
+) -> TravelMatrices:
+    # ノードの属性と、探索用の表はどれも CSR から作る（密行列の有無で同じ表になる）
+    visit_fare, staytime, is_hotel, hours = _node_attributes(ids, dest_by_id)
+    opening = build_opening_table(hours)
+    is_spot = ~is_hotel
+    is_spot[0] = False
+    spot_indices = np.flatnonzero(is_spot)
+    hotel_indices = np.flatnonzero(is_hotel)
+    hotel_column = np.full(len(ids), -1, dtype=np.int64)
+    hotel_column[hotel_indices] = np.arange(len(hotel_indices))
+    edges = (edge_start, edge_end, edge_time, edge_fare)
+    if len(time) == len(ids):
+        hotel_time, hotel_fare = build_hotel_reach(
+            edges, visit_fare, hotel_column, len(hotel_indices), np.arange(len(ids)))
+        width = len(hotel_indices)
+    else:
+        # 大きな都市ではノード数 × ホテル数の表を作らず、行は必要になったときに CSR から作る（hotel_reach を参照）
+        hotel_time = np.zeros((0, len(hotel_indices)), dtype=np.int32)
+        hotel_fare = np.zeros((0, len(hotel_indices)), dtype=np.int64)
+        width = min(len(hotel_indices), SPARSE_HOTEL_ORDER)
+    hotel_order, hotel_order_time = build_hotel_order(edges, hotel_column, width)
+    candidates = build_candidate_lists(edges, spot_indices)
+    return_fare, hotel_charge = build_finish_charges(edges, visit_fare, hotel_column)
+
+    _freeze(
+        time, fare, mode, edge_start, edge_end, edge_time, edge_fare, edge_mode, edge_estimated, visit_fare, staytime,
+        is_hotel, is_spot, spot_indices, hotel_indices, hotel_column, hotel_order, hotel_order_time, hotel_time, hotel_fare,
+        candidates, return_fare, hotel_charge, opening,
+    )
+    return TravelMatrices(
+        time=time,
+        fare=fare,
+        mode=mode,
+        methods=methods,
+        edge_start=edge_start,
+        edge_end=edge_end,
+        edge_time=edge_time,
+        edge_fare=edge_fare,
+        edge_mode=edge_mode,
+        edge_estimated=edge_estimated,
+        visit_fare=visit_fare,
+        staytime=staytime,
+        is_hotel=is_hotel,
+        is_spot=is_spot,
+        spot_indices=spot_indices,
+        hotel_indices=hotel_indices,
+        hotel_column=hotel_column,
+        hotel_order=hotel_order,
+        hotel_order_time=hotel_order_time,
+        hotel_time=hotel_time,
+        hotel_fare=hotel_fare,
+        candidates=candidates,
+        return_fare=return_fare,
+        hotel_charge=hotel_charge,
+        opening=opening,
+    )
+
+
+def _edge_rows(edge_start: np.ndarray) -> np.ndarray:
+    """
+    CSR の各辺の出発ノード。
+    """
+    return np.repeat(np.arange(len(edge_start) - 1), np.diff(edge_start))
+
+
+def _hotel_edges(
+    edges: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], hotel_column: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    CSR のうちホテルへの移動できる辺の (出発ノード, 辺の位置)。
+    """
+    edge_start, edge_end, edge_time, _ = edges
+    into = np.flatnonzero((hotel_column[edge_end] >= 0) & (edge_time < INF_TIME))
+    return _edge_rows(edge_start)[into], into
+
+
+def build_hotel_order(
+    edges: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], hotel_column: np.ndarray, width: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    各ノードから行けるホテルを移動時間の短い順（同じ時間は hotel_indices の順）に width 件まで並べた表を作る。
+    空きは大阪駅の index 0 と INF_TIME で埋める（探索では INF_TIME のところで打ち切る）。
+    """
+    edge_start, edge_end, edge_time, _ = edges
+    n = len(edge_start) - 1
+    rows, into = _hotel_edges(edges, hotel_column)
+    order = np.lexsort((hotel_column[edge_end[into]], edge_time[into], rows))
+    rows, into = rows[order], into[order]
+    # 行ごとの順位（行の先頭の辺からの位置）が width 未満のものだけ載せる
+    first = np.searchsorted(rows, rows)
+    rank = np.arange(len(rows)) - first
+    keep = rank < width
+    hotel_order = np.zeros((n, width), dtype=np.int64)
+    hotel_order_time = np.full((n, width), INF_TIME, dtype=np.int32)
+    hotel_order[rows[keep], rank[keep]] = edge_end[into[keep]]
+    hotel_order_time[rows[keep], rank[keep]] = edge_time[into[keep]]
+    return hotel_order, hotel_order_time
+
+
+def build_hotel_reach(
+    edges: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    visit_fare: np.ndarray,
+    hotel_column: np.ndarray,
+    hotel_count: int,
+    nodes: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    nodes の各ノードから各ホテル（hotel_indices の列）への移動時間と、運賃 + 宿泊費（1人分）の表を作る。
+    行けないホテルは INF_TIME / INF_CHARGE。edges は CSR の (edge_start, edge_end, edge_time, edge_fare)。
+    """
+    edge_start, edge_end, edge_time, edge_fare = edges
+    # nodes の行の辺だけを集める
+    counts = edge_start[nodes + 1] - edge_start[nodes]
+    rows = np.repeat(np.arange(len(nodes)), counts)
+    index = np.arange(counts.sum()) + np.repeat(edge_start[nodes] - (np.cumsum(counts) - counts), counts)
+    ends = edge_end[index]
+    into = (hotel_column[ends] >= 0) & (edge_time[index] < INF_TIME)
+    rows, index, ends = rows[into], index[into], ends[into]
+    hotel_time = np.full((len(nodes), hotel_count), INF_TIME, dtype=np.int32)
+    hotel_fare = np.full((len(nodes), hotel_count), INF_CHARGE, dtype=np.int64)
+    hotel_time[rows, hotel_column[ends]] = edge_time[index]
+    hotel_fare[rows, hotel_column[ends]] = edge_fare[index].astype(np.int64) + visit_fare[ends]
+    return hotel_time, hotel_fare
+
+
+def build_finish_charges(
+    edges: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], visit_fare: np.ndarray, hotel_column: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    各ノードから大阪駅へ帰る運賃と、到達できるホテルへの運賃 + 宿泊費の最小値（1人分）を作る。
+    移動情報がない場合は INF_CHARGE。大阪駅自身の帰りの運賃は 0 とする。
+    """
+    edge_start, edge_end, edge_time, edge_fare = edges
+    n = len(edge_start) - 1
+    home = (edge_end == 0) & (edge_time < INF_TIME)
+    return_fare = np.full(n, INF_CHARGE, dtype=np.int64)
+    return_fare[_edge_rows(edge_start)[home]] = edge_fare[home]
+    return_fare[0] = 0
+    hotel_charge = np.full(n, INF_CHARGE, dtype=np.int64)
+    rows, into = _hotel_edges(edges, hotel_column)
+    np.minimum.at(hotel_charge, rows, edge_fare[into].astype(np.int64) + visit_fare[edge_end[into]])
+    return return_fare, hotel_charge
+
+
+def build_candidate_lists(
+    edges: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    spot_indices: np.ndarray,
+    nearest: int = CANDIDATE_NEAREST,
+    cheapest: int = CANDIDATE_CHEAPEST,
+    sampled: int = CANDIDATE_RANDOM,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    各ノードから次に訪れる観光地の候補リストを作る。移動時間が短い nearest 件と運賃が安い cheapest 件に、
+    それ以外から無作為に選んだ sampled 件を加える（乱数は seed で固定し、読み込みごとに同じ表になる）。
+    移動情報のない観光地と自分自身は含めない。行の長さをそろえるため、空きは NO_CANDIDATE で埋める。
+    各ノードで見るのは CSR の行（移動情報のあるノード）だけで、全観光地は走査しない。
+    """
+    edge_start, edge_end, edge_time, edge_fare = edges
+    n = len(edge_start) - 1
+    width = min(nearest + cheapest + sampled, len(spot_indices))
+    candidates = np.full((n, width), NO_CANDIDATE, dtype=np.int32)
+    if width == 0:
+        return candidates
+    rng = np.random.default_rng(seed)
+    # 観光地のノード index → spot_indices での位置（観光地でなければ -1）
+    position = np.full(n, -1)
+    position[spot_indices] = np.arange(len(spot_indices))
+    for node in range(n):
+        start, stop = edge_start[node], edge_start[node + 1]
+        ends = edge_end[start:stop]
+        reachable = (position[ends] >= 0) & (edge_time[start:stop] < INF_TIME) & (ends != node)
+        # 位置の昇順に並んでいるため、安定ソートの同順位は spot_indices の並び順になる
+        spots = position[ends[reachable]]
+        spot_time = edge_time[start:stop][reachable]
+        spot_fare = edge_fare[start:stop][reachable]
+        chosen = []
+        for values, count in ((spot_time, nearest), (spot_fare, cheapest)):
+            ranked = spots[np.argsort(values, kind="stable")[:count]]
+            chosen.extend(index for index in ranked if index not in chosen)
+        rest = spots[~np.isin(spots, chosen)]
+        chosen.extend(rng.permutation(rest)[:sampled])
+        candidates[node, :len(chosen)] = spot_indices[chosen]
+    return candidates
+
+
+def min_arrival(matrices: TravelMatrices) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    各ノードに着く移動の、最短の移動時間（0 分の移動を除く）と最安の運賃。着く移動がなければ INF_TIME / INF_FARE。
+    """
+    min_time = np.full(matrices.size, INF_TIME, dtype=np.int64)
+    min_fare = np.full(matrices.size, INF_FARE, dtype=np.int64)
+    moving = matrices.edge_time > 0
+    np.minimum.at(min_time, matrices.edge_end[moving], matrices.edge_time[moving])
+    np.minimum.at(min_fare, matrices.edge_end, matrices.edge_fare)
+    return min_time, min_fare
+
+
+def spot_path_costs(matrices: TravelMatrices, weight: np.ndarray, value: np.ndarray, backward: bool) -> np.ndarray:
+    """
+    観光地だけをたどる経路について、辺の重み weight（CSR の辺の順）の和の最小値を Bellman-Ford で全ノード分まとめて求める。
+    backward=True なら各ノードから観光地をたどり、最後の観光地で value（そこで終える額）を足した値の最小値。
+    backward=False なら value（大阪駅から直接着いた場合の値）から始め、観光地から観光地への移動をたどって着く値の最小値。
+    移動情報のない辺は使わず、到達できない場合は INF_CHARGE。時刻や営業時間を無視した緩和なので、探索の下界に使える。
+    """
+    rows = _edge_rows(matrices.edge_start)
+    usable = (matrices.edge_time < INF_TIME) & matrices.is_spot[matrices.edge_end]
+    if backward:
+        source, target = matrices.edge_end[usable], rows[usable]
+    else:
+        usable &= matrices.is_spot[rows]
+        source, target = rows[usable], matrices.edge_end[usable]
+    weight = np.asarray(weight, dtype=np.int64)[usable]
+    value = np.minimum(np.asarray(value, dtype=np.int64), INF_CHARGE)
+    for _ in range(matrices.size):
+        relaxed = value.copy()
+        np.minimum.at(relaxed, target, np.minimum(value[source] + weight, INF_CHARGE))
+        if np.array_equal(relaxed, value):
+            break
+        value = relaxed
+    return value
+
+
+def reachable_spots(matrices: TravelMatrices, node: int) -> np.ndarray:
+    """
+    ノード node から移動情報のある観光地（index の昇順）。全観光地を見る代わりに使う。
+    """
+    ends = matrices.neighbors(node)[0]
+    return ends[matrices.is_spot[ends]]
+
+
+def candidate_spots(matrices: TravelMatrices, node: int) -> np.ndarray:
+    """
+    ノード node の候補リスト（NO_CANDIDATE を除いたもの）。
+    """
+    row = matrices.candidates[node]
+    return row[row != NO_CANDIDATE]
+
+
+def node_mask(nodes: Sequence[int]) -> int:
+    """
+    ノード index の集合を、index 番目のビットを立てた整数（ビットマスク）にする。
+    探索状態の訪問済み集合はこの形で持ち、コピーやメンバー判定をアロケーションなしで行う。
+    """
+    mask = 0
+    for node in nodes:
+        mask |= 1 << int(node)
+    return mask
+
+
+def nearest_unvisited_hotel(matrices: TravelMatrices, node: int, visited: np.ndarray) -> Tuple[int, int]:
+    """
+    ノード node から最も近い未訪問ホテルの (ノード index, 移動時間) を返す。
+    訪問済みホテルは高々宿泊数しかないため、先頭から数個たどるだけで見つかる。
+    到達可能なホテルがない場合は (-1, INF_TIME)。
+    """
+    for hotel, travel_time in zip(matrices.hotel_order[node], matrices.hotel_order_time[node]):
+        if travel_time >= INF_TIME:
+            break
+        if not visited[hotel]:
+            return int(hotel), int(travel_time)
+    return -1, INF_TIME
+
+
+def min_hotel_travel_times(matrices: TravelMatrices, visited: np.ndarray) -> np.ndarray:
+    """
+    全ノードについて、未訪問ホテルへの最小移動時間をまとめて返す。
+    hotel_order の列を先頭から見ていき、訪問済みホテルに当たった行だけ次の列へ進める。
+    到達可能なホテルがない場合は INF_TIME。
+    """
+    times = np.full(matrices.size, INF_TIME, dtype=np.int32)
+    rows = np.arange(matrices.size)
+    for k in range(matrices.hotel_order.shape[1]):
+        free = ~visited[matrices.hotel_order[rows, k]]
+        times[rows[free]] = matrices.hotel_order_time[rows[free], k]
+        rows = rows[~free]
+        if len(rows) == 0:
+            break
+    return times
+
+
+def restricted_choice(gains: np.ndarray, alpha: float, draw: float) -> int:
+    """
+    GRASP の制限付き候補リスト（RCL）から1つ選ぶ。gains は候補ごとの貪欲法の評価（大きいほどよい）。
+    評価が「最大値 - alpha × (最大値 - 最小値)」以上の候補を RCL とし、draw（[0, 1) の乱数）で一様に選ぶ。
+    alpha = 0 なら純粋な貪欲法、alpha = 1 なら全候補からの一様な選択になる。
+    """
+    best = gains.max()
+    members = np.flatnonzero(gains >= best - alpha * (best - gains.min()))
+    return int(members[int(draw * len(members))])
@@ -1,195 +1,213 @@
-import sys
 import json
 import time
 import random
-from typing import Dict, Any
-from datetime import datetime, timedelta
-
-DATA_DIRECTORY = "./optimization/data"
-
-
-def load_data():
-    with open(f"{DATA_DIRECTORY}/combined_with_info.json", "r", encoding="utf-8") as f:
-        tourist_data = json.load(f)
-    with open(f"{DATA_DIRECTORY}/transportation_costs.json", "r", encoding="utf-8") as f:
-        transportation_data = json.load(f)
-    with open(f"{DATA_DIRECTORY}/Osaka_to_all_spots.json", "r", encoding="utf-8") as f:
-        osaka_transportation_data = json.load(f)
-    return tourist_data, transportation_data, osaka_transportation_data
-
-
-def build_transportation_lookup(transportation_data, valid_ids):
-    trans_lookup = {}
-    for record in transportation_data:
-        start = record.get("start_destination_id")
-        end = record.get("end_destination_id")
-        if start in valid_ids and end in valid_ids:
-            trans_lookup[(start, end)] = record
-    return trans_lookup
-
-
-def extract_osaka_records(osaka_transportation_data):
-    """
-    Osaka_to_all_spots.json のデータ形式がリストの場合はそのまま、
-    辞書の場合は値（リスト）をすべて結合して返す。
-    """
-    if isinstance(osaka_transportation_data, dict):
-        records = []
-        for key, value in osaka_transportation_data.items():
-            if isinstance(value, list):
-                records.extend(value)
-            else:
-                records.append(value)
-        return records
-    return osaka_transportation_data
-
-
-def build_osaka_transportation_lookup(osaka_transportation_data, valid_ids):
-    osaka_lookup = {}
-    records = extract_osaka_records(osaka_transportation_data)
-    for record in records:
-        start = record.get("start_destination_id")
-        end = record.get("end_destination_id")
-        try:
-            start = int(start)
-            end = int(end)
-        except:
-            continue
-        if start == 0 and end in valid_ids:
-            osaka_lookup[(start, end)] = record
-    return osaka_lookup
-
-
-def build_osaka_return_lookup(osaka_transportation_data, valid_ids):
-    """
-    大阪への帰り用の移動情報を作成する。元データは大阪→観光地の情報なので、キーを反転して (観光地, 0) とする。
-    """
-    osaka_return = {}
-    # 簡易的な実装（データがリストの場合を想定）
-    records = extract_osaka_records(osaka_transportation_data)
-    for record in records:
-        start = record.get("start_destination_id")
-        end = record.get("end_destination_id")
-        try:
-            start = int(start)
-            end = int(end)
-        except:
-            continue
-        if start == 0 and end in valid_ids:
-            osaka_return[(end, 0)] = record
-    return osaka_return
-
-
-def get_min_hotel_travel_time(from_id: int, trans_lookup: Dict, dest_by_id: Dict[int, Any], visited: set) -> int:
+import logging
+import hashlib
+from functools import partial
+from dataclasses import replace
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from optimization.annealing import anneal
+from optimization.beam_search import DEFAULT_BEAM_WIDTH, BeamConstructor
+from optimization.city_store import get_city_graph
+from optimization.itinerary import (
+    NO_HOTEL,
+    DayEvaluator,
+    FinishBounds,
+    PlanParams,
+    Stop,
+    build_plan_params,
+    departure_stop,
+    format_itinerary,
+    score_plan,
+    split_itinerary,
+)
+from optimization.exact_solver import EXACT_MAX_CANDIDATES, EXACT_NODE_LIMIT, exact_candidates, solve_day_trip
+from optimization.local_search import choose_base_hotel, improve_plan
+from optimization.opening_hours import OpeningWindows, opening_windows
+from optimization.parallel_search import pool_workers, run_parallel_search
+from optimization.plan_archive import (
+    DEFAULT_MIN_DISTANCE,
+    MAX_ALTERNATIVES,
+    MAX_PARETO_PLANS,
+    ElitePlan,
+    ElitePool,
+    ParetoFront,
+    PlanArchive,
+    elite_pool_size,
+)
+from optimization.search_control import (
+    DEFAULT_STAGNATION_TIME,
+    DEFAULT_TIME_LIMIT,
+    MAX_ITERATIONS,
+    MAX_TIME_LIMIT,
+    SearchController,
+    SearchLimits,
+    merge_reports,
+)
+from optimization.travel_matrix import (
+    INF_TIME,
+    TravelMatrices,
+    candidate_spots,
+    node_mask,
+    min_hotel_travel_times,
+    reachable_spots,
+    restricted_choice,
+)
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZERS = ("restart", "annealing", "beam")
+# 焼きなましの初期解づくり（貪欲法の再スタート）に使う時間の割合
+ANNEALING_INITIAL_RATIO = 0.1
+# 貪欲法でプランを1つ作って改善する手間を、焼きなましの近傍評価何回分として反復数に数えるか
+RESTART_WEIGHT = 150
+# 貪欲法の制限付き候補リスト（RCL）の幅。0 で純粋な貪欲法、1 で条件を満たす候補からの一様な選択
+GRASP_ALPHA = 0.3
+
+
+def select_spot_candidate(
+    matrices: TravelMatrices,
+    current: int,
+    current_time: int,
+    order: np.ndarray,
+    visited: np.ndarray,
+    hotel_times: np.ndarray,
+    budget: int,
+    remaining_budget: int,
+    people: int,
+    sightseeing_end_time: int,
+    day_total_time: int,
+    rng: random.Random = random,
+    reserves: Optional[np.ndarray] = None,
+    alpha: float = GRASP_ALPHA,
+    window: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Optional[Stop]:
     """
-    指定の施設（from_id）から、未訪問のホテル（ishotel:true）への最小移動時間を返す。
-    移動情報がない場合は大きな値（例:1000000）を返す。
+    現在地（ノード index: current）から次に訪れる観光地を選ぶ。
+    order の候補について到着時刻・ホテルへの帰着可否・予算の条件をマスクでまとめて判定し、
+    reserves（ノードごとに、訪れた後に旅程を終えるため残す額の下界。FinishBounds を参照）を渡した場合は
+    その額を残せない候補も除く。window（その日のノードごとの着いてよい時刻の範囲 (earliest, latest)、
+    OpeningWindows を参照）を渡した場合は、営業時間内に滞在を終えられない候補も除く。
+    条件を満たす候補は、使う時間（移動 + 滞在）1分あたりの評価値の増分（停留所1つ分の 10 点 + 費用の分）で比べ、
+    幅 alpha の制限付き候補リスト（restricted_choice）から1つ選ぶ。
     """
-    min_time = 1000000
-    for dest in dest_by_id.values():
-        if dest.get("ishotel") and dest["id"] not in visited:
-            key = (from_id, dest["id"])
-            if key in trans_lookup:
-                travel_time = trans_lookup[key].get(
-                    "transportation_time", 1000000)
-                if travel_time < min_time:
-                    min_time = travel_time
-    return min_time
+    travel_time, travel_cost = matrices.travel(current, order)
+    visit_time = matrices.staytime[order]
+    visit_cost = matrices.visit_fare[order]
+    arrival_offset = current_time + travel_time
+    total_cost = (travel_cost + visit_cost) * people
+    feasible = np.flatnonzero(
+        ~visited[order]
+        & (travel_time < INF_TIME)
+        & (arrival_offset < sightseeing_end_time)
+        & (arrival_offset + visit_time + hotel_times[order] <= day_total_time)
+        & (total_cost <= remaining_budget)
+    )
+    if reserves is not None and len(feasible):
+        feasible = feasible[total_cost[feasible] + reserves[order[feasible]] <= remaining_budget]
+    if window is not None and len(feasible):
+        nodes = order[feasible]
+        arrival = arrival_offset[feasible]
+        feasible = feasible[(arrival >= window[0][nodes]) & (arrival <= window[1][nodes])]
+    if len(feasible) == 0:
+        return None
+    # score_plan と同じ重みで、その観光地を足したときの評価値の増分
+    gains = (10 + total_cost[feasible] * (100 / budget)) / \
+        np.maximum(travel_time[feasible] + visit_time[feasible], 1)
+    k = feasible[restricted_choice(gains, alpha, rng.random())]
+    return Stop(
+        destination_id=int(order[k]),
+        departure_offset=current_time,
+        travel_cost=int(travel_cost[k]),
+        visit_cost=int(visit_cost[k]),
+        travel_time=int(travel_time[k]),
+        visit_time=int(visit_time[k]),
+        arrival_offset=int(arrival_offset[k]),
+        total_cost=int(total_cost[k]),
+        transportation_method=matrices.method(current, order[k]),
+    )
 
 
 def select_hotel_candidate(
-    current_dest: int,
+    matrices: TravelMatrices,
+    current: int,
     current_time: int,
-    osaka_lookup: Dict,
-    trans_lookup: Dict,
-    dest_by_id: Dict[int, Any],
-    visited: set,
+    visited: np.ndarray,
     remaining_budget: int,
     sightseeing_end_time: int,
     day_total_time: int,
-) -> Dict:
+    rng: random.Random = random,
+    alpha: float = GRASP_ALPHA,
+    staying: int = NO_HOTEL,
+    people: int = 1,
+    reserve: int = 0,
+) -> Optional[Stop]:
     """
-    現在地から未訪問のホテル候補の中から、ホテル到着時刻が指定ウィンドウ内（[sightseeing_end_time, day_total_time]）になるものを選ぶ。
-    複数候補があれば移動費用が最小のものを返す。
+    現在地からまだチェックアウトしていないホテル候補の中から、ホテル到着時刻が指定ウィンドウ内
+    （[sightseeing_end_time, day_total_time]）になるものを選ぶ。staying（前の夜のホテル）も候補に入り、選べば連泊になる。
+    予算からは運賃 + 宿泊費を人数分差し引き、その後も reserve（残りの夜と最終日のために残す額、FinishBounds を参照）が残るものに限る。
+    判定は TravelMatrices.hotel_reach の現在地の行でまとめて行い、複数候補があれば
+    移動費用の安さについて幅 alpha の制限付き候補リストから選ぶ。
     """
-    candidate = None
-    for dest in dest_by_id.values():
-        if not dest.get("ishotel"):
-            continue
-        if dest["id"] in visited:
-            continue
-        if current_dest == 0:
-            key = (0, dest["id"])
-            lookup = osaka_lookup
-        else:
-            key = (current_dest, dest["id"])
-            lookup = trans_lookup
-        if key not in lookup:
-            continue
-        travel = lookup[key]
-        travel_time = travel.get("transportation_time", 1000000)
-        travel_cost = travel.get("transportation_fare", 1000000)
-        departure_offset = current_time
-        arrival_offset = current_time + travel_time
-        if arrival_offset < sightseeing_end_time or arrival_offset > day_total_time:
-            continue
-        total_cost = travel_cost + (dest.get("fare") or 0)
-        if total_cost > remaining_budget:
-            continue
-        candidate_info = {
-            "destination_id": dest["id"],
-            "departure_offset": departure_offset,
-            "travel_cost": travel_cost,
-            "visit_cost": dest.get("fare") or 0,
-            "travel_time": travel_time,
-            "visit_time": 0,  # ホテルの場合、滞在時間は必要に応じて固定値に変更可
-            "arrival_offset": arrival_offset,
-            "total_cost": total_cost,
-            "transportation_method": travel.get("transportation_method"),
-        }
-        if candidate is None:
-            candidate = candidate_info
-        else:
-            # ランダム要素を追加：40%の確率で新しい候補を採用
-            if random.random() < 0.4:
-                candidate = candidate_info
-            else:
-                if candidate_info["travel_cost"] < candidate["travel_cost"]:
-                    candidate = candidate_info
-    return candidate
+    hotels = matrices.hotel_indices
+    travel_time, total_cost = matrices.hotel_reach(current)
+    arrival_offset = current_time + travel_time
+    feasible = np.flatnonzero(
+        (~visited[hotels] | (hotels == staying))
+        & (arrival_offset >= sightseeing_end_time)
+        & (arrival_offset <= day_total_time)
+        & (total_cost * people + reserve <= remaining_budget)
+    )
+    if len(feasible) == 0:
+        return None
+    visit_cost = matrices.visit_fare[hotels[feasible]]
+    k = feasible[restricted_choice(visit_cost - total_cost[feasible], alpha, rng.random())]
+    hotel = int(hotels[k])
+    return Stop(
+        destination_id=hotel,
+        departure_offset=current_time,
+        travel_cost=int(total_cost[k] - matrices.visit_fare[hotel]),
+        visit_cost=int(matrices.visit_fare[hotel]),
+        travel_time=int(travel_time[k]),
+        visit_time=0,  # ホテルの場合、滞在時間は必要に応じて固定値に変更可
+        arrival_offset=int(arrival_offset[k]),
+        total_cost=int(total_cost[k]),
+        transportation_method=matrices.method(current, hotel),
+    )
 
 
 def select_return_trip(
-    current_dest: int,
+    matrices: TravelMatrices,
+    current: int,
     current_time: int,
-    osaka_return_lookup: Dict,
     remaining_budget: int,
     day_total_time: int,
-) -> Dict:
+) -> Optional[Stop]:
     """
     最終日、現在地から大阪（ID:0）への帰りの移動候補を選ぶ。
     """
-    key = (current_dest, 0)
-    if key not in osaka_return_lookup:
+    if not matrices.has_edge(current, 0):
         return None
-    record = osaka_return_lookup[key]
-    travel_time = record.get("transportation_time", 1000000)
-    travel_cost = record.get("transportation_fare", 1000000)
+    travel_time, travel_cost = map(int, matrices.travel(current, 0))
     departure_offset = current_time
     arrival_offset = current_time + travel_time
     if travel_cost > remaining_budget:
         return None
-    return {
-        "destination_id": 0,  # 大阪駅のID
-        "departure_offset": departure_offset,
-        "travel_cost": travel_cost,
-        "visit_cost": 0,
-        "travel_time": travel_time,
-        "visit_time": 0,
-        "arrival_offset": arrival_offset,
-        "total_cost": travel_cost,
-        "transportation_method": record.get("transportation_method"),
-    }
+    return Stop(
+        destination_id=0,  # 大阪駅のID
+        departure_offset=departure_offset,
+        travel_cost=travel_cost,
+        visit_cost=0,
+        travel_time=travel_time,
+        visit_time=0,
+        arrival_offset=arrival_offset,
+        total_cost=travel_cost,
+        transportation_method=matrices.method(current, 0),
+    )
 
 
 def evaluate_plan(itinerary_json: str, budget: int, days: int) -> float:
@@ -212,227 +230,458 @@ def evaluate_plan(itinerary_json: str, budget: int, days: int) -> float:
     try:
         itinerary = json.loads(itinerary_json)
     except Exception as e:
-        print(f"Error parsing itinerary JSON: {e}")
+        logger.warning("Error parsing itinerary JSON: %s", e)
         return -9999.0
 
     route = itinerary.get("route", [])
     total_cost = sum(spot.get("total_cost", 0) for spot in route)
-    # print(f"len(route): {len(route)}, total_cost: {total_cost} budget: {budget}")
-    score = len(route) * 10 + (total_cost / budget) * 100
-    return score
+    return score_plan(len(route), total_cost, budget)
+
+
+def construct_itinerary(
+    matrices: TravelMatrices,
+    params: PlanParams,
+    rng: random.Random = random,
+    alpha: float = GRASP_ALPHA,
+    windows: Optional[OpeningWindows] = None,
+    bounds: Optional[FinishBounds] = None,
+) -> Tuple[List[List[Stop]], int, int]:
+    """
+    GRASP の構築フェーズとして、各ステップで制限付き候補リスト（幅 alpha）から選んだ観光地を足してプランを1つ作る。
+    各ステップで見るのは現在地の候補リスト（TravelMatrices.candidates）だけで、そこに候補がないときに限り、
+    現在地から移動情報のある全観光地（reachable_spots）を見る。
+    大阪駅への帰りの運賃（と、まだ泊まれるうちはホテル代）を残せなくなる観光地やホテルは FinishBounds の下界で先に除くため、
+    最後に帰れなくなって捨てるプランを作りにくい。営業時間外に着く観光地も選ばない（windows と bounds を渡さなければ
+    params から作る。再スタートのたびに作り直さないよう、search_plan は探索の初めに作ったものを渡す）。
+    宿泊先は前の夜と同じホテルも選べ（連泊）、チェックアウトしたホテルには戻らない（consecutive_stays）。
+    停留所の destination_id はノード index のまま返す（出力時に format_itinerary で ID に戻す）。
+    評価用に、停留所数と total_cost の合計を構築しながら数えて (itinerary, num_stops, total_cost) を返す。
+    """
+    days = params.days
+    people = params.people
+    day_total_time = params.day_total_time
+    sightseeing_end_time = params.sightseeing_end_time
+
+    itinerary = []  # 各日のプラン（リストのリスト）
+    remaining_budget = params.budget
+    visited = np.zeros(matrices.size, dtype=bool)  # 観光施設は一度訪れたら、ホテルはチェックアウトしたら除外
+    staying = NO_HOTEL  # 前の夜のホテル。次の夜も連泊できる
+    unvisited_spots = len(matrices.spot_indices)  # 全観光地を訪れたかどうかを数えるだけで判定する
+    if bounds is None:
+        bounds = FinishBounds(matrices, params)
+    if windows is None:
+        windows = opening_windows(matrices.opening, matrices.staytime, matrices.is_spot, params.start_minute, days)
+    num_stops = 0
+    total_cost = 0
+
+    # 各日ごとにシミュレーション（※複数日対応の場合、各日のオフセットを後で加算）
+    for day in range(days):
+        day_plan = []
+        if day == 0:
+            day_plan.append(departure_stop())
+            num_stops += 1
+
+        current_time = 0  # その日の相対経過時間（分）
+        current = 0  # 初日は大阪（index:0）から出発
+        # その日の観光中に訪問済みホテルは変わらないため、ホテルへの最小移動時間は1日1回だけ計算する
+        hotel_times = min_hotel_travel_times(matrices, visited)
+        # 観光施設（ホテル以外）の訪問を追加
+        while True:
+            reserves = bounds.reserves(day, bounds.with_hotel(day, current, remaining_budget))
+            window = (windows.earliest[day], windows.latest[day])
+            # まず現在地の候補リストだけを見て、候補がなくなったときだけ現在地から行ける全観光地を見る
+            candidate = select_spot_candidate(
+                matrices, current, current_time, candidate_spots(matrices, current), visited, hotel_times,
+                params.budget, remaining_budget, people, sightseeing_end_time, day_total_time, rng, reserves, alpha,
+                window)
+            if candidate is None:
+                candidate = select_spot_candidate(
+                    matrices, current, current_time, reachable_spots(matrices, current), visited, hotel_times,
+                    params.budget, remaining_budget, people, sightseeing_end_time, day_total_time, rng, reserves, alpha,
+                    window)
+            if candidate is None:
+                break
+            day_plan.append(candidate)
+            num_stops += 1
+            total_cost += candidate.total_cost
+            visited[candidate.destination_id] = True
+            unvisited_spots -= 1
+            current_time = candidate.arrival_offset + \
+                candidate.visit_time
+            remaining_budget -= candidate.total_cost
+            current = candidate.destination_id
+
+        # 最終日の場合は大阪への帰りを追加
+        if day == days - 1:
+            return_candidate = select_return_trip(
+                matrices, current, current_time, remaining_budget, day_total_time)
+            if return_candidate is not None:
+                day_plan.append(return_candidate)
+                num_stops += 1
+                total_cost += return_candidate.total_cost
+                remaining_budget -= return_candidate.total_cost
+                current_time = return_candidate.arrival_offset
+                current = 0
+        else:
+            # それ以外の日はホテルへのチェックインを追加
+            hotel_candidate = select_hotel_candidate(
+                matrices, current, current_time, visited, remaining_budget, sightseeing_end_time, day_total_time, rng,
+                alpha, staying, people, bounds.after_tonight(day, False))
+            hotel = NO_HOTEL if hotel_candidate is None else hotel_candidate.destination_id
+            if staying != NO_HOTEL and hotel != staying:
+                visited[staying] = True
+            staying = hotel
+            if hotel_candidate is not None:
+                day_plan.append(hotel_candidate)
+                num_stops += 1
+                total_cost += hotel_candidate.total_cost
+                current_time = hotel_candidate.arrival_offset
+                remaining_budget -= (
+                    hotel_candidate.travel_cost + hotel_candidate.visit_cost) * people
+                current = hotel_candidate.destination_id
+        itinerary.append(day_plan)
+        # もし観光施設（ホテル以外）すべて訪問済みなら終了
+        if unvisited_spots == 0:
+            break
+    return itinerary, num_stops, total_cost
+
+
+def _split_feasible(
+    evaluator: DayEvaluator, itinerary: List[List[Stop]], days: int
+) -> Optional[Tuple[List[List[int]], List[int]]]:
+    """
+    停留所リスト形式のプランを (日ごとのルート, 各日の終点) に分解する。
+    日数が足りない、または DayEvaluator で制約を満たさないプランは None。
+    """
+    if len(itinerary) != days:
+        return None
+    routes, ends = split_itinerary(evaluator.matrices, itinerary)
+    for day, (route, end) in enumerate(zip(routes, ends)):
+        if evaluator.evaluate(route, end, day) is None:
+            return None
+    return routes, ends
+
+
+def _plan_stops(evaluator: DayEvaluator, routes: List[List[int]], ends: List[int]) -> List[List[Stop]]:
+    return [evaluator.stops(route, end, day) for day, (route, end) in enumerate(zip(routes, ends))]
+
+
+def _beam_plan(
+    evaluator: DayEvaluator, beam: BeamConstructor, controller: SearchController, archive: Optional[PlanArchive] = None
+) -> Tuple[List[List[Stop]], float, Dict[str, Any]]:
+    result = beam.construct(controller, archive)
+    if result is None:
+        controller.stop_infeasible()
+        return [], -1000000, controller.report()
+    routes, ends, num_stops, total_cost = result
+    best_score = score_plan(num_stops, total_cost, evaluator.params.budget)
+    improved_routes, num_stops, total_cost = improve_plan(evaluator, routes, ends)
+    improved_ends = ends
+    based = choose_base_hotel(evaluator, improved_routes, ends)
+    if based is not None:
+        improved_ends, num_stops, total_cost = based
+    score = score_plan(num_stops, total_cost, evaluator.params.budget)
+    if archive is not None and archive.accepts(score):
+        archive.offer(evaluator, score, total_cost, improved_routes, improved_ends)
+    if controller.record(score):
+        best_score = score
+        routes, ends = improved_routes, improved_ends
+    return _plan_stops(evaluator, routes, ends), best_score, controller.report()
+
+
+def search_plan(
+    matrices: TravelMatrices,
+    params: PlanParams,
+    optimizer: str = "annealing",
+    limits: SearchLimits = SearchLimits(),
+    rng: random.Random = random,
+    beam_width: int = DEFAULT_BEAM_WIDTH,
+    archive: Optional[PlanArchive] = None,
+    alpha: float = GRASP_ALPHA,
+) -> Tuple[Optional[List[List[Stop]]], float, Dict[str, Any]]:
+    """
+    limits の打ち切り条件までプランを探索し、(最良プランの停留所リスト, 評価値, 探索レポート) を返す。
+    都市グラフや出力形式に依存しないため、ワーカープロセスからもそのまま呼び出せる。
+    貪欲法で大阪駅に戻れないプラン（営業時間や予算で最終日に回れる観光地がない場合など）はその再スタートだけを捨て、
+    一度も大阪駅に戻れるプランができなかった場合は空のプラン [] を返す。
+    焼きなましの再スタートは持ち時間の ANNEALING_INITIAL_RATIO までだが、プランが1つもできていなければその後も続け、
+    締め切りを過ぎていても最初の1回は必ず構築する。下界などの準備は打ち切りの計測を始める前に済ませる。
+    再スタートは GRASP で、幅 alpha の制限付き候補リストで作ったプランを improve_plan の局所探索で改善する。
+    optimizer が "beam" の場合は、幅 beam_width のビームサーチで1つだけプランを作って改善する（乱数は使わない）。
+    archive を渡すと、探索中に見つかったプラン（改善後の再スタート、焼きなましで受理した解、
+    ビームで完成したプラン）を別案・パレート解の候補として集める。
+    """
+    best_stops = None
+    best_score = -1000000
 
+    # 大きな都市では下界やビームの表の準備だけで再スタートの持ち時間を使い切ってしまうため、計測の前に済ませる
+    evaluator = DayEvaluator(matrices, params)
+    if optimizer == "beam":
+        beam = BeamConstructor(evaluator, beam_width)
+        return _beam_plan(evaluator, beam, SearchController(limits), archive)
+    bounds = FinishBounds(matrices, params)
+    controller = SearchController(limits)
+
+    # 焼きなましでは、再スタートは初期解を作るためだけに使う
+    restart_ratio = ANNEALING_INITIAL_RATIO if optimizer == "annealing" else None
+
+    restarts = 0
+    while best_stops is None or restart_ratio is None or controller.progress() < restart_ratio:
+        # 打ち切り条件を満たしていても最初の1回は構築する（1つも作らずに「解なし」と報告しないため）
+        if controller.should_stop(RESTART_WEIGHT) and restarts > 0:
+            break
+        restarts += 1
+        itinerary, num_stops, total_cost = construct_itinerary(matrices, params, rng, alpha, evaluator.windows, bounds)
+
+        # 最終目的地が大阪駅（0）でないプランは使わない
+        if len(itinerary) == 0 or len(itinerary[-1]) == 0 or itinerary[-1][-1].destination_id != 0:
+            continue
 
-def plan_itenerary(city: str, budget: int, days: int, people: int, start_datetime_str: str) -> json:
+        # 評価値を算出（JSON に変換するのは最後に選ばれたプランだけ）
+        score = score_plan(num_stops, total_cost, params.budget)
+        if controller.record(score):
+            best_score = score
+            best_stops = itinerary
+
+        # 各日の訪問順を改善し、空いた時間に観光地を足したプランも候補にする
+        plan = _split_feasible(evaluator, itinerary, params.days)
+        if plan is not None:
+            routes, ends = plan
+            routes, num_stops, total_cost = improve_plan(evaluator, routes, ends)
+            # 夜ごとに選んだホテルより、全夜を1つのホテルで連泊する方がよければそちらにする
+            based = choose_base_hotel(evaluator, routes, ends)
+            if based is not None:
+                ends, num_stops, total_cost = based
+            score = score_plan(num_stops, total_cost, params.budget)
+            if archive is not None and archive.accepts(score):
+                archive.offer(evaluator, score, total_cost, routes, ends)
+            if controller.record(score):
+                best_score = score
+                best_stops = _plan_stops(evaluator, routes, ends)
+
+    if best_stops is None:
+        controller.stop_infeasible()
+        return [], best_score, controller.report()
+
+    if optimizer == "annealing":
+        plan = _split_feasible(evaluator, best_stops, params.days)
+        if plan is not None:
+            result = anneal(evaluator, plan[0], plan[1], controller, rng=rng, archive=archive)
+            if result.score > best_score:
+                best_score = result.score
+                best_stops = _plan_stops(evaluator, result.routes, result.ends)
+
+    return best_stops, best_score, controller.report()
+
+
+def solve_exact(
+    matrices: TravelMatrices,
+    params: PlanParams,
+    limits: SearchLimits,
+    threshold: int = EXACT_MAX_CANDIDATES,
+) -> Optional[Tuple[List[List[Stop]], float, Dict[str, Any]]]:
+    """
+    日帰りで候補の観光地が threshold 以下の場合に、分枝限定法で最適なプランを求める。
+    (停留所リスト, 評価値, 探索レポート) を返し、対象外や最適性を示せなかった場合は None。
+    """
+    if params.days != 1:
+        return None
+    evaluator = DayEvaluator(matrices, params)
+    candidates = exact_candidates(evaluator)
+    if len(candidates) > threshold:
+        return None
+    # 停滞による打ち切りは最適性の証明を途中で止めてしまうため使わない
+    controller = SearchController(SearchLimits(
+        time_limit=limits.time_limit, max_iterations=EXACT_NODE_LIMIT, stagnation_time=None))
+    result = solve_day_trip(evaluator, candidates, controller)
+    if result is None:
+        return None
+    route, score = result
+    return _plan_stops(evaluator, [route], [0]), score, controller.report()
+
+
+def _alternatives(
+    graph,
+    evaluator: DayEvaluator,
+    best: Optional[ElitePlan],
+    elites: ElitePool,
+    count: int,
+    start_datetime_str: str,
+) -> List[Dict[str, Any]]:
+    """
+    elites から最良プラン best と十分に異なるプランを count 件まで選び、{"route": [...], "score": 評価値} の形で返す。
+    """
+    alternatives = []
+    for elite in elites.diverse(count, best):
+        stops = _plan_stops(evaluator, list(map(list, elite.routes)), list(elite.ends))
+        alternative = format_itinerary(graph, stops, start_datetime_str)
+        alternative["score"] = elite.score
+        alternatives.append(alternative)
+    return alternatives
+
+
+def _pareto_plans(
+    graph,
+    evaluator: DayEvaluator,
+    front: ParetoFront,
+    count: int,
+    start_datetime_str: str,
+) -> List[Dict[str, Any]]:
+    """
+    パレート解から総費用の幅に沿って count 件までを選び、総費用・観光地数・移動時間（分）と評価値を付けて返す。
+    """
+    plans = []
+    for plan in front.spread(count):
+        stops = _plan_stops(evaluator, list(map(list, plan.routes)), list(plan.ends))
+        output = format_itinerary(graph, stops, start_datetime_str)
+        output["score"] = plan.score
+        output["total_cost"] = plan.cost
+        output["spots"] = plan.spots
+        output["travel_minutes"] = plan.travel_time
+        plans.append(output)
+    return plans
+
+
+def request_seed(city: str, budget: int, days: int, people: int, start_datetime_str: str) -> int:
+    """
+    正規化したリクエスト内容のハッシュから乱数シードを作る。同じ条件のリクエストは同じシードになる。
+    """
+    start_datetime = datetime.fromisoformat(start_datetime_str).replace(second=0, microsecond=0)
+    key = json.dumps([city, int(budget), int(days), int(people), start_datetime.isoformat()])
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big")
+
+
+def plan_itenerary(
+    city: str,
+    budget: int,
+    days: int,
+    people: int,
+    start_datetime_str: str,
+    optimizer: str = "annealing",
+    time_limit: float = DEFAULT_TIME_LIMIT,
+    workers: int = 1,
+    stagnation_iterations: Optional[int] = None,
+    stagnation_time: Optional[float] = DEFAULT_STAGNATION_TIME,
+    seed: Optional[int] = None,
+    max_iterations: Optional[int] = None,
+    exact_threshold: int = EXACT_MAX_CANDIDATES,
+    beam_width: int = DEFAULT_BEAM_WIDTH,
+    alternatives: int = 0,
+    min_distance: float = DEFAULT_MIN_DISTANCE,
+    pareto: int = 0,
+    alpha: float = GRASP_ALPHA,
+) -> json:
     """
     departure_time: チェックアウト時刻（分換算、例:10:00→600）
     ホテルのチェックインは18:00～20:00（1080～1200分）に合わせるため、相対時間として利用可能時間は:
       day_total_time = 1400 - departure_time  （例: departure_time=600 → 800分）
       sightseeing_end_time = 1080 - departure_time  （例: departure_time=600 → 480分）
     start_datetime_str: シミュレーション開始の絶対時刻（ISO形式）
-
+    optimizer: "restart"（貪欲法のランダム再スタートのみ）、"annealing"（再スタートで得た初期解を焼きなましで改善）、
+      "beam"（幅 beam_width のビームサーチで作ったプランを改善。幅を広げるほど遅く、良いプランになる）
+    time_limit: 探索の締め切り（秒、MAX_TIME_LIMIT まで）。厳密解を求めきれずヒューリスティックに切り替えた場合も、
+      両方を合わせてこの時間で締め切る
+    workers: 2 以上の場合、独立した探索をワーカープロセスで並列に走らせ、最も評価値の高いプランを採用する
+      （ワーカープロセスのプールの大きさまで。プールは最初に作られたときの大きさのまま変わらない）
+    stagnation_iterations / stagnation_time: 最良解がこの反復数 / 秒数だけ更新されなければ締め切り前に打ち切る
+    seed: 乱数シード。None の場合はリクエスト内容のハッシュ（request_seed）を使う
+    max_iterations: 反復数の上限（MAX_ITERATIONS まで）。指定すると経過時間による停滞判定は使わず、
+      同じ seed・同じ workers からは常に同じプランを返す（time_limit 内に反復数の上限へ届いた場合）
+    alpha: 貪欲法の再スタート（GRASP）の制限付き候補リストの幅（0～1）。小さいほど貪欲に、大きいほどランダムにプランを作る
+    exact_threshold: 日帰りで候補の観光地がこの数以下なら、ヒューリスティックの代わりに厳密解を求める（0 で無効）
+    alternatives: 1 以上の場合、同じ探索で見つかったプランのうち最良プランと十分に異なるものを最大この数（MAX_ALTERNATIVES まで）だけ
+      "alternatives" に評価値の高い順で加える。どの2案も訪問する観光地の Jaccard 距離が min_distance 以上になるように選ぶ
+    pareto: 1 以上の場合、探索中に見つかったプランのうち総費用・訪問する観光地数・移動時間のどれかで他に劣らない
+      プラン（パレート解）を、総費用の安い順に等間隔で最大この数（MAX_PARETO_PLANS まで）だけ "pareto" に加える。
+      評価値の重み付けを変えて探索し直さなくても、利用者が費用と観光地数の兼ね合いを選べる
+    厳密解は1つのプランしか作らないため、alternatives か pareto を指定した場合は使わない
+
+    出力の "search" には、どの打ち切り条件で探索を終えたか（stop_reason、厳密解なら "optimal"）と反復数、
+    経過時間（厳密解を試した時間も含む）、使ったシードを含める。
     """
-    departure_time = datetime.fromisoformat(
-        start_datetime_str).hour * 60 + datetime.fromisoformat(start_datetime_str).minute
-    # 利用可能な相対時間（分）
-    day_total_time = 1400 - departure_time
-    sightseeing_end_time = 1080 - departure_time
-
-    best_itinerary = None
-    best_score = -1000000
-
-    tourist_data, transportation_data, osaka_transportation_data = load_data()
-    if city not in tourist_data:
-        raise ValueError(f"{city} のデータが見つかりません。")
-    # 2秒で最も高い評価値を持つプランを出力
-    start = time.perf_counter()
-    destinations = tourist_data[city]
-    dest_by_id = {dest["id"]: dest for dest in destinations}
-    valid_ids = set(dest_by_id.keys())
-    trans_lookup = build_transportation_lookup(
-        transportation_data, valid_ids)
-    osaka_lookup = build_osaka_transportation_lookup(
-        osaka_transportation_data, valid_ids)
-    osaka_return_lookup = build_osaka_return_lookup(
-        osaka_transportation_data, valid_ids)
-
-    counter = 0
-
-    while time.perf_counter() - start < 1.5:
-        # 毎回異なるプランを生成するため、観光地の順番をランダムにシャッフル
-        # print(f"counter: {counter}")
-        # counter += 1
-
-        # 大阪駅の情報（ID:0）を定義
-        osaka_station = {
-            "id": 0,
-            "name": "大阪駅",
-            "location": {"lat": 34.702485, "lng": 135.495951},
-            "fare": 0,
-            "staytime": 0,
-            "ishotel": False
-        }
-
-        itinerary = []  # 各日のプラン（リストのリスト）
-        remaining_budget = budget
-        visited = set()  # 観光施設（ホテル以外）は一度訪れたら除外
-
-        destinations = sorted(destinations, key=lambda x: x.get("fare", 1000000))
-
-        # 各日ごとにシミュレーション（※複数日対応の場合、各日のオフセットを後で加算）
-        for day in range(days):
-            day_plan = []
-            if day == 0:
-                day_plan.append({
-                    "destination_id": 0,
-                    "departure_offset": 0,
-                    "travel_cost": 0,
-                    "visit_cost": 0,
-                    "travel_time": 0,
-                    "visit_time": 0,
-                    "arrival_offset": 0,
-                    "total_cost": 0,
-                    "transportation_method": "出発"
-                })
-            
-            current_time = 0  # その日の相対経過時間（分）
-            current_dest = 0  # 初日は大阪（ID:0）から出発
-            # 観光施設（ホテル以外）の訪問を追加
-            while True:
-                candidate = None
-                for dest in destinations:
-                    if dest.get("ishotel"):
-                        continue
-                    if dest["id"] in visited:
-                        continue
-                    if current_dest == 0:
-                        key = (0, dest["id"])
-                        lookup = osaka_lookup
-                    else:
-                        key = (current_dest, dest["id"])
-                        lookup = trans_lookup
-                    if key not in lookup:
-                        continue
-                    travel = lookup[key]
-                    travel_time = travel.get("transportation_time", 1000000)
-                    travel_cost = travel.get("transportation_fare", 1000000)
-                    departure_offset = current_time
-                    arrival_offset = current_time + travel_time
-                    if arrival_offset >= sightseeing_end_time:
-                        continue
-                    visit_time = dest.get("staytime") or 0
-                    total_time = travel_time + visit_time
-                    min_hotel_time = get_min_hotel_travel_time(
-                        dest["id"], trans_lookup, dest_by_id, visited)
-                    if current_time + total_time + min_hotel_time > day_total_time:
-                        continue
-                    total_cost = (
-                        travel_cost + (dest.get("fare") or 0)) * people
-                    if total_cost > remaining_budget:
-                        continue
-                    candidate_info = {
-                        "destination_id": dest["id"],
-                        "departure_offset": current_time,
-                        "travel_cost": travel_cost,
-                        "visit_cost": dest.get("fare") or 0,
-                        "travel_time": travel_time,
-                        "visit_time": visit_time,
-                        "arrival_offset": arrival_offset,
-                        "total_cost": total_cost,
-                        "transportation_method": travel.get("transportation_method"),
-                    }
-                    if candidate is None:
-                        candidate = candidate_info
-                    else:
-                        if random.random() < 0.75:
-                            candidate = candidate_info
-                        else:
-                            if candidate_info["travel_cost"] < candidate["travel_cost"]:
-                                candidate = candidate_info
-                            elif candidate_info["travel_cost"] == candidate["travel_cost"]:
-                                if candidate_info["visit_cost"] > candidate["visit_cost"]:
-                                    candidate = candidate_info
-                if candidate is None:
-                    break
-                day_plan.append(candidate)
-                visited.add(candidate["destination_id"])
-                current_time = candidate["arrival_offset"] + \
-                    candidate["visit_time"]
-                remaining_budget -= candidate["total_cost"]
-                current_dest = candidate["destination_id"]
-
-            # 最終日の場合は大阪への帰りを追加
-            if day == days - 1:
-                return_candidate = select_return_trip(
-                    current_dest, current_time, osaka_return_lookup, remaining_budget, day_total_time)
-                if return_candidate is not None:
-                    day_plan.append(return_candidate)
-                    remaining_budget -= return_candidate["total_cost"]
-                    current_time = return_candidate["arrival_offset"]
-                    current_dest = 0
-            else:
-                # それ以外の日はホテルへのチェックインを追加
-                hotel_candidate = select_hotel_candidate(
-                    current_dest, current_time, osaka_lookup, trans_lookup, dest_by_id, visited, remaining_budget, sightseeing_end_time, day_total_time)
-                if hotel_candidate is not None:
-                    day_plan.append(hotel_candidate)
-                    visited.add(hotel_candidate["destination_id"])
-                    current_time = hotel_candidate["arrival_offset"]
-                    remaining_budget -= (
-                        hotel_candidate["travel_cost"] + hotel_candidate["visit_cost"]) * people
-                    current_dest = hotel_candidate["destination_id"]
-            itinerary.append(day_plan)
-            # もし観光施設（ホテル以外）すべて訪問済みなら終了
-            nonhotel_ids = {d["id"]
-                            for d in destinations if not d.get("ishotel")}
-            if visited.intersection(nonhotel_ids) == nonhotel_ids:
-                break
-
-        # 最終目的地が大阪駅（0）でない場合は空のルートを返す
-        if len(itinerary) == 0 or len(itinerary[-1]) == 0 or itinerary[-1][-1]["destination_id"] != 0:
-            return json.dumps({"route": []}, ensure_ascii=False)
-
-        # 各日のプランを平坦化し、各日ごとのオフセット（1440分＝1日）を加算
-        flat_route = []
-        for day_index, day_plan in enumerate(itinerary):
-            day_offset = day_index * 1440
-            for stop in day_plan:
-                stop["departure_offset"] += day_offset
-                stop["arrival_offset"] += day_offset
-                flat_route.append(stop)
-
-        # ベースの開始日時（ISO形式）から各停留所の出発・到着時刻を算出
-        base_dt = datetime.fromisoformat(start_datetime_str)
-        # 各停留所の出力形式に変換（lat, lng, name, total_cost, transportation_method, departure_time, arrival_time, stay_duration_minutes）
-        # 目的地情報は、id==0 の場合は osaka_station、それ以外は dest_by_id から取得
-        dest_mapping = {**dest_by_id, 0: osaka_station}
-        route_output = []
-        for stop in flat_route:
-            dest_id = stop["destination_id"]
-            dest_info = dest_mapping.get(dest_id, {})
-            output_stop = {
-                "lat": dest_info.get("location", {}).get("lat", 0),
-                "lng": dest_info.get("location", {}).get("lng", 0),
-                "name": dest_info.get("japanese_name", dest_info.get("name", "不明")),
-                "total_cost": stop["total_cost"],
-                "transportation_method": stop["transportation_method"],
-                "departure_time": (base_dt + timedelta(minutes=stop["departure_offset"])).isoformat(),
-                "arrival_time": (base_dt + timedelta(minutes=stop["arrival_offset"])).isoformat(),
-                "stay_duration_minutes": stop["visit_time"],
-            }
-            route_output.append(output_stop)
-        final_output = {"route": route_output}
-
-        # 評価値を算出
-        score = evaluate_plan(json.dumps(
-            final_output, ensure_ascii=False), budget, people)
-        if score > best_score:
-            # print(f"New best score: {score}")
-
-            best_score = score
-            best_itinerary = final_output
-        random.shuffle(destinations)
-
+    if optimizer not in OPTIMIZERS:
+        raise ValueError(f"optimizer は {OPTIMIZERS} のいずれかを指定してください。")
+    alpha = min(max(float(alpha), 0.0), 1.0)
+    params = build_plan_params(budget, days, people, start_datetime_str)
+    if max_iterations is not None:
+        max_iterations = min(max(int(max_iterations), 0), MAX_ITERATIONS)
+        stagnation_time = None
+    limits = SearchLimits(
+        time_limit=min(max(float(time_limit), 0.0), MAX_TIME_LIMIT),
+        max_iterations=max_iterations,
+        stagnation_iterations=stagnation_iterations,
+        stagnation_time=stagnation_time,
+    )
+    if seed is None:
+        seed = request_seed(city, budget, days, people, start_datetime_str)
+    rng = random.Random(seed)
+
+    # 都市データはプロセス内で一度だけ読み込まれ、全リクエストで共有される
+    graph = get_city_graph(city)
+    alternatives = min(max(int(alternatives), 0), MAX_ALTERNATIVES)
+    pareto = min(max(int(pareto), 0), MAX_PARETO_PLANS)
+    archive = None
+    if alternatives or pareto:
+        archive = PlanArchive(
+            elites=ElitePool(elite_pool_size(alternatives + 1), min_distance) if alternatives else None,
+            front=ParetoFront() if pareto else None,
+        )
+    started = time.perf_counter()
+    exact = None if archive is not None else solve_exact(graph.matrices, params, limits, exact_threshold)
+    # 厳密解を求めきれなかった場合、ヒューリスティックにはその残りの時間だけを渡す
+    exact_time = time.perf_counter() - started
+    if exact is None:
+        limits = replace(limits, time_limit=max(limits.time_limit - exact_time, 0.0))
+    if exact is not None:
+        best_stops, best_score, report = exact
+    elif workers > 1 and optimizer != "beam":
+        # プールは全リクエストで共有し大きさを変えないため、それより多いワーカーは使わない
+        workers = pool_workers(workers)
+        results = run_parallel_search(
+            graph, partial(search_plan, alpha=alpha), workers, params, optimizer, limits,
+            [rng.getrandbits(64) for _ in range(workers)], archive)
+        if results:
+            best_index = max(range(len(results)), key=lambda index: results[index][0][1])
+            best_stops, best_score = results[best_index][0][:2]
+            report = merge_reports([result[0][2] for result in results], best_index)
+            for _, worker_archive in results:
+                if worker_archive is not None:
+                    archive.merge(worker_archive)
+        else:
+            # 締め切りまでにどのワーカーも返さなかった（プールが他のリクエストで埋まっていた）ときは、
+            # 持ち時間なしでこのプロセスで探索する（プランを1つは作る）
+            best_stops, best_score, report = search_plan(
+                graph.matrices, params, optimizer, replace(limits, time_limit=0.0), rng, beam_width, archive, alpha)
+    else:
+        # ビームサーチは乱数を使わず、並列に走らせても同じプランになるため常にこのプロセスで行う
+        best_stops, best_score, report = search_plan(
+            graph.matrices, params, optimizer, limits, rng, beam_width, archive, alpha)
+    if exact is None:
+        # 探索のレポートの時刻は探索を始めた時点から数えるため、厳密解を試した時間を足してリクエスト全体の時間にする
+        report["best_found_ms"] = round(report["best_found_ms"] + exact_time * 1000, 1)
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    if best_stops is None:
+        return json.dumps(None)
+    best_itinerary = format_itinerary(graph, best_stops, start_datetime_str)
+    if archive is not None:
+        evaluator = DayEvaluator(graph.matrices, params)
+        plan = _split_feasible(evaluator, best_stops, params.days)
+        best = None
+        if plan is not None:
+            routes, ends = plan
+            best = ElitePlan(best_score, tuple(map(tuple, routes)), tuple(ends),
+                             node_mask(node for route in routes for node in route))
+            # 最良プランは貪欲法の結果そのままで archive に渡していない場合があるため、ここで加える
+            if archive.front is not None:
+                total_cost = sum(evaluator.evaluate(route, end, day)[1]
+                                 for day, (route, end) in enumerate(zip(routes, ends)))
+                archive.offer(evaluator, best_score, total_cost, routes, ends, best.spots)
+        if archive.elites is not None:
+            best_itinerary["alternatives"] = _alternatives(
+                graph, evaluator, best, archive.elites, alternatives, start_datetime_str)
+        if archive.front is not None:
+            best_itinerary["pareto"] = _pareto_plans(graph, evaluator, archive.front, pareto, start_datetime_str)
+    report["seed"] = seed
+    best_itinerary["search"] = report
     return json.dumps(best_itinerary, indent=2, ensure_ascii=False)
-
-# TODO: 焼きなまし実装
-# TODO:
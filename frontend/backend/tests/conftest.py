@@ -0,0 +1,36 @@
+from typing import Optional
+
+import pytest
+
+from optimization import city_store
+from optimization.benchmark import synthetic_city_data
+from optimization.city_store import CityStore, build_city_graph
+
+# テストに使う合成都市の名前
+SYNTHETIC_CITY = "synthetic"
+
+
+def synthetic_graph(size: int, seed: int, neighbors: Optional[int] = None, **kwargs):
+    """
+    benchmark.synthetic_city_data の合成都市の CityGraph。neighbors を省略すると全ノード間の移動データを作る。
+    """
+    destinations, records, osaka_records = synthetic_city_data(
+        size, seed, neighbors=size - 1 if neighbors is None else neighbors)
+    return build_city_graph(SYNTHETIC_CITY, destinations, records, osaka_records, **kwargs)
+
+
+@pytest.fixture(scope="session")
+def small_city():
+    """
+    全ノード間に移動データのある 40 ノードの合成都市。
+    """
+    return synthetic_graph(40, seed=7)
+
+
+@pytest.fixture
+def installed_city(small_city, monkeypatch):
+    """
+    small_city だけを持つ CityStore をプロセスのストアとして差し込み、plan_itenerary などから SYNTHETIC_CITY で引けるようにする。
+    """
+    monkeypatch.setattr(city_store, "_city_store", CityStore({SYNTHETIC_CITY: small_city}))
+    return small_city
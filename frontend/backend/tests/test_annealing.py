@@ -0,0 +1,47 @@
+import random
+
+import numpy as np
+
+from optimization.annealing import AnnealingState, propose_move
+from optimization.itinerary import DayEvaluator, build_plan_params, split_itinerary
+from optimization.travel_matrix import node_mask
+from optimization.travel_planner_for_backend import construct_itinerary
+
+START = "2025-03-10T09:00:00"
+
+
+def test_node_mask():
+    assert node_mask([]) == 0
+    assert node_mask([0, 3, 3, 5]) == 0b101001
+    # NumPy の整数もそのままビットの位置にする（大きな index でもあふれない）
+    assert node_mask(np.array([2, 200], dtype=np.int32)) == (1 << 2) | (1 << 200)
+
+
+def test_in_plan_follows_applied_moves(small_city):
+    matrices = small_city.matrices
+    params = build_plan_params(120000, 3, 2, START)
+    evaluator = DayEvaluator(matrices, params)
+    rng = random.Random(2)
+    itinerary = [[]]
+    while not itinerary[-1]:
+        itinerary, _, _ = construct_itinerary(matrices, params, rng, windows=evaluator.windows)
+    routes, ends = split_itinerary(matrices, itinerary)
+    # 初日の観光地は固定し、プランから外さない
+    locked = node_mask(routes[0])
+    state = AnnealingState(evaluator, routes, ends, locked=locked)
+    applied = 0
+    for _ in range(3000):
+        changes = propose_move(state, rng)
+        if changes is None:
+            continue
+        result = state.evaluate_changes(changes)
+        if result is None:
+            continue
+        state.apply(changes, *result)
+        applied += 1
+        # 差分で更新したビットマスクが、プランから作り直したものと一致し、同じ観光地を2回訪れない
+        nodes = [node for route in state.routes for node in route]
+        assert state.in_plan == node_mask(nodes)
+        assert len(nodes) == len(set(nodes))
+        assert state.in_plan & locked == locked
+    assert applied > 100
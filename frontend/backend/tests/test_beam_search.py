@@ -0,0 +1,57 @@
+import pytest
+
+from optimization.beam_search import BeamConstructor, BeamState
+from optimization.itinerary import NO_HOTEL, DayEvaluator, build_plan_params, consecutive_stays, score_plan
+from optimization.search_control import SearchController, SearchLimits
+
+START = "2025-03-10T09:00:00"
+CONDITIONS = [(20000, 1, 1), (60000, 2, 2), (120000, 3, 3), (40000, 2, 1), (90000, 3, 2)]
+
+
+def _construct(evaluator: DayEvaluator, width: int):
+    controller = SearchController(SearchLimits(time_limit=60, stagnation_time=None))
+    return BeamConstructor(evaluator, width).construct(controller)
+
+
+def _score(evaluator: DayEvaluator, result) -> float:
+    return float("-inf") if result is None else score_plan(result[2], result[3], evaluator.params.budget)
+
+
+@pytest.mark.parametrize("budget, days, people", CONDITIONS)
+def test_beam_plan_is_feasible_and_deterministic(small_city, budget, days, people):
+    evaluator = DayEvaluator(small_city.matrices, build_plan_params(budget, days, people, START))
+    result = _construct(evaluator, 8)
+    assert result is not None
+    routes, ends, num_stops, total_cost = result
+    # ビームで数えた停留所数と総費用が、日ごとに評価し直したものと一致し、予算内に収まる
+    values = [evaluator.evaluate(route, end, day) for day, (route, end) in enumerate(zip(routes, ends))]
+    assert all(value is not None for value in values)
+    assert (sum(value[0] for value in values), sum(value[1] for value in values)) == (num_stops, total_cost)
+    assert sum(value[2] for value in values) <= budget
+    assert ends[-1] == 0 and consecutive_stays(ends)
+    assert len({node for route in routes for node in route}) == sum(len(route) for route in routes)
+    # 乱数を使わないため、同じ幅なら同じプラン
+    assert _construct(evaluator, 8) == result
+
+
+def test_wider_beam_finds_better_plans(small_city):
+    scores = {width: [] for width in (1, 16, 64)}
+    for budget, days, people in CONDITIONS:
+        evaluator = DayEvaluator(small_city.matrices, build_plan_params(budget, days, people, START))
+        for width, width_scores in scores.items():
+            width_scores.append(_score(evaluator, _construct(evaluator, width)))
+    # 幅 1 は貪欲法と同じ。幅を広げると、どの条件でも幅 1 より悪くならず、全体では良くなる
+    assert all(wide >= greedy for wide, greedy in zip(scores[64], scores[1]))
+    assert sum(scores[16]) > sum(scores[1])
+
+
+def test_children_share_parent_steps(small_city):
+    evaluator = DayEvaluator(small_city.matrices, build_plan_params(60000, 2, 2, START))
+    beam = BeamConstructor(evaluator, 4)
+    root = BeamState(0, 0, 0, 0, NO_HOTEL, 1, 0, 0, None, 0.0)
+    children = list(beam._expand(root))
+    grandchildren = [grandchild for child in children for grandchild in beam._expand(child)]
+    assert children and grandchildren
+    # 子の状態は停留所を1つ足した _Step だけを持ち、親のルートをコピーしない
+    child_steps = {id(child.steps) for child in children}
+    assert all(id(grandchild.steps.parent) in child_steps for grandchild in grandchildren)
@@ -0,0 +1,67 @@
+import argparse
+import json
+
+from optimization.benchmark import (
+    BENCHMARK_START, _timed, compare_results, run_benchmark, synthetic_city_data,
+)
+
+
+def test_synthetic_city_is_reproducible():
+    destinations, records, osaka_records = synthetic_city_data(50, seed=3, neighbors=10, first_id=101)
+    assert (destinations, records, osaka_records) == synthetic_city_data(50, seed=3, neighbors=10, first_id=101)
+    assert destinations != synthetic_city_data(50, seed=4, neighbors=10, first_id=101)[0]
+    assert [dest["id"] for dest in destinations] == list(range(101, 151))
+    # 各ノードから近い neighbors ノードへの移動データと、大阪駅から全ノードへの移動データ
+    assert len(records) == 50 * 10 and len(osaka_records) == 50
+    assert any(dest["ishotel"] for dest in destinations) and not all(dest["ishotel"] for dest in destinations)
+
+
+def test_timed_returns_last_result():
+    calls = []
+    result, seconds = _timed(lambda: calls.append(len(calls)) or len(calls), 3)
+    assert result == 3 and len(calls) == 3
+    assert 0 <= seconds["min"] <= seconds["median"]
+    # repeat が 0 以下でも1回は呼ぶ
+    assert _timed(lambda: "once", 0)[0] == "once"
+
+
+def _args(**overrides):
+    args = dict(
+        data=None, cities=[], synthetic=[60], neighbors=20, budget=60000, days=2, people=2, start=BENCHMARK_START,
+        optimizer="annealing", time_limit=30.0, max_iterations=600, seed=1, repeat=1, legacy=False)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def test_synthetic_benchmark_is_machine_readable():
+    result = run_benchmark(_args())
+    # そのまま JSON に書き出せる
+    result = json.loads(json.dumps(result))
+    assert [row["stage"] for row in result["results"]] == ["lookup", "greedy", "search"]
+    for row in result["results"]:
+        assert row["suite"] == "synthetic" and row["city"] == "synthetic-60" and row["nodes"] == 61
+        assert set(row["seconds"]) == {"min", "median"}
+    assert set(result["results"][0]["memory"]) == {"matrices_mb", "build_peak_mb"}
+    for row in result["results"][1:]:
+        quality = row["quality"]
+        assert quality["feasible"] and quality["stops"] >= quality["spots"] > 0
+        assert 0 < quality["budget_use"] <= 1
+    # 反復数で打ち切ると、同じシードからは同じプランの質になる
+    again = run_benchmark(_args())
+    assert [row.get("quality") for row in again["results"]] == [row.get("quality") for row in result["results"]]
+
+
+def test_compare_results():
+    def row(stage, median, score=None):
+        result = {"suite": "synthetic", "city": "synthetic-100", "stage": stage, "seconds": {"median": median}}
+        if score is not None:
+            result["quality"] = {"score": score}
+        return result
+
+    baseline = {"results": [row("lookup", 0.2), row("search", 1.0, 250.0)]}
+    current = {"results": [row("lookup", 0.1), row("search", 1.5, 247.5), row("request", 2.0, 250.0)]}
+    # 以前の結果にない計測は比べない。比が 1 より大きければ遅く、評価値の差が負なら悪くなっている
+    assert compare_results(baseline, current) == [
+        {"suite": "synthetic", "city": "synthetic-100", "stage": "lookup", "time_ratio": 0.5},
+        {"suite": "synthetic", "city": "synthetic-100", "stage": "search", "time_ratio": 1.5, "score_delta": -2.5},
+    ]
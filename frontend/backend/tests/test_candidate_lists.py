@@ -0,0 +1,83 @@
+import random
+
+import numpy as np
+import pytest
+
+from optimization.itinerary import DayEvaluator, build_plan_params, score_plan, split_itinerary
+from optimization.local_search import insert_spots
+from optimization.travel_matrix import (
+    CANDIDATE_CHEAPEST, CANDIDATE_NEAREST, CANDIDATE_RANDOM, INF_TIME, NO_CANDIDATE, build_candidate_lists,
+    candidate_spots, node_mask,
+)
+from optimization.travel_planner_for_backend import construct_itinerary
+
+from conftest import synthetic_graph
+
+START = "2025-03-10T09:00:00"
+
+
+@pytest.fixture(scope="module")
+def wide_city():
+    # 候補リストの幅（24）より観光地の多い都市
+    return synthetic_graph(80, seed=2)
+
+
+def test_candidate_lists_hold_nearest_and_cheapest(wide_city):
+    matrices = wide_city.matrices
+    assert matrices.candidates.shape[1] == CANDIDATE_NEAREST + CANDIDATE_CHEAPEST + CANDIDATE_RANDOM
+    for node in range(matrices.size):
+        row = matrices.candidates[node]
+        listed = candidate_spots(matrices, node)
+        # 空きは末尾だけにあり、重複・自分自身・移動情報のない観光地は含まない
+        assert (row[len(listed):] == NO_CANDIDATE).all()
+        assert len(set(listed.tolist())) == len(listed) and node not in listed
+        assert matrices.is_spot[listed].all()
+        spot_time, _ = matrices.travel(node, listed)
+        assert (spot_time < INF_TIME).all()
+        ends, edge_time, edge_fare = matrices.neighbors(node)
+        reachable = matrices.is_spot[ends] & (edge_time < INF_TIME) & (ends != node)
+        ends, edge_time, edge_fare = ends[reachable], edge_time[reachable], edge_fare[reachable]
+        if len(ends) <= CANDIDATE_NEAREST + CANDIDATE_CHEAPEST + CANDIDATE_RANDOM:
+            assert set(listed.tolist()) == set(ends.tolist())
+            continue
+        # 同順位の選び方によらず、nearest 件目より短い（cheapest 件目より安い）観光地はすべて載っている
+        for values, count in ((edge_time, CANDIDATE_NEAREST), (edge_fare, CANDIDATE_CHEAPEST)):
+            threshold = np.sort(values)[count - 1]
+            assert set(ends[values < threshold].tolist()) <= set(listed.tolist())
+
+
+def test_candidate_lists_are_deterministic(wide_city):
+    matrices = wide_city.matrices
+    edges = (matrices.edge_start, matrices.edge_end, matrices.edge_time, matrices.edge_fare)
+    assert np.array_equal(build_candidate_lists(edges, matrices.spot_indices), matrices.candidates)
+
+
+@pytest.mark.parametrize("budget, days, people", [(60000, 2, 2), (120000, 3, 3)])
+def test_insertion_never_lowers_score(wide_city, budget, days, people):
+    matrices = wide_city.matrices
+    params = build_plan_params(budget, days, people, START)
+    evaluator = DayEvaluator(matrices, params)
+    rng = random.Random(budget)
+    inserted = 0
+    for _ in range(20):
+        itinerary, num_stops, total_cost = construct_itinerary(matrices, params, rng, windows=evaluator.windows)
+        if not itinerary[-1]:
+            continue
+        routes, ends = split_itinerary(matrices, itinerary)
+        values = [evaluator.evaluate(route, end, day) for day, (route, end) in enumerate(zip(routes, ends))]
+        in_plan = node_mask(node for route in routes for node in route)
+        charge = sum(value[2] for value in values)
+        for day, end in enumerate(ends):
+            others = charge - values[day][2]
+            route, value, in_plan = insert_spots(evaluator, routes[day], end, day, budget - others, in_plan)
+            assert value is not None and others + value[2] <= budget
+            assert score_plan(value[0], value[1], budget) >= score_plan(values[day][0], values[day][1], budget)
+            # 挿入した観光地は、その日に通るノード（先に挿入した観光地を含む）のどれかの候補リストに載っている
+            listed = set()
+            for node in [0] + route:
+                listed.update(candidate_spots(matrices, node).tolist())
+            assert set(route) - set(routes[day]) <= listed
+            inserted += len(route) - len(routes[day])
+            routes[day], values[day] = route, value
+            charge = others + value[2]
+    assert inserted > 0
@@ -0,0 +1,73 @@
+import json
+
+import numpy as np
+import pytest
+
+from optimization import city_store
+from optimization.benchmark import synthetic_city_data
+from optimization.city_store import OSAKA_STATION_ID, CityDataUnavailable, build_city_store, load_city_store
+
+
+def _write_data(directory, cities):
+    tourist_data = {}
+    transportation_data = []
+    osaka_data = []
+    first_id = 1
+    for city, size in cities.items():
+        destinations, records, osaka_records = synthetic_city_data(size, seed=size, neighbors=10, first_id=first_id)
+        tourist_data[city] = destinations
+        transportation_data.extend(records)
+        osaka_data.extend(osaka_records)
+        first_id += size
+    for name, data in (("combined_with_info.json", tourist_data), ("transportation_costs.json", transportation_data),
+                       ("Osaka_to_all_spots.json", osaka_data)):
+        with open(directory / name, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+    return tourist_data, transportation_data, osaka_data
+
+
+def test_store_splits_records_by_city(tmp_path):
+    tourist_data, transportation_data, osaka_data = _write_data(tmp_path, {"a": 20, "b": 30})
+    store = build_city_store(tourist_data, transportation_data, osaka_data)
+    assert store.cities == ("a", "b")
+    for city in store.cities:
+        graph = store.get(city)
+        assert graph.ids[0] == OSAKA_STATION_ID
+        assert set(graph.ids[1:]) == {dest["id"] for dest in tourist_data[city]}
+        # 他の都市の移動データは入らない
+        assert all(start in graph.index_of and end in graph.index_of for start, end in graph.trans_lookup)
+    with pytest.raises(ValueError):
+        store.get("unknown")
+
+
+def test_matrices_are_read_only(small_city):
+    matrices = small_city.matrices
+    for name in ("time", "fare", "edge_time", "visit_fare", "hotel_charge", "candidates"):
+        array = getattr(matrices, name)
+        assert isinstance(array, np.ndarray)
+        assert not array.flags.writeable
+
+
+def test_store_is_loaded_once(tmp_path, monkeypatch):
+    _write_data(tmp_path, {"a": 20})
+    monkeypatch.setattr(city_store, "_city_store", None)
+    store = load_city_store(str(tmp_path))
+    # 2回目以降はファイルを読み直さない
+    (tmp_path / "combined_with_info.json").unlink()
+    assert load_city_store(str(tmp_path)) is store
+
+
+def test_missing_data_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(city_store, "_city_store", None)
+    # 移動データのファイルがない・壊れている間は CityDataUnavailable で、ストアは作らない
+    _write_data(tmp_path, {"a": 20})
+    (tmp_path / "transportation_costs.json").unlink()
+    with pytest.raises(CityDataUnavailable):
+        load_city_store(str(tmp_path))
+    (tmp_path / "transportation_costs.json").write_text("[{", encoding="utf-8")
+    with pytest.raises(CityDataUnavailable):
+        load_city_store(str(tmp_path))
+    assert city_store._city_store is None
+    # ファイルが置かれれば次の呼び出しで読み込む
+    _write_data(tmp_path, {"a": 20})
+    assert load_city_store(str(tmp_path)).cities == ("a",)
@@ -0,0 +1,82 @@
+import pytest
+
+from optimization.benchmark import synthetic_city_data
+from optimization.city_store import build_city_graph
+from optimization.exact_solver import exact_candidates, solve_day_trip
+from optimization.itinerary import NO_HOTEL, DayEvaluator, build_plan_params, score_plan
+from optimization.search_control import SearchController, SearchLimits
+
+from conftest import SYNTHETIC_CITY, synthetic_graph
+
+START = "2025-03-10T09:00:00"
+
+
+def _brute_force(evaluator: DayEvaluator):
+    """
+    候補リストや下界を使わず、時刻の制約を満たす全順序をたどって最良の日帰りプランの評価値を求める。
+    """
+    spots = evaluator.matrices.spot_indices.tolist()
+    budget = evaluator.params.budget
+    best = [None, None]
+
+    def visit(route):
+        value = evaluator.evaluate(route, 0, 0)
+        if value is not None and value[2] <= budget:
+            score = score_plan(value[0], value[1], budget)
+            if best[0] is None or score > best[0]:
+                best[:] = [score, list(route)]
+        for node in spots:
+            if node in route:
+                continue
+            route.append(node)
+            # 時刻の制約は訪問を足しても回復しないため、ここで満たさない順序は先をたどらない
+            if evaluator.evaluate(route, NO_HOTEL, 0) is not None:
+                visit(route)
+            route.pop()
+
+    visit([])
+    return best
+
+
+def _solve(evaluator: DayEvaluator):
+    controller = SearchController(SearchLimits(time_limit=60, max_iterations=10 ** 6, stagnation_time=None))
+    return solve_day_trip(evaluator, exact_candidates(evaluator), controller)
+
+
+@pytest.mark.parametrize("seed", [1, 3, 5])
+@pytest.mark.parametrize("budget, people", [(2000, 1), (5000, 1), (10000, 1), (10000, 3), (30000, 3)])
+def test_matches_brute_force(seed, budget, people):
+    graph = synthetic_graph(14, seed=seed)
+    assert len(graph.matrices.spot_indices) <= 12
+    evaluator = DayEvaluator(graph.matrices, build_plan_params(budget, 1, people, START))
+    best_score, best_route = _brute_force(evaluator)
+    result = _solve(evaluator)
+    if best_score is None:
+        assert result is None
+        return
+    route, score = result
+    assert score == pytest.approx(best_score)
+    value = evaluator.evaluate(route, 0, 0)
+    assert value is not None and value[2] <= budget
+    assert score_plan(value[0], value[1], budget) == pytest.approx(best_score)
+
+
+def test_cheaper_return_through_another_spot():
+    # 観光地 1 は大阪駅との直通の運賃が高く、それだけを回って帰ると予算を超えるが、
+    # 運賃 0 で移れる他の観光地を経由すれば予算内で帰れる
+    destinations, records, osaka_records = synthetic_city_data(4, 1, neighbors=3)
+    for destination in destinations:
+        destination["ishotel"] = False
+        destination["fare"] = 0
+        destination["staytime"] = 30
+    for record in records:
+        record["transportation_fare"] = 0
+    for record in osaka_records:
+        record["transportation_fare"] = 9000 if record["end_destination_id"] == 1 else 1000
+    graph = build_city_graph(SYNTHETIC_CITY, destinations, records, osaka_records)
+    evaluator = DayEvaluator(graph.matrices, build_plan_params(3000, 1, 1, START))
+    assert graph.index_of[1] in exact_candidates(evaluator)
+    best_score, best_route = _brute_force(evaluator)
+    route, score = _solve(evaluator)
+    assert graph.index_of[1] in best_route
+    assert score == pytest.approx(best_score)
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from optimization.itinerary import NO_HOTEL, DayEvaluator, FinishBounds, build_plan_params, split_itinerary
+from optimization.travel_matrix import INF_CHARGE, INF_TIME
+from optimization.travel_planner_for_backend import construct_itinerary
+
+from conftest import synthetic_graph
+
+START = "2025-03-10T09:00:00"
+
+
+def _min_finish(matrices, people: int, node: int, terminal):
+    """
+    node から観光地を（同じ所は1回まで）たどり、最後のノードで terminal を払って終える額の最小値を全経路から求める。
+    """
+    spots = matrices.spot_indices.tolist()
+    best = INF_CHARGE
+
+    def visit(current, charge, seen):
+        nonlocal best
+        best = min(best, charge + terminal[current])
+        for spot in spots:
+            if spot in seen or matrices.time[current][spot] >= INF_TIME:
+                continue
+            step = (int(matrices.fare[current][spot]) + int(matrices.visit_fare[spot])) * people
+            visit(spot, charge + step, seen | {spot})
+
+    visit(node, 0, {node})
+    return best
+
+
+@pytest.mark.parametrize("people", [1, 3])
+def test_bounds_equal_cheapest_finish(people):
+    matrices = synthetic_graph(8, seed=4).matrices
+    params = build_plan_params(100000, 3, people, START)
+    bounds = FinishBounds(matrices, params)
+    return_fare = matrices.return_fare.tolist()
+    hotel_charge = (matrices.hotel_charge * people).tolist()
+    for node in range(matrices.size):
+        # 最終日はそのノードから帰る額、それ以外の日は今夜のホテルに着く額の最小値（直接向かう額以下）
+        assert bounds.reserve(2, node, True) == _min_finish(matrices, people, node, return_fare) <= return_fare[node]
+        tonight = _min_finish(matrices, people, node, hotel_charge)
+        assert bounds.reserve(0, node, True) - bounds.after_tonight(0, True) == tonight <= hotel_charge[node]
+    # 最終日は大阪駅から観光地を1か所以上回って帰る
+    spots = matrices.spot_indices.tolist()
+    assert bounds.min_return == min(
+        (int(matrices.fare[0][spot]) + int(matrices.visit_fare[spot])) * people
+        + _min_finish(matrices, people, spot, return_fare) for spot in spots)
+
+
+def _day_charge(matrices, people: int, path, end: int) -> int:
+    """
+    path[0] を出て残りの観光地を回り、end（大阪駅 / ホテル / NO_HOTEL）でその日を終えるまでの予算差引額。
+    """
+    charge = 0
+    for current, spot in zip(path, path[1:]):
+        charge += (int(matrices.fare[current][spot]) + int(matrices.visit_fare[spot])) * people
+    if end == 0:
+        charge += int(matrices.fare[path[-1]][0])
+    elif end != NO_HOTEL:
+        charge += (int(matrices.fare[path[-1]][end]) + int(matrices.visit_fare[end])) * people
+    return charge
+
+
+@pytest.mark.parametrize("budget, days, people", [(40000, 2, 2), (90000, 3, 2), (150000, 3, 3)])
+def test_bounds_never_exceed_remaining_charge(small_city, budget, days, people):
+    matrices = small_city.matrices
+    params = build_plan_params(budget, days, people, START)
+    evaluator = DayEvaluator(matrices, params)
+    bounds = FinishBounds(matrices, params)
+    rng = random.Random(days)
+    checked = 0
+    for _ in range(50):
+        itinerary, _, _ = construct_itinerary(matrices, params, rng, windows=evaluator.windows, bounds=bounds)
+        if len(itinerary) != days or not itinerary[-1] or itinerary[-1][-1].destination_id != 0:
+            continue
+        routes, ends = split_itinerary(matrices, itinerary)
+        charges = [evaluator.evaluate(route, end, day)[2] for day, (route, end) in enumerate(zip(routes, ends))]
+        all_hotels = NO_HOTEL not in ends[:-1]
+        for day, (route, end) in enumerate(zip(routes, ends)):
+            for k, node in enumerate(route):
+                # 観光地 node を出てから旅程を終えるまでに実際に差し引いた額
+                remaining = _day_charge(matrices, people, [node] + route[k + 1:], end) + sum(charges[day + 1:])
+                assert bounds.reserve(day, node, all_hotels) <= remaining
+                checked += 1
+        assert bounds.min_return <= charges[-1]
+    assert checked > 0
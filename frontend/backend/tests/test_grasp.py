@@ -0,0 +1,52 @@
+import random
+
+import numpy as np
+import pytest
+
+from optimization.itinerary import build_plan_params
+from optimization.search_control import SearchLimits
+from optimization.travel_matrix import restricted_choice
+from optimization.travel_planner_for_backend import GRASP_ALPHA, RESTART_WEIGHT, construct_itinerary, search_plan
+
+START = "2025-03-10T09:00:00"
+CONDITIONS = [(20000, 1, 1), (60000, 2, 2), (120000, 3, 3)]
+
+
+def _chosen(gains, alpha, count=100):
+    return {restricted_choice(np.array(gains, dtype=float), alpha, draw / count) for draw in range(count)}
+
+
+def test_restricted_choice():
+    gains = [0.0, 5.0, 8.0, 10.0]
+    # alpha = 0 は最もよい候補だけ、alpha = 1 は全候補から選ぶ
+    assert _chosen(gains, 0.0) == {3}
+    assert _chosen(gains, 1.0) == {0, 1, 2, 3}
+    # 最大値 - alpha × 幅（10 - 0.5 × 10 = 5）以上の候補が RCL
+    assert _chosen(gains, 0.5) == {1, 2, 3}
+    # 評価が同じ最良の候補はどちらも選ばれうる
+    assert _chosen([1.0, 3.0, 3.0], 0.0) == {1, 2}
+    # draw を RCL の大きさで区切って一様に選ぶ
+    assert restricted_choice(np.array(gains), 1.0, 0.0) == 0
+    assert restricted_choice(np.array(gains), 1.0, 0.99) == 3
+
+
+@pytest.mark.parametrize("budget, days, people", CONDITIONS)
+def test_zero_alpha_is_greedy(small_city, budget, days, people):
+    params = build_plan_params(budget, days, people, START)
+    plans = {construct_itinerary(small_city.matrices, params, random.Random(seed), alpha=0.0)[1:] for seed in range(5)}
+    # 乱数によらず同じプラン
+    assert len(plans) == 1
+
+
+@pytest.mark.parametrize("budget, days, people", CONDITIONS)
+def test_restricted_list_beats_greedy_and_random(small_city, budget, days, people):
+    params = build_plan_params(budget, days, people, START)
+    # 同じ回数（20 回）の再スタートで比べる
+    limits = SearchLimits(time_limit=60, max_iterations=RESTART_WEIGHT * 20, stagnation_time=None)
+
+    def best_score(alpha):
+        return search_plan(small_city.matrices, params, "restart", limits, random.Random(1), alpha=alpha)[1]
+
+    grasp = best_score(GRASP_ALPHA)
+    assert grasp > best_score(0.0)
+    assert grasp > best_score(1.0)
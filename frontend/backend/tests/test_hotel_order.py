@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from optimization.benchmark import synthetic_city_data
+from optimization.city_store import build_city_graph, extract_osaka_records
+from optimization.travel_matrix import (
+    INF_TIME, build_sparse_travel_matrices, min_hotel_travel_times, nearest_unvisited_hotel,
+)
+
+from conftest import SYNTHETIC_CITY
+
+
+def _brute_force(matrices, visited):
+    """
+    全ノード × 未訪問ホテルの移動時間を1つずつ比べた (最も近いホテル, 移動時間)。同じ時間なら index の小さいホテル。
+    """
+    nearest = []
+    for node in range(matrices.size):
+        best = (-1, INF_TIME)
+        for hotel in matrices.hotel_indices.tolist():
+            travel_time = int(matrices.travel(node, hotel)[0])
+            if not visited[hotel] and travel_time < best[1]:
+                best = (hotel, travel_time)
+        nearest.append(best)
+    return nearest
+
+
+@pytest.mark.parametrize("max_travel_time", [None, 30])
+def test_nearest_hotel_tables_match_full_scan(max_travel_time):
+    destinations, records, osaka_records = synthetic_city_data(60, seed=9, neighbors=59)
+    graph = build_city_graph(SYNTHETIC_CITY, destinations, records, osaka_records)
+    matrices = graph.matrices
+    if max_travel_time is not None:
+        # 移動時間の上限を付けた CSR だけの表では、行けないホテルがあり、表は近い SPARSE_HOTEL_ORDER 件まで
+        matrices = build_sparse_travel_matrices(
+            graph.ids, graph.dest_by_id, records, extract_osaka_records(osaka_records), max_travel_time)
+        assert (matrices.hotel_order_time >= INF_TIME).any()
+    hotels = matrices.hotel_indices
+    rng = np.random.default_rng(0)
+    for checked_out in (0, 1, 3, len(hotels) - 1, len(hotels)):
+        visited = np.zeros(matrices.size, dtype=bool)
+        visited[rng.choice(hotels, size=checked_out, replace=False)] = True
+        # 観光地の訪問はホテルの表に影響しない
+        visited[rng.choice(matrices.spot_indices, size=10, replace=False)] = True
+        expected = _brute_force(matrices, visited)
+        assert [nearest_unvisited_hotel(matrices, node, visited) for node in range(matrices.size)] == expected
+        assert min_hotel_travel_times(matrices, visited).tolist() == [travel_time for _, travel_time in expected]
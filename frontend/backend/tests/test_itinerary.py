@@ -0,0 +1,67 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from optimization.itinerary import DayEvaluator, Stop, build_plan_params, format_itinerary, split_itinerary
+from optimization.travel_planner_for_backend import construct_itinerary
+
+START = "2025-03-10T09:00:00"
+
+
+def _fields(stop: Stop):
+    return tuple(getattr(stop, name) for name in Stop.__slots__)
+
+
+def test_stop_has_no_instance_dict():
+    stop = Stop(3, 0, 120, 500, 15, 60, 15, 620, "電車")
+    assert not hasattr(stop, "__dict__")
+    with pytest.raises(AttributeError):
+        stop.name = "追加の属性"
+
+
+@pytest.mark.parametrize("budget, days, people", [(20000, 1, 1), (60000, 2, 2), (120000, 3, 3)])
+def test_constructed_stops_match_evaluator(small_city, budget, days, people):
+    matrices = small_city.matrices
+    params = build_plan_params(budget, days, people, START)
+    evaluator = DayEvaluator(matrices, params)
+    rng = random.Random(budget)
+    for _ in range(20):
+        itinerary, num_stops, total_cost = construct_itinerary(matrices, params, rng, windows=evaluator.windows)
+        if not itinerary[-1]:
+            continue
+        # 構築中に選んだ停留所だけを作った Stop が、ルートから作り直した Stop とすべての項目で一致する
+        routes, ends = split_itinerary(matrices, itinerary)
+        rebuilt = [evaluator.stops(route, end, day) for day, (route, end) in enumerate(zip(routes, ends))]
+        assert [[_fields(stop) for stop in day_plan] for day_plan in itinerary] == \
+            [[_fields(stop) for stop in day_plan] for day_plan in rebuilt]
+        assert num_stops == sum(len(day_plan) for day_plan in itinerary)
+        assert total_cost == sum(stop.total_cost for day_plan in itinerary for stop in day_plan)
+
+
+def test_format_itinerary_output(small_city):
+    matrices = small_city.matrices
+    params = build_plan_params(60000, 2, 2, START)
+    evaluator = DayEvaluator(matrices, params)
+    rng = random.Random(1)
+    itinerary = [[]]
+    while not itinerary[-1]:
+        itinerary, _, _ = construct_itinerary(matrices, params, rng, windows=evaluator.windows)
+    route = format_itinerary(small_city, itinerary, START)["route"]
+    stops = [(day, stop) for day, day_plan in enumerate(itinerary) for stop in day_plan]
+    assert len(route) == len(stops)
+    base = datetime.fromisoformat(START)
+    for output, (day, stop) in zip(route, stops):
+        assert output["destination_id"] == small_city.ids[stop.destination_id]
+        assert output["day"] == day
+        assert output["total_cost"] == stop.total_cost
+        assert output["stay_duration_minutes"] == stop.visit_time
+        assert output["transportation_method"] == stop.transportation_method
+        departure = datetime.fromisoformat(output["departure_time"])
+        arrival = datetime.fromisoformat(output["arrival_time"])
+        # 時刻は出発日時に日数と日ごとの相対時間を足したもの
+        assert departure == base + timedelta(days=day, minutes=stop.departure_offset)
+        assert arrival - departure == timedelta(minutes=stop.travel_time)
+    # 初日は大阪駅を出発し、最終日は大阪駅に戻る
+    assert route[0]["transportation_method"] == "出発" and route[0]["departure_time"] == START
+    assert route[-1]["destination_id"] == 0 and route[-1]["day"] == params.days - 1
@@ -0,0 +1,152 @@
+import random
+
+import pytest
+
+from optimization.itinerary import (
+    NO_HOTEL, DayEvaluator, build_plan_params, consecutive_stays, format_itinerary, score_plan, split_itinerary,
+)
+from optimization.local_search import (
+    DayRoute, _or_opt_route, _two_opt_route, choose_base_hotel, improve_plan, insert_spots,
+)
+from optimization.travel_matrix import node_mask
+from optimization.travel_planner_for_backend import construct_itinerary
+
+START = "2025-03-10T09:00:00"
+
+
+def _travel_to_last(evaluator: DayEvaluator, route):
+    path = [0] + route
+    return sum(evaluator.time[path[k - 1]][path[k]] for k in range(1, len(path))), path[-1]
+
+
+def _random_routes(matrices, count: int, seed: int):
+    rng = random.Random(seed)
+    spots = matrices.spot_indices.tolist()
+    return [rng.sample(spots, rng.randint(2, 7)) for _ in range(count)]
+
+
+def test_moves_match_full_evaluation(small_city):
+    evaluator = DayEvaluator(small_city.matrices, build_plan_params(60000, 2, 2, START))
+    unused = set(small_city.matrices.spot_indices.tolist())
+    for route in _random_routes(small_city.matrices, 30, seed=3):
+        day = DayRoute(evaluator, route, NO_HOTEL)
+        n = len(route)
+        for i in range(1, n):
+            for j in range(i + 1, n + 1):
+                assert day.two_opt(i, j) == _travel_to_last(evaluator, _two_opt_route(route, i, j))
+        for a in range(1, n + 1):
+            for b in range(a, min(a + 2, n) + 1):
+                for k in range(0, n + 1):
+                    if a - 1 <= k <= b:
+                        continue
+                    assert day.or_opt(a, b, k) == _travel_to_last(evaluator, _or_opt_route(route, a, b, k))
+        node = min(unused - set(route))
+        for k in range(n + 1):
+            assert day.insertion(node, k) == _travel_to_last(evaluator, route[:k] + [node] + route[k:])
+
+
+@pytest.mark.parametrize("budget, days, people", [(20000, 1, 1), (60000, 2, 2), (120000, 3, 3)])
+def test_improve_plan_never_lowers_score(small_city, budget, days, people):
+    matrices = small_city.matrices
+    params = build_plan_params(budget, days, people, START)
+    evaluator = DayEvaluator(matrices, params)
+    rng = random.Random(budget)
+    improved = 0
+    for _ in range(30):
+        itinerary, num_stops, total_cost = construct_itinerary(matrices, params, rng, windows=evaluator.windows)
+        if not itinerary[-1]:
+            continue
+        before = score_plan(num_stops, total_cost, params.budget)
+        routes, ends = split_itinerary(matrices, itinerary)
+        routes, num_stops, total_cost = improve_plan(evaluator, routes, ends)
+        after = score_plan(num_stops, total_cost, params.budget)
+        assert after >= before - 1e-9
+        # 改善後のプランも制約と予算を満たす
+        values = [evaluator.evaluate(route, end, day) for day, (route, end) in enumerate(zip(routes, ends))]
+        assert all(value is not None for value in values)
+        assert sum(value[2] for value in values) <= params.budget
+        improved += after > before
+    assert improved > 0
+
+
+def test_consecutive_stays():
+    # 同じホテルに続けて泊まる夜は1回の滞在にまとめる
+    assert consecutive_stays([5, 5, 5, 0])
+    assert consecutive_stays([5, 7, 7, 0])
+    assert consecutive_stays([NO_HOTEL, 5, 5, 0])
+    # チェックアウトしたホテルには、間にホテルなしの夜を挟んでも戻らない
+    assert not consecutive_stays([5, 7, 5, 0])
+    assert not consecutive_stays([5, NO_HOTEL, 5, 0])
+
+
+def _single_hotel_plans(evaluator: DayEvaluator, routes, last_end):
+    """
+    最終日以外のすべての夜を各ホテルで連泊する案を、1日ずつ evaluate して求めた (評価値, 各日の終点, 停留所数, 総費用)。
+    """
+    params = evaluator.params
+    plans = []
+    for hotel in evaluator.matrices.hotel_indices.tolist():
+        ends = [hotel] * (len(routes) - 1) + [last_end]
+        values = [evaluator.evaluate(route, end, day) for day, (route, end) in enumerate(zip(routes, ends))]
+        if any(value is None for value in values) or sum(value[2] for value in values) > params.budget:
+            continue
+        num_stops = sum(value[0] for value in values)
+        total_cost = sum(value[1] for value in values)
+        plans.append((score_plan(num_stops, total_cost, params.budget), ends, num_stops, total_cost))
+    return plans
+
+
+def test_base_hotel_matches_per_hotel_evaluation(small_city):
+    matrices = small_city.matrices
+    params = build_plan_params(120000, 3, 2, START)
+    evaluator = DayEvaluator(matrices, params)
+    rng = random.Random(4)
+    based_plans = 0
+    for _ in range(40):
+        itinerary, _, _ = construct_itinerary(matrices, params, rng, windows=evaluator.windows)
+        if not itinerary[-1]:
+            continue
+        routes, ends = split_itinerary(matrices, itinerary)
+        routes, num_stops, total_cost = improve_plan(evaluator, routes, ends)
+        current = score_plan(num_stops, total_cost, params.budget)
+        based = choose_base_hotel(evaluator, routes, ends)
+        best = max(_single_hotel_plans(evaluator, routes, ends[-1]), key=lambda plan: plan[0], default=None)
+        if best is None or best[0] <= current:
+            assert based is None
+            continue
+        based_ends, based_stops, based_cost = based
+        assert score_plan(based_stops, based_cost, params.budget) == pytest.approx(best[0])
+        assert len(set(based_ends[:-1])) == 1 and consecutive_stays(based_ends)
+        # 出力でも、最終日以外の各日は同じホテルで終わり、最終日は大阪駅に戻る
+        stops = [evaluator.stops(route, end, day) for day, (route, end) in enumerate(zip(routes, based_ends))]
+        output = format_itinerary(small_city, stops, START)
+        last_stops = [[stop for stop in output["route"] if stop["day"] == day][-1] for day in range(params.days)]
+        hotel_id = small_city.ids[based_ends[0]]
+        assert [stop["destination_id"] for stop in last_stops] == [hotel_id, hotel_id, 0]
+        assert sum(stop["total_cost"] for stop in output["route"]) == based_cost
+        based_plans += 1
+    assert based_plans > 0
+
+
+def test_insert_spots_updates_mask(small_city):
+    matrices = small_city.matrices
+    params = build_plan_params(60000, 2, 2, START)
+    evaluator = DayEvaluator(matrices, params)
+    rng = random.Random(6)
+    inserted = 0
+    for _ in range(30):
+        itinerary, _, _ = construct_itinerary(matrices, params, rng, windows=evaluator.windows)
+        if not itinerary[-1]:
+            continue
+        routes, ends = split_itinerary(matrices, itinerary)
+        # 初日の後半の観光地を外して、空いた時間に挿入させる
+        routes[0] = routes[0][:len(routes[0]) // 2]
+        in_plan = node_mask(node for route in routes for node in route)
+        route, value, updated = insert_spots(evaluator, routes[0], ends[0], 0, params.budget, in_plan)
+        added = set(route) - set(routes[0])
+        # 挿入するのはプランにまだない観光地だけで、返すビットマスクにはそれが加わる
+        assert not node_mask(added) & in_plan
+        assert updated == in_plan | node_mask(added)
+        assert value == evaluator.evaluate(route, ends[0], 0)
+        inserted += len(added)
+    assert inserted > 0
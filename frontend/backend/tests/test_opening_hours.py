@@ -0,0 +1,88 @@
+import numpy as np
+
+from optimization.opening_hours import (
+    ALWAYS_OPEN, MINUTES_PER_DAY, MINUTES_PER_WEEK, build_opening_table, compact_opening_hours, opening_windows,
+)
+
+# 曜日（Places API と同じく日曜 0）
+SUNDAY, MONDAY, TUESDAY, FRIDAY, SATURDAY = 0, 1, 2, 5, 6
+
+
+def _period(open_day, open_hour, close_day=None, close_hour=None):
+    period = {"open": {"day": open_day, "hour": open_hour, "minute": 0}}
+    if close_day is not None:
+        period["close"] = {"day": close_day, "hour": close_hour, "minute": 0}
+    return period
+
+
+def _minute(day, hour):
+    return day * MINUTES_PER_DAY + hour * 60
+
+
+def test_compact_opening_hours():
+    # 情報がなければ常に営業として扱う
+    assert compact_opening_hours(None) is None
+    assert compact_opening_hours({"periods": []}) is None
+    # close のない期間は24時間営業
+    assert compact_opening_hours({"periods": [_period(SUNDAY, 0)]}) == [[0, MINUTES_PER_WEEK]]
+    # 1日に2つの区間（昼と夜）。開店の昇順に並べ、重なる区間はまとめる
+    hours = compact_opening_hours({"periods": [
+        _period(MONDAY, 17, MONDAY, 22), _period(MONDAY, 11, MONDAY, 14), _period(MONDAY, 13, MONDAY, 15),
+    ]})
+    assert hours == [[_minute(MONDAY, 11), _minute(MONDAY, 15)], [_minute(MONDAY, 17), _minute(MONDAY, 22)]]
+    # 日付をまたぐ営業（金曜 18:00～土曜 2:00）は1つの区間
+    overnight = compact_opening_hours({"periods": [_period(FRIDAY, 18, SATURDAY, 2)]})
+    assert overnight == [[_minute(FRIDAY, 18), _minute(SATURDAY, 2)]]
+    # 週をまたぐ営業（土曜 20:00～日曜 3:00）は週の初めと終わりの2つに分ける
+    wrapped = compact_opening_hours({"periods": [_period(SATURDAY, 20, SUNDAY, 3)]})
+    assert wrapped == [[0, _minute(SUNDAY, 3)], [_minute(SATURDAY, 20), MINUTES_PER_WEEK]]
+
+
+def _windows(hours, staytime, start_day, days, is_spot=None):
+    """
+    ノード 0 を大阪駅（観光地でない）とし、hours のノードを 1 から並べた都市で、start_day の 9:00 に出発する旅程の
+    日ごとの (earliest, latest) を、ノードごとのリストで返す。
+    """
+    hours = [None] + hours
+    staytime = np.array([0] + staytime, dtype=np.int32)
+    is_spot = np.array([False] + (is_spot or [True] * (len(hours) - 1)))
+    windows = opening_windows(build_opening_table(hours), staytime, is_spot, _minute(start_day, 9), days)
+    return [list(zip(windows.earliest[:, node].tolist(), windows.latest[:, node].tolist()))
+            for node in range(len(hours))]
+
+
+def _closed(window):
+    earliest, latest = window
+    return earliest > latest
+
+
+def test_windows_use_the_longest_interval():
+    lunch_and_dinner = [[_minute(MONDAY, 11), _minute(MONDAY, 14)], [_minute(MONDAY, 17), _minute(MONDAY, 22)]]
+    station, restaurant, unknown, hotel = _windows(
+        [lunch_and_dinner, None, lunch_and_dinner], [60, 60, 60], MONDAY, 1, is_spot=[True, True, False])
+    # 9:00 出発。昼（2:00～4:00 に着けば閉店までに滞在を終えられる）より長い夜（8:00～12:00）を使う
+    assert restaurant == [(8 * 60, 12 * 60)]
+    # 営業時間の情報がない観光地とホテルはいつでも着いてよい
+    assert station == unknown == hotel == [(0, ALWAYS_OPEN)]
+
+
+def test_windows_on_closed_days():
+    # 火曜～土曜の 10:00～17:00 だけ営業（日曜・月曜定休）
+    weekdays = [[_minute(day, 10), _minute(day, 17)] for day in range(TUESDAY, SATURDAY + 1)]
+    _, museum = _windows([weekdays], [90], SUNDAY, 3)
+    assert _closed(museum[0]) and _closed(museum[1])
+    assert museum[2] == (60, 8 * 60 - 90)
+
+
+def test_windows_for_overnight_hours():
+    bar = [[_minute(FRIDAY, 18), _minute(SATURDAY, 2)]]
+    _, friday_bar = _windows([bar], [60], FRIDAY, 2)
+    # 金曜は 18:00 に開き、日付をまたいだ閉店（翌 2:00）までに滞在を終えればよい。土曜の 9:00 以降は閉まっている
+    assert friday_bar[0] == (9 * 60, 17 * 60 - 60)
+    assert _closed(friday_bar[1])
+
+    # 週をまたぐ営業（土曜 20:00～日曜 3:00）も、土曜の夜に着ける
+    wrapped = [[0, _minute(SUNDAY, 3)], [_minute(SATURDAY, 20), MINUTES_PER_WEEK]]
+    _, saturday_bar = _windows([wrapped], [30], SATURDAY, 2)
+    assert saturday_bar[0] == (11 * 60, 15 * 60 - 30)
+    assert _closed(saturday_bar[1])
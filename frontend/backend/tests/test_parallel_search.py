@@ -0,0 +1,116 @@
+import json
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from optimization import parallel_search
+from optimization.parallel_search import pool_workers, run_parallel_search, start_worker_pool
+from optimization.search_control import SearchLimits
+from optimization.travel_planner_for_backend import plan_itenerary
+
+
+class _FakeExecutor:
+    """
+    プロセスを起動せず、その場でタスクを実行するプール。作られた数と閉じられたかだけを記録する。
+    """
+    created = []
+
+    def __init__(self, max_workers, mp_context=None):
+        self.max_workers = max_workers
+        self.closed = False
+        _FakeExecutor.created.append(self)
+
+    def submit(self, fn, *args, **kwargs):
+        if self.closed:
+            raise RuntimeError("cannot schedule new futures after shutdown")
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+    def shutdown(self, wait=True):
+        self.closed = True
+
+
+def _make_busy(executor, finished):
+    """
+    プールを他のリクエストで埋まった状態にする。この後の最初の finished 件だけ実行し、残りのタスクは始まらないまま返らない。
+    """
+    submit = executor.submit
+
+    def busy_submit(fn, *args, **kwargs):
+        nonlocal finished
+        if finished <= 0:
+            return Future()
+        finished -= 1
+        return submit(fn, *args, **kwargs)
+
+    executor.submit = busy_submit
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    _FakeExecutor.created = []
+    monkeypatch.setattr(parallel_search, "ProcessPoolExecutor", _FakeExecutor)
+    monkeypatch.setattr(parallel_search, "_pool", None)
+    monkeypatch.setattr(parallel_search, "_pool_workers", 0)
+    yield _FakeExecutor.created
+    # 都市ごとの共有メモリは都市名で使い回されるため、他のテストの同名の合成都市に残さない
+    parallel_search.shutdown_worker_pool()
+    for shm, _ in parallel_search._attached.values():
+        shm.close()
+    parallel_search._attached.clear()
+
+
+def test_pool_is_not_replaced_by_larger_request(fake_pool):
+    executor = start_worker_pool(2)
+    # 実行中のリクエストがプールを使っている間に、より多いワーカーを求めるリクエストが来ても作り直さない
+    assert pool_workers(8) == 2
+    assert start_worker_pool(8) is executor
+    assert len(fake_pool) == 1 and not executor.closed
+    executor.submit(int)
+    assert pool_workers(1) == 1
+
+
+def test_first_request_sizes_pool(fake_pool):
+    assert pool_workers(3) == 3
+    assert fake_pool[0].max_workers == 3
+
+
+def test_parallel_plan_uses_at_most_pool_size(installed_city, fake_pool):
+    start_worker_pool(2)
+    result = json.loads(plan_itenerary(
+        "synthetic", 60000, 2, 2, "2025-03-10T09:00:00", workers=4, seed=3, max_iterations=2000, exact_threshold=0))
+    assert result["route"][-1]["destination_id"] == 0
+    assert result["search"]["workers"] == 2
+
+
+def test_workers_share_one_deadline(installed_city, fake_pool, monkeypatch):
+    monkeypatch.setattr(parallel_search, "RESULT_GRACE_TIME", 0.1)
+    _make_busy(start_worker_pool(3), finished=1)
+    seen = []
+
+    def search(matrices, params, optimizer, limits, rng, archive=None):
+        seen.append(limits.time_limit)
+        return [], 0.0, {}
+
+    start = time.perf_counter()
+    results = run_parallel_search(
+        installed_city, search, 3, None, "restart", SearchLimits(time_limit=0.3), [1, 2, 3], None)
+    # 返らないワーカーは締め切りと猶予の後に捨て、返ってきたものだけを使う
+    assert len(results) == 1
+    assert time.perf_counter() - start < 0.3 + 0.1 + 0.2
+    # ワーカーの持ち時間はリクエスト全体の締め切りまで
+    assert len(seen) == 1 and 0.0 < seen[0] <= 0.3
+
+
+def test_busy_pool_still_returns_plan(installed_city, fake_pool, monkeypatch):
+    monkeypatch.setattr(parallel_search, "RESULT_GRACE_TIME", 0.0)
+    _make_busy(start_worker_pool(2), finished=0)
+    start = time.perf_counter()
+    result = json.loads(plan_itenerary(
+        "synthetic", 60000, 2, 2, "2025-03-10T09:00:00", workers=2, seed=3, time_limit=0.2, exact_threshold=0))
+    # どのワーカーも返らなくても、締め切りの後にこのプロセスでプランを1つ作る
+    assert time.perf_counter() - start < 0.2 + 0.3
+    assert result["route"][-1]["destination_id"] == 0
+    assert "workers" not in result["search"]
@@ -0,0 +1,82 @@
+import json
+import random
+
+import pytest
+
+from optimization.plan_archive import MAX_PARETO_PLANS, ParetoFront
+from optimization.travel_planner_for_backend import plan_itenerary
+
+
+def _triples(front):
+    return sorted((plan.cost, plan.spots, plan.travel_time) for plan in front.plans())
+
+
+def _brute_force_front(offers):
+    """
+    どの組にも支配されない (総費用, 観光地数, 移動時間) の組（同じ組は1つ）を、全組を比べて求める。
+    """
+    def dominates(a, b):
+        return a != b and a[0] <= b[0] and a[1] >= b[1] and a[2] <= b[2]
+
+    unique = set(offers)
+    return sorted(triple for triple in unique if not any(dominates(other, triple) for other in unique))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_front_matches_brute_force(seed):
+    rng = random.Random(seed)
+    # 狭い範囲から選び、総費用・観光地数・移動時間のどれかが同じ組を多く作る
+    offers = [(rng.randrange(10) * 1000, rng.randrange(1, 5), rng.randrange(8) * 10) for _ in range(300)]
+    front = ParetoFront()
+    for cost, spots, travel_time in offers:
+        before = _triples(front)
+        accepted = front.offer(cost, spots, travel_time, 0.0, [[spots]], [0])
+        after = _triples(front)
+        assert after == _brute_force_front(before + [(cost, spots, travel_time)])
+        # 受け入れるのは、まだない組で、その時点のどのプランにも支配されないものだけ
+        assert accepted == ((cost, spots, travel_time) in after and (cost, spots, travel_time) not in before)
+    assert _triples(front) == _brute_force_front(offers)
+    # 観光地数の多い順、同じなら総費用の安い順（移動時間は長い順）
+    plans = front.plans()
+    assert [(-plan.spots, plan.cost) for plan in plans] == sorted((-plan.spots, plan.cost) for plan in plans)
+
+
+def test_staircase_ties():
+    front = ParetoFront()
+    assert front.offer(5000, 3, 60, 1.0, [[1]], [0])
+    # 3つとも同じプランは1件として扱う
+    assert not front.offer(5000, 3, 60, 2.0, [[2]], [0])
+    # 総費用が同じで移動時間が長い / 移動時間が同じで総費用が高いプランは支配される
+    assert not front.offer(5000, 3, 70, 1.0, [[3]], [0])
+    assert not front.offer(6000, 3, 60, 1.0, [[4]], [0])
+    # 総費用が同じで移動時間が短いプランは、元のプランを置き換える
+    assert front.offer(5000, 3, 50, 1.0, [[5]], [0])
+    assert _triples(front) == [(5000, 3, 50)]
+    # 総費用・移動時間の兼ね合いが違うプランは並ぶ
+    assert front.offer(4000, 3, 80, 1.0, [[6]], [0])
+    assert front.offer(7000, 3, 30, 1.0, [[7]], [0])
+    assert [plan.cost for plan in front.plans()] == [4000, 5000, 7000]
+    # 観光地数が多く、総費用と移動時間が同じプランは、観光地数の少ない階段のプランを取り除く
+    assert front.offer(5000, 4, 50, 1.0, [[8]], [0])
+    assert _triples(front) == [(4000, 3, 80), (5000, 4, 50), (7000, 3, 30)]
+    # 観光地数が少ないプランは、総費用と移動時間が同じでも支配される
+    assert not front.offer(5000, 2, 50, 1.0, [[9]], [0])
+
+
+def test_pareto_option_round_trip(installed_city):
+    result = json.loads(plan_itenerary(
+        "synthetic", 60000, 2, 2, "2025-03-10T09:00:00", seed=3, max_iterations=2000, pareto=5))
+    pareto = result["pareto"]
+    assert len(pareto) == 5
+    assert [plan["total_cost"] for plan in pareto] == sorted(plan["total_cost"] for plan in pareto)
+    for plan in pareto:
+        assert plan["route"][-1]["destination_id"] == 0
+        assert plan["total_cost"] == sum(stop["total_cost"] for stop in plan["route"]) <= 60000
+    # 返したどのプランも、他の返したプランに支配されない
+    triples = [(plan["total_cost"], plan["spots"], plan["travel_minutes"]) for plan in pareto]
+    for a in triples:
+        assert not any(b != a and b[0] <= a[0] and b[1] >= a[1] and b[2] <= a[2] for b in triples)
+    # 返す数は MAX_PARETO_PLANS まで
+    capped = json.loads(plan_itenerary(
+        "synthetic", 60000, 2, 2, "2025-03-10T09:00:00", seed=3, max_iterations=2000, pareto=MAX_PARETO_PLANS + 10))
+    assert len(capped["pareto"]) <= MAX_PARETO_PLANS
@@ -0,0 +1,94 @@
+import json
+import logging
+import random
+import time
+
+import pytest
+
+from optimization import travel_planner_for_backend as planner
+from optimization.itinerary import build_plan_params, format_itinerary
+from optimization.plan_archive import MAX_ALTERNATIVES
+from optimization.search_control import SearchLimits
+from optimization.travel_planner_for_backend import evaluate_plan, plan_itenerary, request_seed, search_plan
+
+START = "2025-03-10T09:00:00"
+
+
+@pytest.mark.parametrize("optimizer", ["restart", "annealing", "beam"])
+def test_search_score_matches_json_evaluation(small_city, optimizer):
+    params = build_plan_params(60000, 2, 2, START)
+    limits = SearchLimits(time_limit=30, max_iterations=5000, stagnation_time=None)
+    stops, score, _ = search_plan(small_city.matrices, params, optimizer, limits, random.Random(5))
+    assert stops
+    # 探索中にメモリ上の停留所数と総費用から求めた評価値が、出力の JSON から従来どおり求めた評価値と一致する
+    output = json.dumps(format_itinerary(small_city, stops, START), ensure_ascii=False)
+    assert evaluate_plan(output, params.budget, params.days) == pytest.approx(score)
+
+
+def _plan(optimizer: str, seed=None, max_iterations=4000):
+    result = json.loads(plan_itenerary(
+        "synthetic", 60000, 2, 2, START, optimizer=optimizer, seed=seed, max_iterations=max_iterations,
+        exact_threshold=0))
+    # 経過時間だけは実行ごとに変わる
+    for key in ("elapsed_ms", "best_found_ms"):
+        result["search"].pop(key)
+    return result
+
+
+@pytest.mark.parametrize("optimizer", ["restart", "annealing"])
+def test_same_seed_and_iteration_limit_reproduce_plan(installed_city, optimizer):
+    first = _plan(optimizer, seed=11)
+    assert first["route"] and first["search"]["seed"] == 11
+    assert _plan(optimizer, seed=11) == first
+    # シードを省略するとリクエスト内容のハッシュを使うため、同じリクエストは同じプランになる
+    hashed = _plan(optimizer)
+    assert hashed["search"]["seed"] == request_seed("synthetic", 60000, 2, 2, START)
+    assert _plan(optimizer) == hashed
+
+
+def test_request_seed_ignores_seconds():
+    assert request_seed("kobe", 50000, 2, 2, "2025-03-10T09:00:00") == \
+        request_seed("kobe", 50000, 2, 2, "2025-03-10T09:00:59")
+    assert request_seed("kobe", 50000, 2, 2, START) != request_seed("kobe", 50001, 2, 2, START)
+
+
+def test_alternatives_are_capped(installed_city, monkeypatch):
+    capacities = []
+    elite_pool = planner.ElitePool
+
+    def recording_pool(capacity, *args, **kwargs):
+        capacities.append(capacity)
+        return elite_pool(capacity, *args, **kwargs)
+
+    monkeypatch.setattr(planner, "ElitePool", recording_pool)
+    result = json.loads(plan_itenerary(
+        "synthetic", 60000, 2, 2, START, seed=1, max_iterations=3000, alternatives=10 ** 9))
+    # 別案の数を大きく指定しても、候補の保持数と返す案の数は MAX_ALTERNATIVES で頭打ちになる
+    assert capacities == [planner.elite_pool_size(MAX_ALTERNATIVES + 1)]
+    assert len(result["alternatives"]) <= MAX_ALTERNATIVES
+
+
+def test_aborted_exact_search_shares_time_limit(installed_city, monkeypatch):
+    def aborted(evaluator, candidates, controller):
+        # 最適性を示せないまま締め切りまで探索したことにする
+        while not controller.should_stop():
+            time.sleep(0.01)
+        return None
+
+    monkeypatch.setattr(planner, "solve_day_trip", aborted)
+    start = time.perf_counter()
+    result = json.loads(plan_itenerary(
+        "synthetic", 30000, 1, 1, START, optimizer="restart", time_limit=0.4, stagnation_time=None,
+        exact_threshold=100))
+    elapsed = time.perf_counter() - start
+    # 厳密解を試した時間とヒューリスティックの探索を合わせて time_limit で締め切る
+    assert elapsed < 0.4 + 0.2
+    assert result["route"]
+    assert result["search"]["stop_reason"] != "optimal"
+    assert 400 <= result["search"]["elapsed_ms"] <= elapsed * 1000
+
+
+def test_evaluate_plan_logs_broken_json(caplog):
+    with caplog.at_level(logging.WARNING, logger="optimization.travel_planner_for_backend"):
+        assert evaluate_plan("{", 60000, 2) == -9999.0
+    assert "Error parsing itinerary JSON" in caplog.text
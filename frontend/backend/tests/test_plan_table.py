@@ -0,0 +1,91 @@
+import gzip
+import json
+
+from optimization import plan_table
+from optimization.benchmark import synthetic_city_data
+from optimization.city_store import build_city_graph
+from optimization.opening_hours import MINUTES_PER_DAY
+from optimization.plan_table import (
+    PLAN_TABLE_VERSION, TABLE_BUDGETS, _encode_plan, city_fingerprint, lookup_plan, pattern_key, precompute_plan,
+    read_plan_table, table_key, weekday_patterns,
+)
+from optimization.search_control import STOP_PRECOMPUTED
+
+from conftest import SYNTHETIC_CITY
+
+
+def test_weekday_patterns_group_same_opening_hours(small_city):
+    # 営業時間の情報がなければ、全曜日が日曜にまとまる
+    assert weekday_patterns(small_city.matrices, 2, 9) == [0] * 7
+
+    destinations, records, osaka_records = synthetic_city_data(20, 4, neighbors=19)
+    for destination in destinations[:5]:
+        if not destination["ishotel"]:
+            # 月曜～土曜の 9:00～17:00 だけ営業（日曜定休）
+            destination["opening_hours"] = [[day * MINUTES_PER_DAY + 540, day * MINUTES_PER_DAY + 1020]
+                                             for day in range(1, 7)]
+    matrices = build_city_graph(SYNTHETIC_CITY, destinations, records, osaka_records).matrices
+    # 日帰りなら日曜だけが違う。1泊2日なら、2日目が日曜になる土曜出発も違う
+    assert weekday_patterns(matrices, 1, 9) == [0, 1, 1, 1, 1, 1, 1]
+    assert weekday_patterns(matrices, 2, 9) == [0, 1, 1, 1, 1, 1, 6]
+
+
+def test_lookup_uses_the_weekday_pattern(installed_city, tmp_path, monkeypatch):
+    budget = TABLE_BUDGETS[15]
+    stops, score = precompute_plan(SYNTHETIC_CITY, 1, budget, 2, 2, 9, time_limit=0.3)
+    table = {
+        "version": PLAN_TABLE_VERSION,
+        "cities": {SYNTHETIC_CITY: city_fingerprint(installed_city.ids, installed_city.matrices)},
+        # 日曜だけ別の条件で、日曜のプランは表にない
+        "weekdays": {pattern_key(SYNTHETIC_CITY, 2, 9): [0, 1, 1, 1, 1, 1, 1]},
+        "plans": {table_key(SYNTHETIC_CITY, 1, 2, 2, budget, 9): _encode_plan(installed_city, stops, score)},
+    }
+    path = tmp_path / "plan_table.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(table, f)
+    monkeypatch.setattr(plan_table, "_plan_table", read_plan_table(str(path)))
+
+    # 2025-03-12 は水曜、2025-03-09 は日曜
+    result = lookup_plan(SYNTHETIC_CITY, budget, 2, 2, "2025-03-12T09:00:00")
+    assert result is not None
+    result = json.loads(result)
+    assert result["search"]["stop_reason"] == STOP_PRECOMPUTED
+    assert result["route"][0]["departure_time"] == "2025-03-12T09:00:00"
+    assert lookup_plan(SYNTHETIC_CITY, budget, 2, 2, "2025-03-09T09:00:00") is None
+    # 格子外（分が 0 でない）は探索で処理する
+    assert lookup_plan(SYNTHETIC_CITY, budget, 2, 2, "2025-03-12T09:30:00") is None
+
+
+def test_lookup_checks_each_plan_once(installed_city, tmp_path, monkeypatch):
+    budget = TABLE_BUDGETS[15]
+    stops, score = precompute_plan(SYNTHETIC_CITY, 3, budget, 2, 2, 9, time_limit=0.3)
+    table = {
+        "version": PLAN_TABLE_VERSION,
+        "cities": {SYNTHETIC_CITY: city_fingerprint(installed_city.ids, installed_city.matrices)},
+        "weekdays": {pattern_key(SYNTHETIC_CITY, 2, 9): [0] * 7},
+        "plans": {table_key(SYNTHETIC_CITY, 0, 2, 2, budget, 9): _encode_plan(installed_city, stops, score)},
+    }
+    path = tmp_path / "plan_table.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(table, f)
+    monkeypatch.setattr(plan_table, "_plan_table", read_plan_table(str(path)))
+    evaluators = []
+    day_evaluator = plan_table.DayEvaluator
+
+    def counting_evaluator(*args):
+        evaluators.append(args)
+        return day_evaluator(*args)
+
+    monkeypatch.setattr(plan_table, "DayEvaluator", counting_evaluator)
+    # 2025-03-12 と 2025-03-19 はどちらも水曜。同じ予算の区切りなら予算が違っても同じ表のプラン
+    first = json.loads(lookup_plan(SYNTHETIC_CITY, budget, 2, 2, "2025-03-12T09:00:00"))
+    second = json.loads(lookup_plan(SYNTHETIC_CITY, budget + 1000, 2, 2, "2025-03-19T09:00:00"))
+    # 確かめ直すのは最初のリクエストだけで、2回目は出力の形に直すだけ
+    assert len(evaluators) == 1
+    assert first["route"][0]["departure_time"] == "2025-03-12T09:00:00"
+    assert second["route"][0]["departure_time"] == "2025-03-19T09:00:00"
+    assert [stop["destination_id"] for stop in first["route"]] == [stop["destination_id"] for stop in second["route"]]
+    assert first["search"]["score"] > second["search"]["score"]
+    # 別の曜日は改めて確かめる
+    assert lookup_plan(SYNTHETIC_CITY, budget, 2, 2, "2025-03-13T09:00:00") is not None
+    assert len(evaluators) == 2
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from optimization.replanning import replan_itenerary
+from optimization.travel_planner_for_backend import plan_itenerary
+
+from conftest import SYNTHETIC_CITY
+
+START = "2025-03-10T09:00:00"
+
+
+def _plan(days: int, budget: int):
+    route = json.loads(plan_itenerary(
+        SYNTHETIC_CITY, budget, days, 2, START, seed=3, max_iterations=3000, exact_threshold=0))["route"]
+    assert route
+    return route
+
+
+def _day(route, day: int):
+    return [stop for stop in route if stop["day"] == day]
+
+
+def _charge(graph, route, people: int):
+    # 観光地の total_cost は人数分、ホテルは1人分（予算からは人数分を差し引く）、大阪駅への帰りは1回分
+    is_hotel = graph.matrices.is_hotel
+    return sum(stop["total_cost"] * (people if is_hotel[graph.index_of[stop["destination_id"]]] else 1)
+               for stop in route)
+
+
+def test_locked_days_are_returned_unchanged(installed_city):
+    route = _plan(3, 150000)
+    replanned = json.loads(replan_itenerary(
+        SYNTHETIC_CITY, 150000, 3, 2, START, route, locked_days=[0, 2], seed=5, max_iterations=3000))
+    assert replanned["search"]["locked_days"] == [0, 2]
+    for day in (0, 2):
+        assert _day(replanned["route"], day) == _day(route, day)
+    assert _charge(installed_city, replanned["route"], 2) <= 150000
+
+
+def test_locked_days_over_budget_are_rejected(installed_city):
+    route = _plan(2, 60000)
+    # 固定する1日目の費用より少ない予算では作り直せない
+    budget = _charge(installed_city, _day(route, 0), 2) - 1
+    with pytest.raises(ValueError):
+        replan_itenerary(SYNTHETIC_CITY, budget, 2, 2, START, route, locked_days=[0], max_iterations=1000)
+
+
+def test_locked_stops_over_budget_are_rejected(installed_city):
+    route = _plan(2, 60000)
+    stops = [stop["destination_id"] for stop in route if stop["destination_id"] != 0]
+    # 固定した停留所を全部残すと、半分の予算には収まらない
+    with pytest.raises(ValueError):
+        replan_itenerary(SYNTHETIC_CITY, _charge(installed_city, route, 2) // 2, 2, 2, START, route, locked_stops=stops,
+                         max_iterations=1000)
@@ -0,0 +1,114 @@
+import random
+import time
+
+import pytest
+
+from optimization import travel_planner_for_backend as planner
+from optimization.itinerary import build_plan_params, score_plan
+from optimization.search_control import STOP_DEADLINE, STOP_INFEASIBLE, SearchLimits
+
+START = "2025-03-10T09:00:00"
+
+
+def _failing_every(period: int, monkeypatch):
+    """
+    construct_itinerary を、period 回に1回だけ大阪駅に戻れないプラン（最終日が空）を返すものに差し替える。
+    period が 1 なら毎回失敗する。
+    """
+    construct = planner.construct_itinerary
+    calls = {"count": 0}
+
+    def flaky(matrices, params, *args, **kwargs):
+        calls["count"] += 1
+        itinerary, num_stops, total_cost = construct(matrices, params, *args, **kwargs)
+        if calls["count"] % period == 0:
+            return itinerary[:-1] + [[]], num_stops, total_cost
+        return itinerary, num_stops, total_cost
+
+    monkeypatch.setattr(planner, "construct_itinerary", flaky)
+    return calls
+
+
+@pytest.mark.parametrize("optimizer", ["restart", "annealing"])
+def test_failed_restart_keeps_incumbent(small_city, monkeypatch, optimizer):
+    calls = _failing_every(2, monkeypatch)
+    params = build_plan_params(60000, 2, 2, START)
+    limits = SearchLimits(time_limit=30, max_iterations=20000, stagnation_time=None)
+    stops, score, report = planner.search_plan(small_city.matrices, params, optimizer, limits, random.Random(1))
+    # 失敗した再スタートの後も探索を続け、それまでの最良プランを返す
+    assert calls["count"] > 2
+    assert len(stops) == 2 and stops[-1][-1].destination_id == 0
+    assert score > -1000000
+    assert score == pytest.approx(score_plan(
+        sum(len(day_plan) for day_plan in stops), sum(stop.total_cost for day_plan in stops for stop in day_plan),
+        params.budget))
+
+
+@pytest.mark.parametrize("optimizer", ["restart", "annealing"])
+def test_infeasible_only_without_incumbent(small_city, monkeypatch, optimizer):
+    params = build_plan_params(60000, 2, 2, START)
+    limits = SearchLimits(time_limit=30, max_iterations=20000, stagnation_time=None)
+    _, score, report = planner.search_plan(small_city.matrices, params, optimizer, limits, random.Random(1))
+    assert score > -1000000 and report["stop_reason"] != STOP_INFEASIBLE
+
+    _failing_every(1, monkeypatch)
+    stops, score, report = planner.search_plan(small_city.matrices, params, optimizer, limits, random.Random(1))
+    # 反復数の上限で止まっていても、プランが1つもなければ infeasible
+    assert stops == [] and score == -1000000
+    assert report["stop_reason"] == STOP_INFEASIBLE
+
+
+@pytest.mark.parametrize("optimizer", ["restart", "annealing"])
+def test_deadline_still_builds_one_plan(small_city, optimizer):
+    params = build_plan_params(60000, 2, 2, START)
+    stops, _, report = planner.search_plan(
+        small_city.matrices, params, optimizer, SearchLimits(time_limit=0.0, stagnation_time=None), random.Random(1))
+    # 締め切りを過ぎていても、貪欲法の1回目は構築する
+    assert len(stops) == 2 and stops[-1][-1].destination_id == 0
+    assert report["stop_reason"] == STOP_DEADLINE
+    assert report["iterations"] == planner.RESTART_WEIGHT
+
+
+def test_beam_deadline_without_plan_is_infeasible(small_city):
+    params = build_plan_params(60000, 2, 2, START)
+    stops, _, report = planner.search_plan(
+        small_city.matrices, params, "beam", SearchLimits(time_limit=0.0, stagnation_time=None), random.Random(1))
+    assert stops == []
+    assert report["stop_reason"] == STOP_INFEASIBLE
+
+
+def test_annealing_restarts_until_a_plan_exists(small_city, monkeypatch):
+    construct = planner.construct_itinerary
+    calls = {"count": 0}
+
+    def late(matrices, params, *args, **kwargs):
+        calls["count"] += 1
+        itinerary, num_stops, total_cost = construct(matrices, params, *args, **kwargs)
+        if calls["count"] <= 30:
+            return itinerary[:-1] + [[]], num_stops, total_cost
+        return itinerary, num_stops, total_cost
+
+    monkeypatch.setattr(planner, "construct_itinerary", late)
+    params = build_plan_params(60000, 2, 2, START)
+    # 再スタートに使う 1 割（2000 反復）では 13 回しか構築できず、その間は1つもプランができない
+    limits = SearchLimits(time_limit=30, max_iterations=20000, stagnation_time=None)
+    stops, _, report = planner.search_plan(small_city.matrices, params, "annealing", limits, random.Random(1))
+    assert calls["count"] == 31
+    assert len(stops) == 2 and report["stop_reason"] != STOP_INFEASIBLE
+
+
+def test_setup_does_not_use_restart_share(small_city, monkeypatch):
+    bounds = planner.FinishBounds
+
+    def slow_bounds(matrices, params):
+        # 大きな都市で下界の計算にかかる時間の代わり
+        time.sleep(0.3)
+        return bounds(matrices, params)
+
+    monkeypatch.setattr(planner, "FinishBounds", slow_bounds)
+    calls = _failing_every(1000000, monkeypatch)
+    params = build_plan_params(60000, 2, 2, START)
+    limits = SearchLimits(time_limit=0.5, stagnation_time=None)
+    stops, _, _ = planner.search_plan(small_city.matrices, params, "annealing", limits, random.Random(1))
+    # 準備の時間は持ち時間に数えないため、再スタートに使う 1 割（50 ミリ秒）で複数回構築できる
+    assert stops and calls["count"] > 2
@@ -0,0 +1,40 @@
+import numpy as np
+
+from optimization.benchmark import synthetic_city_data
+from optimization.travel_estimate import fit_travel_estimator, great_circle_km, node_locations
+
+
+def _synthetic_legs(size: int, seed: int):
+    """
+    合成都市の移動データの (大円距離 km, 移動時間, 運賃, 交通手段のコード) と、手段の数。
+    """
+    destinations, records, _ = synthetic_city_data(size, seed, neighbors=30)
+    ids = (0,) + tuple(dest["id"] for dest in destinations)
+    index_of = {dest_id: index for index, dest_id in enumerate(ids)}
+    locations = node_locations(ids, {dest["id"]: dest for dest in destinations})
+    codes = {}
+    rows = np.array([index_of[record["start_destination_id"]] for record in records])
+    ends = np.array([index_of[record["end_destination_id"]] for record in records])
+    time = np.array([record["transportation_time"] for record in records])
+    fare = np.array([record["transportation_fare"] for record in records])
+    mode = np.array([codes.setdefault(record["transportation_method"], len(codes)) for record in records])
+    return great_circle_km(locations[rows], locations[ends]), time, fare, mode, len(codes)
+
+
+def test_estimates_hold_out_records():
+    distance, time, fare, mode, method_count = _synthetic_legs(300, seed=11)
+    # 8 割のレコードで当てはめ、残りの 2 割の見積もりの誤差を見る
+    order = np.random.default_rng(0).permutation(len(distance))
+    train, test = order[:len(order) * 4 // 5], order[len(order) * 4 // 5:]
+    estimator = fit_travel_estimator(distance[train], time[train], fare[train], mode[train], method_count)
+    estimated_time, estimated_fare, estimated_mode = estimator.estimate(distance[test])
+    # 合成都市の移動時間と運賃は距離に 1.1～1.6 倍のばらつきを掛けて作るため、誤差の中央値は1割以内に収まる
+    assert np.median(np.abs(estimated_time - time[test])) <= 0.1 * np.median(time[test])
+    assert np.median(np.abs(estimated_fare - fare[test])) <= 0.1 * np.median(fare[test])
+    # 徒歩と電車の境目付近の移動を除き、交通手段は当たる
+    assert np.mean(estimated_mode == mode[test]) >= 0.9
+
+
+def test_no_records_give_no_estimator():
+    empty = np.zeros(0)
+    assert fit_travel_estimator(empty, empty, empty, empty.astype(int), 2) is None
@@ -0,0 +1,74 @@
+import random
+
+import numpy as np
+import pytest
+
+from optimization.benchmark import synthetic_city_data
+from optimization.city_store import build_city_graph, extract_osaka_records
+from optimization.itinerary import DayEvaluator, Stop, build_plan_params
+from optimization.search_control import SearchLimits
+from optimization.travel_matrix import SPARSE_HOTEL_ORDER, build_sparse_travel_matrices
+from optimization.travel_planner_for_backend import search_plan
+
+from conftest import SYNTHETIC_CITY
+
+START = "2025-03-10T09:00:00"
+
+
+def _plan_key(stops):
+    return [[tuple(getattr(stop, name) for name in Stop.__slots__) for stop in day_plan] for day_plan in stops]
+
+
+@pytest.fixture(scope="module", params=[40, 150])
+def both_matrices(request):
+    """
+    全ノード間に移動データのある合成都市の、密行列を持つ TravelMatrices と、同じデータから上限なしで作った CSR だけのもの。
+    150 ノードの都市はホテルが SPARSE_HOTEL_ORDER より多い。
+    """
+    destinations, records, osaka_records = synthetic_city_data(request.param, seed=5, neighbors=request.param - 1)
+    graph = build_city_graph(SYNTHETIC_CITY, destinations, records, osaka_records)
+    sparse = build_sparse_travel_matrices(
+        graph.ids, graph.dest_by_id, records, extract_osaka_records(osaka_records), max_travel_time=None)
+    return graph.matrices, sparse
+
+
+def test_sparse_matrices_match_dense(both_matrices):
+    dense, sparse = both_matrices
+    assert dense.dense and not sparse.dense
+    for name in ("edge_start", "edge_end", "edge_time", "edge_fare", "candidates", "return_fare", "hotel_charge"):
+        assert np.array_equal(getattr(dense, name), getattr(sparse, name)), name
+    # ノード数 × ホテル数の表は持たず、行は CSR から作る
+    assert sparse.hotel_time.shape == sparse.hotel_fare.shape == (0, len(sparse.hotel_indices))
+    for nodes in (np.arange(dense.size), 0, int(dense.spot_indices[-1])):
+        for dense_rows, sparse_rows in zip(dense.hotel_reach(nodes), sparse.hotel_reach(nodes)):
+            assert np.array_equal(dense_rows, sparse_rows)
+    # hotel_order は近い SPARSE_HOTEL_ORDER 件まで
+    width = min(len(dense.hotel_indices), SPARSE_HOTEL_ORDER)
+    assert sparse.hotel_order.shape == (dense.size, width)
+    assert np.array_equal(dense.hotel_order_time[:, :width], sparse.hotel_order_time)
+    assert np.array_equal(dense.hotel_order[:, :width], sparse.hotel_order)
+
+
+@pytest.mark.parametrize("optimizer", ["restart", "annealing", "beam"])
+def test_sparse_matrices_give_same_plans(both_matrices, optimizer):
+    dense, sparse = both_matrices
+    params = build_plan_params(90000, 3, 2, START)
+    limits = SearchLimits(time_limit=60, max_iterations=2000, stagnation_time=None)
+    plans = []
+    for matrices in (dense, sparse):
+        stops, score, _ = search_plan(matrices, params, optimizer, limits, random.Random(3))
+        plans.append((_plan_key(stops), score))
+    assert plans[0][0]
+    assert plans[0] == plans[1]
+
+
+def test_search_rows_are_built_once(both_matrices):
+    dense, sparse = both_matrices
+    for matrices in (dense, sparse):
+        first = DayEvaluator(matrices, build_plan_params(60000, 2, 2, START))
+        second = DayEvaluator(matrices, build_plan_params(90000, 3, 1, START))
+        # 行は都市ごとに一度だけ作り、リクエストごとの DayEvaluator で共有する
+        assert first.time is second.time and first.fare is second.fare
+        assert first.visit_fare is second.visit_fare and first.staytime is second.staytime
+        node = int(matrices.spot_indices[0])
+        assert first.time[0][node] == int(matrices.travel(0, node)[0])